@@ -7,6 +7,9 @@ Simple usage example:
             import rson
             obj = rson.loads(source)
 
+        or, to read a file without holding all of it in memory:
+            obj = rson.load(open(filename, 'rb'))
+
 Additional documentation available at:
 
 http://code.google.com/p/rson/
@@ -41,4 +44,6 @@ Copyright (c) 2010-2012, Patrick Maupin.  All rights reserved.
  OTHER DEALINGS IN THE SOFTWARE.
  '''
 
-from rson.base import RSONDecodeError, loads
+from rson.base import (RSONDecodeError, loads, load, load_path, iterparse, iter_items,
+                       loads_lazy, parse_document, loads_many, load_files,
+                       loads_parallel, push_parser, aload)
@@ -13,8 +13,31 @@ from rson.base.equals import EqualToken
 from rson.base.dispatcher import Dispatcher
 from rson.base.baseobjects import BaseObjects
 from rson.base.parser import RsonParser
+from rson.base.events import EventParser
+from rson.base.select import Selector
+from rson.base.proxies import ProxyLoader, LazyObject, LazyArray
+from rson.base.cache import ParseCache
+from rson.base.incremental import IncrementalParser, Document
+from rson.base.bulk import BulkLoader
+from rson.base.parallel import ParallelParser
+from rson.base.push import PushLoader, PushParser
+from rson.base.schema import SchemaValidator
+from rson.base.numeric import NumericArrays
 
-class RsonSystem(RsonParser, UnquotedToken, QuotedToken, EqualToken, Dispatcher, BaseObjects):
+class RsonSystem(RsonParser, EventParser, Selector, ProxyLoader, IncrementalParser, ParallelParser,
+                 PushLoader, UnquotedToken, QuotedToken, EqualToken, Dispatcher, BulkLoader,
+                 SchemaValidator, NumericArrays, BaseObjects):
     Tokenizer = Tokenizer
 
 loads = RsonSystem.dispatcher_factory()
+load = loads.load
+load_path = loads.load_path
+iterparse = loads.iterparse
+iter_items = loads.iter_items
+loads_lazy = loads.loads_lazy
+parse_document = loads.parse_document
+loads_many = loads.loads_many
+load_files = loads.load_files
+loads_parallel = loads.loads_parallel
+push_parser = loads.push_parser
+aload = loads.aload
@@ -0,0 +1,32 @@
+'''
+asyncio support for RSON.
+
+Copyright (c) 2010, Patrick Maupin.  All rights reserved.
+
+See http://code.google.com/p/rson/source/browse/trunk/license.txt
+'''
+
+import asyncio
+
+
+def aload_factory(push_parser):
+    ''' Return the aload() coroutine function for a dispatcher's
+        push_parser().
+    '''
+
+    async def aload(reader, chunk_size=65536, **kw):
+        ''' Parse the data read from an asyncio.StreamReader (or
+            anything else with a read(n) coroutine) while it arrives.
+            Each step reads and parses at most chunk_size bytes, then
+            lets other tasks run, so the event loop is only held up
+            for more than that if a single top-level entry is larger.
+        '''
+        parser = push_parser(**kw)
+        while 1:
+            data = await reader.read(chunk_size)
+            if not data:
+                return parser.close()
+            parser.feed(data)
+            await asyncio.sleep(0)
+
+    return aload
@@ -7,15 +7,27 @@ See http://code.google.com/p/rson/source/browse/trunk/license.txt
 
 '''
 
+from rson.py23 import basestring, Mapping
+
 def make_hashable(what):
+    if isinstance(what, basestring):
+        return what
     try:
         hash(what)
         return what
     except TypeError:
         if isinstance(what, dict):
-            return tuple(sorted(make_hashable(x) for x in what.iteritems()))
+            return tuple(sorted(make_hashable(x) for x in what.items()))
         return tuple(make_hashable(x) for x in what)
 
+def freeze_list(value):
+    ''' Return a list as a tuple, with the lists in it (and in
+        those) turned into tuples too.
+    '''
+    if list in map(type, value):
+        return tuple([freeze_list(x) if type(x) is list else x for x in value])
+    return tuple(value)
+
 class BaseObjects(object):
 
     # These hooks allow compatibility with simplejson
@@ -36,17 +48,22 @@ class BaseObjects(object):
     # objects without subclassing
     create_raw_objects = False
 
+    # Setting this true builds acyclic_object dicts instead
+    # of default_object dicts, which refer to themselves
+    acyclic_objects = False
+
+    # Setting this true makes the result immutable, with
+    # frozen_object dicts and tuples instead of lists
+    frozen = False
 
     class default_array(list):
         def __new__(self, startlist, token):
             return list(startlist)
 
-    class default_object(dict):
-        ''' By default, RSON objects are dictionaries that
-            allow attribute access to their existing contents.
+    class dict_object(dict):
+        ''' The merging of entries shared by the RSON object types
         '''
-        def __init__(self):
-            self.__dict__ = self
+        __slots__ = ()
 
         def append(self, itemlist):
             mydict = self
@@ -72,6 +89,124 @@ class BaseObjects(object):
         def get_result(self, token):
             return self
 
+    class default_object(dict_object):
+        ''' By default, RSON objects are dictionaries that
+            allow attribute access to their existing contents.
+        '''
+        def __init__(self):
+            self.__dict__ = self
+
+        def __reduce__(self):
+            # Pickle as a dict, so __dict__ is self again when unpickled
+            return type(self), (), None, None, iter(self.items())
+
+    class acyclic_object(dict_object):
+        ''' Like default_object, but without a __dict__ that refers
+            back to the object, so it is freed by reference counting
+            rather than by the cyclic garbage collector.  Attribute
+            access looks up keys only when there is no dict attribute
+            of the same name, so obj.items is always the method.
+        '''
+        __slots__ = ()
+
+        def __getattr__(self, name):
+            try:
+                return self[name]
+            except KeyError:
+                raise AttributeError(name)
+
+        __setattr__ = dict.__setitem__
+
+        def __delattr__(self, name):
+            try:
+                del self[name]
+            except KeyError:
+                raise AttributeError(name)
+
+    class frozen_object(Mapping):
+        ''' An immutable dict, which allows attribute access to its
+            contents.  Its hash is computed the first time it is
+            needed, and equality checks compare the hashes first if
+            both are known.  Copying it just returns it.
+        '''
+        __slots__ = '_dict', '_hash'
+
+        def __init__(self, items=(), setattr=object.__setattr__):
+            setattr(self, '_dict', dict(items))
+            setattr(self, '_hash', None)
+
+        def __getitem__(self, key):
+            return self._dict[key]
+
+        def __getattr__(self, name):
+            if name.startswith('_'):
+                raise AttributeError(name)
+            try:
+                return self._dict[name]
+            except KeyError:
+                raise AttributeError(name)
+
+        def __setattr__(self, name, value):
+            if name not in self.__slots__ or hasattr(self, '_hash'):
+                raise AttributeError('frozen_object is immutable')
+            object.__setattr__(self, name, value)
+
+        def __iter__(self):
+            return iter(self._dict)
+
+        def __len__(self):
+            return len(self._dict)
+
+        def __contains__(self, key):
+            return key in self._dict
+
+        def get(self, key, default=None):
+            return self._dict.get(key, default)
+
+        def keys(self):
+            return self._dict.keys()
+
+        def values(self):
+            return self._dict.values()
+
+        def items(self):
+            return self._dict.items()
+
+        def __hash__(self):
+            result = self._hash
+            if result is None:
+                result = hash(frozenset(self._dict.items()))
+                object.__setattr__(self, '_hash', result)
+            return result
+
+        def __eq__(self, other):
+            if self is other:
+                return True
+            if isinstance(other, BaseObjects.frozen_object):
+                if (self._hash is not None and other._hash is not None
+                        and self._hash != other._hash):
+                    return False
+                other = other._dict
+            elif not isinstance(other, dict):
+                return NotImplemented
+            return self._dict == other
+
+        def __ne__(self, other):
+            result = self.__eq__(other)
+            return result if result is NotImplemented else not result
+
+        def __repr__(self):
+            return '%s(%r)' % (type(self).__name__, self._dict)
+
+        def __reduce__(self):
+            return type(self), (self._dict,)
+
+        def __copy__(self):
+            return self
+
+        def __deepcopy__(self, memo):
+            return self
+
     class raw_object(list):
         ''' This can be used as the default_object for
             compatibility with rsonlite.
@@ -89,6 +224,57 @@ class BaseObjects(object):
             self.token = token
             return self
 
+    class frozen_builder(dict):
+        ''' Collects the entries of a frozen_object, merging them
+            like dict_object does.  An array is complete by the time
+            it is added to a dict, so it is turned into a tuple then,
+            and the keys need no make_hashable().  Dicts made for
+            chained keys are frozen by get_result().
+        '''
+        __slots__ = ()
+
+        def append(self, itemlist, type=type, list=list, len=len):
+            frozen_object = self.frozen_object
+            value = itemlist.pop()
+            if type(value) is list:
+                value = freeze_list(value)
+            if len(itemlist) == 1:
+                key = itemlist[0]
+                if type(key) is not list and (type(value) is not frozen_object or key not in self):
+                    self[key] = value
+                    return
+            builder = type(self)
+            mydict = self
+            if list in map(type, itemlist):
+                itemlist = [freeze_list(x) if type(x) is list else x for x in itemlist]
+            lastkey = itemlist.pop()
+            for key in itemlist:
+                subdict = mydict.get(key)
+                if type(subdict) is not builder:
+                    subdict = mydict[key] = builder(
+                        subdict._dict if type(subdict) is frozen_object else ())
+                mydict = subdict
+            if type(value) is frozen_object:
+                oldvalue = mydict.get(lastkey)
+                if type(oldvalue) is builder:
+                    oldvalue.update(value._dict)
+                    return
+                if type(oldvalue) is frozen_object:
+                    merged = dict(oldvalue._dict)
+                    merged.update(value._dict)
+                    value = frozen_object(merged)
+            mydict[lastkey] = value
+
+        def get_result(self, token):
+            builder = type(self)
+            if builder in map(type, self.values()):
+                for key, value in list(self.items()):
+                    if type(value) is builder:
+                        self[key] = value.get_result(token)
+            return self.frozen_object(self)
+
+    frozen_builder.frozen_object = frozen_object
+
     def object_type_factory(self, dict=dict, tuple=tuple):
         ''' This function returns constructors for RSON objects and arrays.
             It handles simplejson compatible hooks as well.
@@ -107,10 +293,31 @@ class BaseObjects(object):
                 def get_result(self, token):
                     return object_hook(mydict(self))
             self.disallow_multiple_object_keys = True
+        elif self.frozen:
+            if self.create_raw_objects:
+                raise ValueError('frozen cannot be used with create_raw_objects')
+            build_object = self.frozen_builder
         else:
-            build_object = (self.raw_object
-                                if self.create_raw_objects
-                                else self.default_object)
+            build_object = (self.raw_object if self.create_raw_objects else
+                            self.acyclic_object if self.acyclic_objects else
+                            self.default_object)
 
         build_array = self.array_hook or self.default_array
         return build_object, build_array
+
+    def freeze_factory(self, post_parse):
+        ''' Return a post_parse function for frozen mode.  The dicts
+            are built as frozen_objects, and the lists in them turned
+            into tuples, as the parse goes, so this only has to turn a
+            top-level list into a tuple.
+        '''
+        if self.object_hook is not None or self.object_pairs_hook is not None:
+            raise ValueError('frozen cannot be used with object_hook or object_pairs_hook')
+
+        def frozen_post_parse(tokens, value):
+            value = post_parse(tokens, value)
+            if type(value) is list:
+                return freeze_list(value)
+            return value
+
+        return frozen_post_parse
@@ -0,0 +1,154 @@
+'''
+Loading many documents with a pool of worker processes.
+
+Copyright (c) 2010, Patrick Maupin.  All rights reserved.
+
+See http://code.google.com/p/rson/source/browse/trunk/license.txt
+'''
+
+import os
+import pickle
+import multiprocessing
+
+try:
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+except ImportError:
+    ProcessPoolExecutor = None
+
+# The parsers each worker process has built, keyed by class and options
+parsers = {}
+
+def getloads(system, options):
+    key = system, repr(sorted(options.items()))
+    loads = parsers.get(key)
+    if loads is None:
+        loads = parsers[key] = system.dispatcher_factory(**options)
+    return loads
+
+def parse_chunk(system, options, chunk, readfiles):
+    ''' Parse a list of (index, source) pairs, reading the sources
+        from files if readfiles is true.  Return a list of (index,
+        value, error) tuples.
+    '''
+    loads = getloads(system, options)
+    results = []
+    for index, source in chunk:
+        try:
+            if readfiles:
+                f = open(source, 'rb')
+                try:
+                    source = f.read()
+                finally:
+                    f.close()
+            results.append((index, loads(source), None))
+        except Exception as err:
+            results.append((index, None, err))
+    return results
+
+def parse_pickled(system, options, chunk, readfiles):
+    ''' Run parse_chunk() in a worker process.  Each value and
+        error is pickled here, and unpickled by bulk_load(), so one
+        that can't be passed back is reported as the error for its
+        source, instead of breaking the pool.
+    '''
+    results = []
+    for index, value, err in parse_chunk(system, options, chunk, readfiles):
+        try:
+            data = pickle.dumps((value, err), pickle.HIGHEST_PROTOCOL)
+        except Exception as exc:
+            data = pickle.dumps((None, exc), pickle.HIGHEST_PROTOCOL)
+        results.append((index, data))
+    return results
+
+def make_chunks(sources, sizes, workers, chunksize):
+    ''' Split the sources into lists of (index, source) pairs.
+        Without a chunksize, the chunks are made about the same
+        total size, small enough that each worker gets several.
+    '''
+    chunks, chunk, total = [], [], 0
+    target = sum(sizes) // (workers * 8) + 1
+    for index, source in enumerate(sources):
+        chunk.append((index, source))
+        total += sizes[index]
+        if len(chunk) == chunksize or (chunksize is None and total >= target):
+            chunks.append(chunk)
+            chunk, total = [], 0
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+def filesize(path):
+    try:
+        return os.path.getsize(path)
+    except EnvironmentError:
+        return 0
+
+def bulk_load(system, options, sources, readfiles, ordered, workers, chunksize):
+    ''' Yield (source number, value, error) for each source, where
+        error is the exception if it could not be read or parsed.
+    '''
+    sources = list(sources)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    sizes = [filesize(x) if readfiles else len(x) for x in sources]
+    chunks = make_chunks(sources, sizes, workers, chunksize)
+    if ProcessPoolExecutor is None or workers < 2 or len(chunks) < 2:
+        for chunk in chunks:
+            for result in parse_chunk(system, options, chunk, readfiles):
+                yield result
+        return
+
+    pool = ProcessPoolExecutor(workers)
+    futures = []
+    try:
+        futures = [pool.submit(parse_pickled, system, options, chunk, readfiles)
+                   for chunk in chunks]
+        for future in (futures if ordered else as_completed(futures)):
+            for index, data in future.result():
+                try:
+                    value, err = pickle.loads(data)
+                except Exception as exc:
+                    value, err = None, exc
+                yield index, value, err
+    finally:
+        for future in futures:
+            future.cancel()
+        pool.shutdown()
+
+
+class BulkLoader(object):
+    ''' Adds loads_many() and load_files() to the dispatcher.  The
+        worker processes build their own parser from the class and
+        options, so these must be importable and picklable.
+    '''
+
+    # Set by _alter_attributes() for customized classes
+    unaltered_class = None
+    altered_attributes = {}
+
+    @classmethod
+    def bulk_factory(cls, bulk_load=bulk_load):
+        system = cls.unaltered_class or cls
+        options = cls.altered_attributes
+
+        def loads_many(sources, ordered=True, workers=None, chunksize=None, **kw):
+            ''' Parse each string in sources in a pool of worker
+                processes, and yield (index, value, error) for each
+                one, where error is the exception if it could not be
+                parsed.  Results are yielded in order, or as soon as
+                they are ready if ordered is false.
+            '''
+            return bulk_load(system, dict(options, **kw), sources, False,
+                             ordered, workers, chunksize)
+
+        def load_files(paths, ordered=True, workers=None, chunksize=None, **kw):
+            ''' Like loads_many, but each worker reads the files at
+                the given paths itself, and (path, value, error) is
+                yielded for each one.
+            '''
+            paths = list(paths)
+            for index, value, err in bulk_load(system, dict(options, **kw), paths,
+                                               True, ordered, workers, chunksize):
+                yield paths[index], value, err
+
+        return loads_many, load_files
@@ -0,0 +1,150 @@
+'''
+Parse result cache for RSON.
+
+Copyright (c) 2010, Patrick Maupin.  All rights reserved.
+
+See http://code.google.com/p/rson/source/browse/trunk/license.txt
+'''
+
+import hashlib
+import threading
+import time
+from copy import copy, deepcopy
+from collections import OrderedDict
+
+from rson.py23 import unicode
+from rson.base.tokenizer import RSONDecodeError
+from rson.base.baseobjects import BaseObjects
+
+try:
+    u''.encode('utf-8', 'surrogatepass')
+    surrogates = 'surrogatepass'
+except LookupError:
+    surrogates = 'strict'
+
+
+def fastcopy(value, dict_object=BaseObjects.dict_object,
+             frozen_object=BaseObjects.frozen_object):
+    ''' Copy a parse result.  The lists and dicts the parser makes
+        are copied directly, frozen results are shared, and anything
+        else is deep-copied.
+    '''
+    cls = type(value)
+    if cls is frozen_object:
+        return value
+    if cls is list:
+        return [fastcopy(x) for x in value]
+    if cls is dict or isinstance(value, dict_object):
+        result = cls()
+        for key, item in value.items():
+            result[key] = fastcopy(item)
+        return result
+    if value is None or cls in (unicode, str, bytes, int, float, bool):
+        return value
+    return deepcopy(value)
+
+
+class ParseCache(object):
+    ''' A bounded, thread-safe LRU cache in front of a loads
+        function.  Results are keyed by a hash of the source and
+        the keyword arguments, and decode errors are remembered
+        too, so the same bad source fails without being parsed
+        again.
+
+        At most maxsize results are kept, for sources of at most
+        maxbytes in total.  With copy=True each call gets its own
+        copy of the result; with copy=False the cached result is
+        shared, and must not be modified.  Setting enabled to false
+        (or maxsize to 0) passes every call straight to loads.
+
+        Two threads that miss on the same source at the same time
+        will both parse it.
+    '''
+
+    def __init__(self, loads, maxsize=128, maxbytes=1 << 24, copy=True):
+        self.loads = loads
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.copy = fastcopy if copy else None
+        self.enabled = True
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.entries = OrderedDict()
+            self.nbytes = 0
+            self.hits = self.misses = self.evictions = 0
+            self.hit_time = self.miss_time = 0.0
+
+    def stats(self):
+        ''' Return a dict of the hit and miss counts, the current
+            size, and the total time spent in hits and misses.
+        '''
+        with self.lock:
+            return dict(hits=self.hits, misses=self.misses,
+                        evictions=self.evictions, entries=len(self.entries),
+                        bytes=self.nbytes, hit_time=self.hit_time,
+                        miss_time=self.miss_time)
+
+    @staticmethod
+    def makekey(source, kw):
+        if isinstance(source, unicode):
+            data = source.encode('utf-8', surrogates)
+        else:
+            data = bytes(source)
+        if isinstance(kw.get('select'), list):
+            kw['select'] = tuple(kw['select'])
+        key = (hashlib.sha1(data).digest(), len(data), type(source),
+               tuple(sorted(kw.items())))
+        hash(key)
+        return key, len(data)
+
+    def __call__(self, source, **kw):
+        if not self.enabled or not self.maxsize:
+            return self.loads(source, **kw)
+        start = time.time()
+        try:
+            key, size = self.makekey(source, kw)
+        except TypeError:
+            # Unhashable keyword arguments are not cached
+            return self.loads(source, **kw)
+
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.entries[key] = entry
+        if entry is not None:
+            failed, result = entry[:2]
+            if not failed and self.copy is not None:
+                result = self.copy(result)
+            with self.lock:
+                self.hits += 1
+                self.hit_time += time.time() - start
+            if failed:
+                # Each caller gets its own exception, without the
+                # traceback of an earlier one
+                raise copy(result)
+            return result
+
+        failed = False
+        try:
+            result = self.loads(source, **kw)
+        except RSONDecodeError as e:
+            failed, result = True, e
+        with self.lock:
+            self.misses += 1
+            self.miss_time += time.time() - start
+            if size <= self.maxbytes:
+                entries = self.entries
+                if entries.pop(key, None) is None:
+                    self.nbytes += size
+                entries[key] = failed, copy(result) if failed else result, size
+                while len(entries) > self.maxsize or self.nbytes > self.maxbytes:
+                    self.nbytes -= entries.popitem(last=False)[1][2]
+                    self.evictions += 1
+        if failed:
+            raise result
+        if self.copy is not None:
+            result = self.copy(result)
+        return result
@@ -6,6 +6,14 @@ Copyright (c) 2010, Patrick Maupin.  All rights reserved.
 See http://code.google.com/p/rson/source/browse/trunk/license.txt
 '''
 
+from rson.base.cache import ParseCache
+
+try:
+    from rson.base.aio import aload_factory
+except (ImportError, SyntaxError):
+    # No asyncio, or no async def
+    aload_factory = None
+
 def _alter_attributes(cls, attrs):
     ''' Return a new class with altered attributes.
         But throw an exception unless altered attributes
@@ -17,6 +25,10 @@ def _alter_attributes(cls, attrs):
     class Altered(cls):
         pass
 
+    # Remembered so that worker processes can build the same class
+    Altered.unaltered_class = getattr(cls, 'unaltered_class', None) or cls
+    Altered.altered_attributes = dict(getattr(cls, 'altered_attributes', {}), **attrs)
+
     extra = cls.allowed_extra_attributes
     for name, value in attrs.items():
         if not hasattr(cls, name) and name not in extra:
@@ -46,21 +58,107 @@ class Dispatcher(object):
     @classmethod
     def dispatcher_factory(cls, tuple=tuple, sorted=sorted, **kw):
 
-        def loads(s, **kw):
+        def getparser(kw):
             if not kw:
-                return default_loads(s)
+                return default_loads
 
+            if isinstance(kw.get('select'), list):
+                kw['select'] = tuple(kw['select'])
             key = tuple(sorted(kw.items()))
+            if 'schema' in kw:
+                # Schemas are dicts, so they are looked up by repr
+                key = tuple((x, repr(y) if x == 'schema' else y) for x, y in key)
             func = cached(key)
             if func is None:
                 func = _alter_attributes(cls, kw)().parser_factory()
                 parsercache[key] = func
+            return func
+
+        def loads(s, **kw):
+            if not kw:
+                return default_loads(s)
+            return getparser(kw)(s)
+
+        def load(fp, chunk_size=None, **kw):
+            ''' Like loads, but reads the source from a file-like
+                object chunk_size characters at a time, so the
+                whole document is never held in memory at once.
+            '''
+            return getparser(kw).load(fp, chunk_size)
+
+        def load_path(path, **kw):
+            ''' Like loads, but memory-maps the file at the given
+                path and tokenizes its bytes directly, decoding only
+                the text of strings and scalars.  Error positions
+                are byte offsets into the file.
+            '''
+            return getparser(kw).load_path(path)
+
+        def iterparse(source, offsets=False, chunk_size=None, **kw):
+            ''' Parse a string or a file-like object incrementally,
+                yielding (event, value) tuples, or (event, value,
+                offset) tuples if offsets is true.  See EventParser
+                for the events.
+            '''
+            return getparser(kw).iterparse(source, offsets, chunk_size)
+
+        def iter_items(source, chunk_size=None, **kw):
+            ''' Parse a string or a file-like object incrementally,
+                yielding each element of the top-level array, or each
+                (key, value) pair of the top-level dict, as soon as it
+                has been read.
+            '''
+            return getparser(kw).iter_items(source, chunk_size)
+
+        def loads_lazy(s, **kw):
+            ''' Like loads, but only finds where the top-level entries
+                start, and returns a read-only proxy that parses each
+                one the first time it is used.
+            '''
+            return getparser(kw).loads_lazy(s)
+
+        def parse_document(s, **kw):
+            ''' Like loads, but returns a Document holding the
+                result, which can reparse an edited version of the
+                source, reusing the parts the edit did not touch.
+            '''
+            return getparser(kw).parse_document(s)
+
+        def loads_parallel(s, workers=None, **kw):
+            ''' Like loads, but splits a large document into parts
+                at lines that start in column 0, and reads the parts
+                in a pool of worker processes.
+            '''
+            return getparser(kw).loads_parallel(s, workers)
+
+        def push_parser(**kw):
+            ''' Return a PushParser, which is given the source a
+                piece at a time with feed(), and reads complete
+                top-level entries as they arrive.  close() returns
+                the result.
+            '''
+            return getparser(kw).push_parser()
 
-            return func(s)
+        def cache(maxsize=128, maxbytes=1 << 24, copy=True):
+            ''' Return a ParseCache, which works like loads but
+                remembers the results for recently used sources.
+            '''
+            return ParseCache(loads, maxsize, maxbytes, copy)
 
         cls = _alter_attributes(cls, kw)
         default_loads = cls().parser_factory()
         parsercache = {}
         cached = parsercache.get
+        loads.load = load
+        loads.load_path = load_path
+        loads.iterparse = iterparse
+        loads.iter_items = iter_items
+        loads.loads_lazy = loads_lazy
+        loads.parse_document = parse_document
+        loads.loads_parallel = loads_parallel
+        loads.push_parser = push_parser
+        loads.aload = aload_factory and aload_factory(push_parser)
+        loads.loads_many, loads.load_files = cls.bulk_factory()
+        loads.cache = cache
         loads.customize = cls.dispatcher_factory
         return loads
@@ -9,7 +9,6 @@ See http://code.google.com/p/rson/source/browse/trunk/license.txt
 
 import sys
 import re
-import bisect
 import rson.py23
 
 class QuotedToken(object):
@@ -44,7 +43,7 @@ class QuotedToken(object):
         allow_double = sys.maxunicode > 65535
 
         def badstring(token, special):
-            if token[2] != '"""' or triplequoted is None:
+            if not token[2].startswith('"""') or triplequoted is None:
                 token[-1].error('Invalid character in quoted string: %s' % repr(special), token)
             result = parse_quoted_str(token, triplequoted(token))
             if cachestrings:
@@ -103,20 +102,9 @@ class QuotedToken(object):
 
     @staticmethod
     def triplequoted(token):
-        tokens = token[-1]
-        source = tokens.source
-        result = []
-        start = 3 - token[0]
-        while 1:
-            end = source.find('"""', start)
-            if end < 0:
-                tokens.error('Did not find end for triple-quoted string', token)
-            if source[end-1] != '\\':
-                break
-            result.append(source[start:end-1])
-            result.append('"""')
-            start = end + 3
-        result.append(source[start:end])
-        offset = bisect.bisect(tokens, (- end -2, ))
-        tokens[offset:] = []
-        return ''.join(result)
+        # The tokenizer matches the whole string, or just the
+        # opening quotes if it is never terminated.
+        text = token[2]
+        if len(text) < 6:
+            token[-1].error('Did not find end for triple-quoted string', token)
+        return text[3:-3].replace('\\"""', '"""')
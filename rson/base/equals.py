@@ -7,63 +7,132 @@ See http://code.google.com/p/rson/source/browse/trunk/license.txt
 
 '''
 
+import re
+
+try:
+    from collections import UserString
+except ImportError:
+    from UserString import UserString
+
+
+def _dedent_equals(source, indent, token, search=re.search, escape=re.escape):
+    ''' The default parse_equals(), given the text of the block,
+        starting just after the equals sign, rather than a list of
+        its lines.  Most blocks are dedented with a few searches
+        and one replace().
+    '''
+    first, _, rest = source.partition('\n')
+    first = first.rstrip()
+    rest = rest.rstrip()
+    linestart = '\n' + escape(indent)
+
+    # Strip trailing whitespace and embedded comments, if there are any
+    if rest:
+        rest = '\n' + rest
+        if search(r'\n(?:(?<=[^\S\n]\n)|(?!%s|\n))' % linestart[1:], rest) is not None:
+            lines = [x.rstrip() for x in rest.split('\n')]
+            rest = '\n'.join([x for x in lines if not x or x.startswith(indent)]).rstrip()
+
+    # Special case for single line
+    if not rest:
+        return first.strip()
+
+    # Dedent all the strings to one past the equals, or one more
+    # if they all have whitespace there
+    dedent = len(indent)
+    extra = (not first or first[:1].isspace()) and search(linestart + r'\S', rest) is None
+    if extra and search(linestart + r'[^ \n]', rest) is not None:
+        rest = '\n'.join([x[dedent + 1:] for x in rest.split('\n')])
+    else:
+        rest = rest.replace('\n' + indent + ' ' * extra, '\n')
+
+    # Give every line its own linefeed (keeps later parsing from
+    # treating this as a number, for example)
+    if first:
+        return first[extra:] + rest + '\n'
+    return rest[1:] + '\n'
+
+
 class EqualToken(object):
     ''' Subclass or replace this if you don't like the = string handling
     '''
 
     encode_equals_str = None
 
+    # Set lazy_equals to a size to return multi-line = strings whose
+    # source is at least that many characters long as EqualsView objects.
+    lazy_equals = 0
+
+    class EqualsView(UserString):
+        ''' EqualsView is a string-like view of a multi-line = string
+            that is only dedented the first time it is used.  (It is
+            only used for blocks that are known to give a string, and
+            only if lazy_equals is set.)  Until then, it only holds
+            the source, where the block is in it, and its indentation.
+        '''
+        def __init__(self, seq, finish=None, start=0, end=None, indent=''):
+            if finish is None:
+                UserString.__init__(self, seq)
+            else:
+                self.source, self.finish = seq, finish
+                self.block = start, end, indent
+
+        def __getattr__(self, name):
+            if name != 'data':
+                raise AttributeError(name)
+            self.data = data = self.finish(self.source, *self.block)
+            del self.source, self.finish, self.block
+            return data
+
     @staticmethod
     def parse_equals(stringlist, indent, token):
-        ''' token probably not needed except maybe for error reporting.
+        ''' stringlist holds the lines of the block, with indent (the
+            indentation of the equals line plus one space) in front of
+            the first one.  token probably not needed except maybe for
+            error reporting.
             Replace this with something that does what you want.
         '''
-        # Strip any trailing whitespace to the right
-        stringlist = [x.rstrip() for x in stringlist]
-
-        # Strip any embedded comments
-        stringlist = [x for x in stringlist if x.startswith(indent) or not x]
-
-        # Strip trailing whitespace down below
-        while stringlist and not stringlist[-1]:
-            stringlist.pop()
-
-        # Special cases for single line
-        if not stringlist:
-            return ''
-        if len(stringlist) == 1:
-            return stringlist[0].strip()
-
-        # Strip whitespace on first line
-        if stringlist and not stringlist[0]:
-            stringlist.pop(0)
-
-        # Dedent all the strings to one past the equals
-        dedent = len(indent)
-        stringlist = [x[dedent:] for x in stringlist]
-
-        # Figure out if should dedent one more
-        if min((not x and 500 or len(x) - len(x.lstrip())) for x in stringlist):
-            stringlist = [x[1:] for x in stringlist]
-
-        # Give every line its own linefeed (keeps later parsing from
-        # treating this as a number, for example)
-        stringlist.append('')
-
-        # Return all joined up as a single unicode string
-        return '\n'.join(stringlist)
+        return _dedent_equals('\n'.join(stringlist)[len(indent):], indent, token)
 
     def equal_parse_factory(self, read_unquoted):
 
         parse_equals = self.parse_equals
         encoder = self.encode_equals_str
+        lazy = self.lazy_equals
+        EqualsView = self.EqualsView
+        compile = re.compile
 
         if encoder is None:
             encoder = read_unquoted
+        else:
+            lazy = 0
+
+        if parse_equals is EqualToken.parse_equals:
+            # The default works on the whole block, so don't split it
+            dedent = _dedent_equals
+        else:
+            def dedent(source, indent, token):
+                stringlist = source.split('\n')
+                stringlist[0] = indent + stringlist[0]
+                return parse_equals(stringlist, indent, token)
+
+        def finish(firsttok, source, indent, next):
+            token = list(firsttok)
+            token[1:3] = '=', dedent(source, indent, firsttok)
+            return encoder(token, next)
+
+        def finish_view(source, start, end, indent):
+            token = [1 - start, '=', None, '', '\n' + indent[:-1], None, None]
+            token[2] = dedent(source[start:end], indent, token)
+            return encoder(token, None)
 
         def parse(firsttok, next):
             tokens = firsttok[-1]
+            tokens.retain(firsttok)
             indent, linenum = firsttok[4:6]
+
+            # The tokenizer normally skips the contents of the block,
+            # so this is the first token after it.
             token = next()
             while token[5] == linenum:
                 token = next()
@@ -74,11 +143,18 @@ class EqualToken(object):
             # Get rid of \n, and indent one past =
             indent = indent[1:] + ' '
 
-            bigstring = tokens.source[-firsttok[0] + 1 : -token[0]]
-            stringlist = bigstring.split('\n')
-            stringlist[0] = indent + stringlist[0]
-            token = list(firsttok)
-            token[1:3] = '=', parse_equals(stringlist, indent, firsttok)
-            return encoder(token, next)
+            start, end = -firsttok[0] + 1, -token[0]
+            if lazy and end - start >= lazy:
+                source, start, end = tokens.sourceblock(start, end)
+                tokens.release()
+                # A block with a line after the first one is always a string
+                if compile('\n%s[^\n]*\S' % re.escape(indent)).search(
+                        source, start, len(source) if end is None else end) is not None:
+                    return EqualsView(source, finish_view, start, end, indent)
+                source = source[start:end]
+            else:
+                source = tokens.getsource(start, end)
+                tokens.release()
+            return finish(firsttok, source, indent, next)
 
         return parse
@@ -0,0 +1,499 @@
+'''
+Event (SAX-style) parsing for RSON.
+
+Copyright (c) 2010, Patrick Maupin.  All rights reserved.
+
+See http://code.google.com/p/rson/source/browse/trunk/license.txt
+'''
+
+from rson.py23 import basestring, Mapping
+from rson.base.baseobjects import freeze_list
+
+
+class Streamed(object):
+    ''' Marks a value whose events have already been produced.
+    '''
+    def __repr__(self):
+        return '...'
+
+# A value that has been streamed, and an element that isn't there
+STREAMED = Streamed()
+NOTHING = object()
+
+
+class EventParser(object):
+    ''' Builds iterparse() out of the closures of parser_factory(),
+        so it reads exactly the same syntax (and reports the same
+        errors) as loads().
+
+        iterparse() yields (event, value) tuples, or (event, value,
+        offset) tuples if offsets are requested.  The events are
+        'start_map', 'map_key', 'end_map', 'start_array', 'end_array'
+        and 'scalar'.  The offset is where the value, key or container
+        starts in the source.  (End events get the offset of their
+        container.)
+
+        Values are streamed as they are parsed, so memory use does
+        not depend on the length of an array or dict.  The exceptions
+        are the first value of an indented block, which decides if the
+        block is an array or a dict, and an indented block that fills
+        an empty [] or {}.  Those are read whole, and their events come
+        from the values, with the offset of the value they are in.
+
+        The events follow the source, so a key that is repeated (or a
+        chained key like "a: b: 1" that adds to an existing dict) is
+        reported every time, rather than merged as loads() merges it.
+        If a document that starts with a bracketed value has more
+        values after it, they are reported as more top-level values,
+        instead of making the whole document an array.
+    '''
+
+    def iterparse_factory(self, parse_locals):
+        ''' Return the iterparse() function for a parser, given the
+            locals of its parser_factory().
+        '''
+        env = parse_locals
+        Tokenizer = env['Tokenizer']
+        lazy_tokenizer = Tokenizer.lazy_factory(env['equals'])
+        streamer = env['streamer']
+        stream_chunk_size = env['stream_chunk_size']
+        client_info = env['client_info']
+        error = env['error']
+        read_json_array = env['read_json_array']
+        read_json_dict = env['read_json_dict']
+        read_json_key = env['read_json_key']
+        json_value_dispatch = env['json_value_dispatch']
+        rson_value_dispatch = env['rson_value_dispatch']
+        rson_key_dispatch = env['rson_key_dispatch']
+        bad_array_element = env['bad_array_element']
+        bad_dict_key = env['bad_dict_key']
+        bad_dict_value = env['bad_dict_value']
+        bad_top_value = env['bad_top_value']
+        bad_unindent = env['bad_unindent']
+        bad_element = env['bad_element']
+        bad_close = env['bad_close']
+        block_is_array = env['block_is_array']
+        block_ended = env['block_ended']
+        read_keys = env['read_keys']
+        add_block = env['add_block']
+        check_entry = env['check_entry']
+        parse_steps = env['parse_steps']
+        step_block = env['step_block']
+        step_fill = env['step_fill']
+        new_array = env['new_array']
+        new_object = env['new_object']
+        empties = env['empties']
+        disallow_trailing_commas = env['disallow_trailing_commas']
+        disallow_nonstring_keys = env['disallow_nonstring_keys']
+        generator = env['generator']
+        with_locations = env['with_locations']
+        done = None, None
+
+        def run(steps):
+            ''' Run a *_steps() generator, which yields a generator to
+                call it, an event to produce it, or (None, value) to
+                return a value.  The callers are kept on a list, so
+                deep nesting does not recurse.
+            '''
+            callers = []
+            send = steps.send
+            value = None
+            while 1:
+                item = send(value)
+                value = None
+                if type(item) is generator:
+                    callers.append(send)
+                    send = item.send
+                elif item[0] is not None:
+                    yield item
+                elif callers:
+                    send = callers.pop()
+                    value = item[1]
+                else:
+                    return
+
+        def value_steps(value, offset):
+            ''' Produce the events for a value that has been read whole.
+            '''
+            stack = []
+            items = iter(((NOTHING, value),))
+            while 1:
+                for key, value in items:
+                    if key is not NOTHING:
+                        yield 'map_key', key, offset
+                    if isinstance(value, dict):
+                        yield 'start_map', None, offset
+                        stack.append((items, 'end_map'))
+                        items = iter(list(value.items()))
+                        break
+                    if isinstance(value, list):
+                        yield 'start_array', None, offset
+                        stack.append((items, 'end_array'))
+                        items = ((NOTHING, x) for x in value)
+                        break
+                    yield 'scalar', value, offset
+                else:
+                    if not stack:
+                        yield done
+                    items, event = stack.pop()
+                    yield event, None, offset
+
+        def json_steps(firsttok, next, defer):
+            ''' Stream a bracketed value, like read_json_nested().  If
+                defer is true and the value is empty, it is returned
+                without producing any events, in case an indented
+                block fills it.  Otherwise STREAMED is returned.
+            '''
+            frames = []
+            close = bad = None
+            token = firsttok
+            while 1:
+                t0 = token[1]
+                if bad is bad_dict_key:
+                    # Keys are always read whole
+                    yield 'map_key', read_json_key(token, next), -token[0]
+                    token = next()
+                    bad = bad_dict_value
+                    continue
+                if t0 == '[' or t0 == '{':
+                    frames.append((firsttok, close, bad))
+                    firsttok = token
+                    if t0 == '[':
+                        close, bad, event = ']', bad_array_element, 'start_array'
+                    else:
+                        close, bad, event = '}', bad_dict_key, 'start_map'
+                    token = next()
+                    if token[1] != close:
+                        yield event, None, -firsttok[0]
+                        continue
+                    if defer and len(frames) == 1:
+                        if close == ']':
+                            yield None, new_array([], firsttok)
+                        yield None, new_object().get_result(firsttok)
+                    yield event, None, -firsttok[0]
+                    delim = None
+                else:
+                    yield 'scalar', json_value_dispatch(t0, bad)(token, next), -token[0]
+                    delim = next()
+
+                # Close containers until there is another value to read
+                while 1:
+                    if delim is not None:
+                        if bad is bad_dict_value:
+                            bad = bad_dict_key
+                        t0 = delim[1]
+                        if t0 == ',':
+                            token = next()
+                            if token[1] != close:
+                                break
+                            if disallow_trailing_commas:
+                                error('Unexpected trailing comma', token)
+                        elif t0 != close:
+                            bad_close(delim, firsttok)
+                    yield ('end_array' if close == ']' else 'end_map'), None, -firsttok[0]
+                    firsttok, close, bad = frames.pop()
+                    if not frames:
+                        yield None, STREAMED
+                    delim = next()
+
+        def key_steps(keys, offsets):
+            ''' Produce the events for the keys of a dict entry.  Chained
+                keys start a dict for each key after the first.
+            '''
+            for index, key in enumerate(keys):
+                if index:
+                    yield 'start_map', None, offsets[index]
+                yield 'map_key', key, offsets[index]
+            yield done
+
+        def valid_keys(keys):
+            for key in keys:
+                if key is STREAMED or disallow_nonstring_keys and not isinstance(key, basestring):
+                    return False
+            return True
+
+        def array_steps(stack, next, token, held, wrap):
+            ''' Stream the rest of an indented array, like
+                step_array().  held is its first element, which
+                has been read but not produced yet, and wrap is false for
+                values after a bracketed document, which are produced
+                without starting an array.
+            '''
+            offset = heldoffset = -stack[-1][0]
+            arrayindent, linenum = stack[-1][4:6]
+            started = not wrap
+            while 1:
+                thisindent = token[4]
+                if thisindent != arrayindent:
+                    if thisindent < arrayindent:
+                        # A single element is not wrapped in an array
+                        if held is not NOTHING:
+                            yield value_steps(held, heldoffset)
+                        if started and wrap:
+                            yield 'end_array', None, offset
+                        yield None, token
+                    stack.append(token)
+                    held, token = parse_steps(step_fill(stack, next, token, held))
+                    stack.pop()
+                    if token[4] > arrayindent:
+                        bad_unindent(token, next)
+                    continue
+                if token[5] <= linenum:
+                    bad_element(token, next)
+                linenum = token[5]
+                if not started:
+                    yield 'start_array', None, offset
+                    started = True
+                if held is not NOTHING:
+                    yield value_steps(held, heldoffset)
+                    held = NOTHING
+                heldoffset = -token[0]
+                reader = rson_value_dispatch(token[1], bad_top_value)
+                if reader is read_json_array or reader is read_json_dict:
+                    value = yield json_steps(token, next, True)
+                    if value is not STREAMED:
+                        held = value
+                else:
+                    yield 'scalar', reader(token, next), heldoffset
+                token = next()
+
+        def entry_steps(stack, next, token, entry):
+            ''' Stream a dict entry, like read_entry().  The
+                keys are produced before the value, once they are known
+                to be good.
+            '''
+            keytok = stack[-1]
+            arrayindent = keytok[4]
+            offsets = [-keytok[0]]
+            emitted = 0
+
+            def read(token, next):
+                offsets.append(-token[0])
+                reader = rson_value_dispatch(token[1], bad_top_value)
+                if ((reader is read_json_array or reader is read_json_dict)
+                        and not emitted and valid_keys(entry)):
+                    # Put it back, to be streamed below
+                    token[-1].push(token)
+                    return NOTHING
+                return reader(token, next)
+
+            token = read_keys(stack, next, token, entry, read)
+            while entry[-1] is NOTHING:
+                emitted = len(entry) - 1
+                yield key_steps(entry[:-1], offsets)
+                entry[-1] = yield json_steps(token, next, True)
+                token = read_keys(stack, next, next(), entry, read)
+
+            if token[4] > arrayindent:
+                stack.append(token)
+                last = entry[-1]
+                offsets.append(-token[0])
+                if emitted or last in empties or not valid_keys(entry):
+                    # Read the block whole, as read_entry() does
+                    value, token = parse_steps(step_block(stack, next))
+                    add_block(entry, value, stack[-1])
+                    if last in empties:
+                        offsets.pop()
+                else:
+                    emitted = len(entry)
+                    yield key_steps(entry, offsets)
+                    token = yield block_steps(stack, next, NOTHING)
+                    entry.append(STREAMED)
+                stack.pop()
+
+            check_entry(entry, token)
+            for key in entry[:-1]:
+                if key is STREAMED:
+                    error('Non-string key %s not supported' % repr(key), token)
+            if not emitted:
+                yield key_steps(entry[:-1], offsets)
+            value = entry[-1]
+            if value is not STREAMED:
+                yield value_steps(value, offsets[len(entry) - 1])
+            for index in range(len(entry) - 2, 0, -1):
+                yield 'end_map', None, offsets[index]
+            yield None, token
+
+        def dict_steps(stack, next, token):
+            ''' Stream the rest of an indented dict, like step_dict().
+            '''
+            arrayindent = stack[-1][4]
+            while not block_ended(token, next, arrayindent):
+                key = rson_key_dispatch(token[1], bad_top_value)(token, next)
+                stack[-1] = token
+                token = yield entry_steps(stack, next, next(), [key])
+            yield None, token
+
+        def block_steps(stack, next, value):
+            ''' Stream an indented block, like step_block().  value
+                is its first value, if that has already been read.
+            '''
+            firsttok = stack[-1]
+            if value is NOTHING:
+                value = rson_value_dispatch(firsttok[1], bad_top_value)(firsttok, next)
+            token = next()
+            if block_is_array(firsttok, value, token):
+                token = yield array_steps(stack, next, token, value, True)
+                yield None, token
+            yield 'start_map', None, -firsttok[0]
+            token = yield entry_steps(stack, next, token, [value])
+            token = yield dict_steps(stack, next, token)
+            yield 'end_map', None, -firsttok[0]
+            yield None, token
+
+        def top_steps(next):
+            stack = [next()]
+            firsttok = stack[0]
+            value = NOTHING
+            reader = rson_value_dispatch(firsttok[1], bad_top_value)
+            if reader is read_json_array or reader is read_json_dict:
+                value = yield json_steps(firsttok, next, True)
+            if value is not STREAMED:
+                token = yield block_steps(stack, next, value)
+            else:
+                token = next()
+                if token[1] != '@':
+                    if block_is_array(firsttok, value, token):
+                        token = yield array_steps(stack, next, token, NOTHING, False)
+                    else:
+                        token = yield entry_steps(stack, next, token, [value])
+            if token[1] != '@':
+                error('Unexpected additional data', token)
+            yield done
+
+        def iterparse(source, offsets=False, chunk_size=None):
+            if hasattr(source, 'read'):
+                tokens = streamer(source, None, chunk_size or stream_chunk_size)
+            else:
+                tokens = lazy_tokenizer(source, None)
+            tokens.stringcache = {}.setdefault
+            tokens.client_info = client_info
+            tokens.json_failed = 0
+            if with_locations:
+                tokens.located = []
+            if offsets:
+                return run(top_steps(tokens.next))
+            return (event[:2] for event in run(top_steps(tokens.next)))
+
+        return iterparse
+
+    def items_factory(self, parse_locals):
+        ''' Return the iter_items() function for a parser, given the
+            locals of its parser_factory().
+
+            iter_items() yields the elements of a top-level array, or
+            the (key, value) pairs of a top-level dict, one at a time,
+            each value built as loads() would build it.  A top-level
+            key that is repeated is yielded each time it appears, with
+            the value from that entry, where loads() would merge the
+            entries into one value.  Only one
+            element is held at a time (two while the first element of an
+            indented array is waiting to see if there is a second).  If
+            the document is a single value that is not an array or dict,
+            that value is the only item.
+
+            The first value is read whole, so a document that is one
+            big bracketed array is held in memory; iterparse() can
+            stream those.
+        '''
+        env = parse_locals
+        Tokenizer = env['Tokenizer']
+        lazy_tokenizer = Tokenizer.lazy_factory(env['equals'])
+        streamer = env['streamer']
+        stream_chunk_size = env['stream_chunk_size']
+        client_info = env['client_info']
+        with_locations = env['with_locations']
+        error = env['error']
+        rson_value_dispatch = env['rson_value_dispatch']
+        rson_key_dispatch = env['rson_key_dispatch']
+        bad_top_value = env['bad_top_value']
+        bad_unindent = env['bad_unindent']
+        bad_element = env['bad_element']
+        block_is_array = env['block_is_array']
+        block_ended = env['block_ended']
+        read_entry = env['read_entry']
+        parse_steps = env['parse_steps']
+        step_fill = env['step_fill']
+        new_object = env['new_object']
+        frozen = self.frozen
+
+        def item(value):
+            if frozen and type(value) is list:
+                return freeze_list(value)
+            return value
+
+        def pair(entry, token):
+            ''' Make a (key, value) pair from a dict entry, nesting
+                chained keys the way the dict would.
+            '''
+            if len(entry) == 2:
+                return entry[0], item(entry[1])
+            value = new_object()
+            value.append(entry[1:])
+            return entry[0], value.get_result(token)
+
+        def top_items(tokens):
+            tokens.stringcache = {}.setdefault
+            tokens.client_info = client_info
+            tokens.json_failed = 0
+            if with_locations:
+                tokens.located = []
+            next = tokens.next
+            firsttok = next()
+            stack = [firsttok]
+            value = rson_value_dispatch(firsttok[1], bad_top_value)(firsttok, next)
+            token = next()
+
+            if block_is_array(firsttok, value, token):
+                # An array, like step_array()
+                arrayindent, linenum = firsttok[4:6]
+                count = 1
+                while 1:
+                    thisindent = token[4]
+                    if thisindent != arrayindent:
+                        if thisindent < arrayindent:
+                            break
+                        stack.append(token)
+                        value, token = parse_steps(step_fill(stack, next, token, value))
+                        stack.pop()
+                        if token[4] > arrayindent:
+                            bad_unindent(token, next)
+                        continue
+                    if token[5] <= linenum:
+                        bad_element(token, next)
+                    linenum = token[5]
+                    yield item(value)
+                    count += 1
+                    value = rson_value_dispatch(token[1], bad_top_value)(token, next)
+                    token = next()
+                if token[1] != '@':
+                    error('Unexpected additional data', token)
+                if count > 1 or not isinstance(value, (list, tuple, Mapping)):
+                    yield item(value)
+                elif isinstance(value, Mapping):
+                    for key, value in value.items():
+                        yield key, item(value)
+                else:
+                    for value in value:
+                        yield item(value)
+                return
+
+            # A dict, like step_dict()
+            entries = []
+            token = read_entry(stack, next, token, [value], entries)
+            yield pair(entries.pop(), token)
+            arrayindent = firsttok[4]
+            while not block_ended(token, next, arrayindent):
+                key = rson_key_dispatch(token[1], bad_top_value)(token, next)
+                stack[-1] = token
+                token = read_entry(stack, next, next(), [key], entries)
+                yield pair(entries.pop(), token)
+            if token[1] != '@':
+                error('Unexpected additional data', token)
+
+        def iter_items(source, chunk_size=None):
+            if hasattr(source, 'read'):
+                return top_items(streamer(source, None, chunk_size or stream_chunk_size))
+            return top_items(lazy_tokenizer(source, None))
+
+        return iter_items
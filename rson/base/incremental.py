@@ -0,0 +1,302 @@
+'''
+Incremental reparsing of edited RSON documents.
+
+Copyright (c) 2010, Patrick Maupin.  All rights reserved.
+
+See http://code.google.com/p/rson/source/browse/trunk/license.txt
+'''
+
+from rson.base.tokenizer import RSONDecodeError, normalize
+from rson.base.parser import RsonParser
+
+
+class Document(object):
+    ''' A parse result that remembers where the entries of its
+        indented dicts start in the source, so that reparse() of
+        an edited source only has to parse the blocks the edit
+        touched.
+
+        value is the parse result, and source the (normalized)
+        source it came from.
+    '''
+
+    def __init__(self, value, source, root, reparse):
+        self.value = value
+        self.source = source
+        self.root = root
+        self._reparse = reparse
+
+    def reparse(self, source):
+        ''' Return a new Document for an edited source.  Values
+            from blocks that were not touched by the edit are
+            reused, so they are the same objects as before.
+        '''
+        return self._reparse(self, source)
+
+
+def common_prefix(a, b):
+    ''' Return the length of the common prefix of two strings.
+    '''
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def common_suffix(a, b, limit):
+    ''' Return the length of the common suffix of two strings,
+        up to limit.
+    '''
+    lo, hi = 0, limit
+    la, lb = len(a), len(b)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[la-mid:la-lo] == b[lb-mid:lb-lo]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+class Changed(Exception):
+    ''' Raised when an edit changed the structure of a block, so
+        the whole document needs to be parsed again.
+    '''
+
+
+class IncrementalParser(object):
+    ''' Builds parse_document(), which works like loads() but
+        returns a Document.
+
+        Each indented dict (starting with the top-level one) is
+        recorded as its indentation and a list of segments.  A
+        segment starts on the line of a key at the dict's
+        indentation, and holds the entries read from there up
+        to the next such line.  A segment with a single "key:"
+        entry followed by an indented dict also holds that dict.
+
+        To reparse, the segments of a dict that lie entirely in
+        the unchanged start or end of the source are kept, and the
+        source between them is parsed on its own.  If that is just
+        the inside of one nested dict, it is reparsed the same
+        way.  The dict is then rebuilt by appending the entries
+        of all its segments to a new object, just as the parser
+        does.  Anything that could not be reparsed on its own,
+        such as a new indentation level, an unclosed bracket, or
+        a decode error, is handled by parsing the whole source
+        again, so the result is always what loads() would give.
+
+        Dicts with repeated or chained keys are merged when they
+        are built, so they are not recorded, and neither are
+        documents that are not dicts.
+    '''
+
+    def document_factory(self, parse_locals):
+        ''' Return the parse_document() function for a parser, given
+            the locals of its parser_factory().
+        '''
+        env = parse_locals
+        parse = env['parse']
+        tokenizer = env['tokenizer']
+        client_info = env['client_info']
+        rson_value_dispatch = env['rson_value_dispatch']
+        rson_key_dispatch = env['rson_key_dispatch']
+        bad_top_value = env['bad_top_value']
+        block_is_array = env['block_is_array']
+        block_ended = env['block_ended']
+        add_block = env['add_block']
+        check_entry = env['check_entry']
+        read_entry = env['read_entry']
+        parse_steps = env['parse_steps']
+        step_array = env['step_array']
+        new_object, new_array = env['new_object'], env['new_array']
+        empties = env['empties']
+        rson_subelement_delimiter = env['rson_subelement_delimiter']
+        supported = not (env['with_locations'] or env['select_tokens'] or
+                         env['check_schema'] or env['keep_source'] or
+                         env['post_parse'] is not RsonParser.post_parse)
+
+        def setup(tokens):
+            tokens.stringcache = {}.setdefault
+            tokens.client_info = client_info
+            tokens.json_failed = 0
+            return tokens.next, tokens.push
+
+        def build(segments):
+            result = new_object()
+            for segment in segments:
+                for entry in segment[1]:
+                    result.append(list(entry))
+            return result.get_result(None)
+
+        def replayable(segments):
+            ''' Rebuilding a dict must not change the values in it,
+                which merging repeated keys would.
+            '''
+            keys = set()
+            for segment in segments:
+                for entry in segment[1]:
+                    if len(entry) != 2 or entry[0] in keys:
+                        return False
+                    keys.add(entry[0])
+            return True
+
+        def read_block(next, push, keytok, key, token, source, origin):
+            ''' Read the entries of an indented dict, whose first key
+                has already been read, like step_dict()
+                does.  Return the segments (with their starts relative
+                to origin) and the token after the dict.
+            '''
+            arrayindent = keytok[4]
+            stack = [keytok]
+            segments = []
+            while 1:
+                offset = -keytok[0]
+                linestart = source.rfind('\n', 0, offset) + 1
+                newline = offset - linestart == len(arrayindent) - 1 or not segments
+                stack[-1] = keytok
+                entries = []
+                child = headlen = None
+                if newline and token[1] == rson_subelement_delimiter:
+                    tok1 = next()
+                    if (tok1[5] != keytok[5] and tok1[4] > arrayindent and
+                            tok1[1] != rson_subelement_delimiter and
+                            key not in empties):
+                        # A "key:" followed by an indented block.  This
+                        # is what step_block() would make of it.
+                        value = rson_value_dispatch(tok1[1], bad_top_value)(tok1, next)
+                        token = next()
+                        if block_is_array(tok1, value, token):
+                            value, token = parse_steps(step_array([tok1], next, token,
+                                                               new_array([value], tok1)))
+                        else:
+                            childstart = source.rfind('\n', 0, -tok1[0]) + 1
+                            subsegments, token = read_block(next, push, tok1, value, token,
+                                                            source, childstart)
+                            value = build(subsegments)
+                            if replayable(subsegments):
+                                child = tok1[4], subsegments
+                                headlen = childstart - linestart
+                        entry = [key]
+                        add_block(entry, value, tok1)
+                        check_entry(entry, token)
+                        entries.append(entry)
+                    else:
+                        push(tok1)
+                if not entries:
+                    token = read_entry(stack, next, token, [key], entries)
+                if newline:
+                    segments.append([linestart - origin, entries, child, headlen])
+                else:
+                    segment = segments[-1]
+                    segment[1].extend(entries)
+                    segment[2] = segment[3] = None
+
+                if block_ended(token, next, arrayindent):
+                    return segments, token
+                keytok = token
+                key = rson_key_dispatch(token[1], bad_top_value)(token, next)
+                token = next()
+
+        def read_source(source, origin, indent=None):
+            ''' Read a dict from source.  Return its indentation and
+                segments, or raise Changed if it is not a dict at the
+                given indentation.
+            '''
+            next, push = setup(tokenizer(source, None))
+            keytok = next()
+            if keytok[1] == '@':
+                return indent, []
+            if indent is not None and keytok[4] != indent:
+                raise Changed
+            value = rson_value_dispatch(keytok[1], bad_top_value)(keytok, next)
+            token = next()
+            if block_is_array(keytok, value, token):
+                # An array, as step_block() would read it
+                raise Changed
+            segments, token = read_block(next, push, keytok, value, token,
+                                         source, origin)
+            if token[1] != '@':
+                raise Changed
+            return keytok[4], segments
+
+        def parse_document(source):
+            source = normalize(source)
+            if supported:
+                try:
+                    root = read_source(source, 0)
+                except (RSONDecodeError, Changed):
+                    pass
+                else:
+                    segments = root[1]
+                    if segments and replayable(segments):
+                        return Document(build(segments), source, root, reparse)
+            return Document(parse(source), source, None, reparse)
+
+        def update(block, old, new, start, oldend, newend, prefix, suffix):
+            ''' Return the value and the new block for the dict that
+                starts at start in both sources, and ends at oldend
+                in the old one and newend in the new one.
+            '''
+            indent, segments = block
+            count = len(segments)
+            delta = len(new) - len(old)
+            keep = 0
+            while keep < count:
+                end = start + segments[keep + 1][0] if keep + 1 < count else oldend
+                if end >= prefix or old[end - 1] != '\n':
+                    break
+                keep += 1
+            after = count
+            while after > keep:
+                # The kept segments must still start a line
+                segstart = start + segments[after - 1][0]
+                if segstart < len(old) - suffix or new[segstart + delta - 1] != '\n':
+                    break
+                after -= 1
+            changed = segments[keep:after]
+            if not keep:
+                midstart = start
+            elif keep < count:
+                midstart = start + segments[keep][0]
+            else:
+                midstart = oldend
+            oldmidend = start + segments[after][0] if after < count else oldend
+            midend = oldmidend + delta if after < count else newend
+
+            segment = changed and changed[0]
+            if (len(changed) == 1 and segment[2] is not None and
+                    start + segment[0] + segment[3] <= prefix):
+                childstart = start + segment[0] + segment[3]
+                value, child = update(segment[2], old, new, childstart,
+                                      oldmidend, midend, prefix, suffix)
+                middle = [[segment[0], [[segment[1][0][0], value]], child, segment[3]]]
+            else:
+                middle = read_source(new[midstart:midend], start - midstart, indent)[1]
+
+            segments = (segments[:keep] + middle +
+                        [[x[0] + delta] + x[1:] for x in segments[after:]])
+            if not segments or not replayable(segments):
+                raise Changed
+            return build(segments), (indent, segments)
+
+        def reparse(document, source):
+            source = normalize(source)
+            old = document.source
+            if document.root is None:
+                return parse_document(source)
+            if source == old:
+                return document
+            prefix = common_prefix(old, source)
+            suffix = common_suffix(old, source, min(len(old), len(source)) - prefix)
+            try:
+                value, root = update(document.root, old, source, 0, len(old),
+                                     len(source), prefix, suffix)
+            except (RSONDecodeError, Changed):
+                return parse_document(source)
+            return Document(value, source, root, reparse)
+
+        return parse_document
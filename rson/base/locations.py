@@ -0,0 +1,90 @@
+'''
+Source location maps for RSON
+
+Copyright (c) 2010, Patrick Maupin.  All rights reserved.
+
+See http://code.google.com/p/rson/source/browse/trunk/license.txt
+
+'''
+
+from bisect import bisect
+
+
+class LocationMap(object):
+    ''' Maps the path of each value in a parse result (a tuple of
+        dict keys and list indices) to its zero-based offset in
+        the source.  Dict entries are located at their key, and
+        list elements at their first token.
+
+        The parser just records where each value was added to its
+        container; the paths are worked out the first time the map
+        is used.  Line and column numbers are looked up on demand
+        from an index of line start offsets.  (For load_path(),
+        offsets and columns are in bytes.)
+    '''
+
+    def __init__(self, value, records, linestarts):
+        self.value = value
+        self.records = records
+        self.linestarts = linestarts
+        self.offsets = None
+
+    def getoffsets(self):
+        offsets = self.offsets
+        if offsets is None:
+            offsets = self.offsets = self.walk(self.value, self.records)
+            self.value = self.records = None
+        return offsets
+
+    @staticmethod
+    def walk(value, records):
+        ''' records is a list of (container, path suffix, offset, value)
+            for every value that was added to a container.  Walk them
+            starting at the top value to find the full paths.
+        '''
+        children = {}
+        for record in records:
+            children.setdefault(id(record[0]), []).append(record)
+        offsets = {}
+        pending = [((), value)]
+        while pending:
+            path, container = pending.pop()
+            for record in children.get(id(container), ()):
+                if record[0] is not container:
+                    break
+                suffix, offset, value = record[1:]
+                for i in range(1, len(suffix)):
+                    offsets.setdefault(path + suffix[:i], offset)
+                subpath = path + suffix
+                offsets[subpath] = offset
+                if id(value) in children:
+                    pending.append((subpath, value))
+        return offsets
+
+    def __getitem__(self, path):
+        return self.getoffsets()[path]
+
+    def __contains__(self, path):
+        return path in self.getoffsets()
+
+    def __iter__(self):
+        return iter(self.getoffsets())
+
+    def __len__(self):
+        return len(self.getoffsets())
+
+    def get(self, path, default=None):
+        return self.getoffsets().get(path, default)
+
+    def line(self, path):
+        return bisect(self.linestarts, self[path])
+
+    def col(self, path):
+        return self.position(path)[2]
+
+    def position(self, path):
+        ''' Return (offset, line, col) for a path
+        '''
+        offset = self[path]
+        line = bisect(self.linestarts, offset)
+        return offset, line, offset - self.linestarts[line - 1] + 1
@@ -0,0 +1,154 @@
+'''
+Numeric arrays for RSON.
+
+Copyright (c) 2010, Patrick Maupin.  All rights reserved.
+
+See http://code.google.com/p/rson/source/browse/trunk/license.txt
+'''
+
+import re
+from array import array
+
+from rson.base.unquoted import UnquotedToken
+
+# The numbers that the stock unquoted parser reads the same way
+# that int() and float() do.  Anything else (hex, underscores,
+# zero-filled integers) is left to the unquoted parser.
+int_text = r'[-+]?(?:0|[1-9][0-9]*)'
+float_text = r'[-+]?(?:(?:[0-9]+\.[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?|[0-9]+[eE][-+]?[0-9]+)'
+number_text = '(?:%s|%s)' % (float_text, int_text)
+
+# These remove the numbers from the texts joined by commas, so
+# nothing is left if they are all numbers.  (Matching the whole
+# list with one pattern would keep a backtracking entry for every
+# number.)
+remove_ints = re.compile(r'%s(?:,|\Z)' % int_text).sub
+remove_numbers = re.compile(r'%s(?:,|\Z)' % number_text).sub
+
+
+class NumericArrays(object):
+    ''' Builds the functions for the numeric_arrays option, which
+        is 'array' (or True), 'numpy', or None.  When it is 'array',
+        lists that hold only ints come back as
+        array('q') and lists that hold only ints and floats come
+        back as array('d') (lists of them stay lists).  When it is
+        'numpy', they come back as int64 and float64 ndarrays, and
+        lists of ndarrays of the same shape are stacked into one.
+        Empty lists, and lists with anything else in them (or ints
+        too large for int64), stay lists.
+
+        A bracketed array of numbers that the JSON decoder has not
+        read is converted from the token texts all at once, and the
+        rest of the result is converted when the parse is done.
+    '''
+
+    numeric_arrays = None
+
+    def numeric_maker(self):
+        ''' Return make(typecode, values), which builds an array of
+            ints ('q') or floats ('d') from a list or an iterator.
+        '''
+        kind = self.numeric_arrays
+        if kind == 'array' or kind is True:
+            return array
+        if kind != 'numpy':
+            raise ValueError("numeric_arrays must be 'array' (or True), 'numpy' or None, not %r"
+                             % (kind,))
+        import numpy
+        dtypes = dict(q=numpy.int64, d=numpy.float64)
+        fromiter = numpy.fromiter
+
+        def make(typecode, values):
+            return fromiter(values, dtypes[typecode])
+        return make
+
+    def numbers_factory(self, locating):
+        ''' Return read_numbers(firsttok, next), which reads a
+            bracketed array starting at firsttok, if it only holds
+            numbers, and returns a list holding the array.  Otherwise
+            it puts the tokens back, and returns an empty list.
+
+            Returns None if the option is off, or the numbers might
+            not be read the same way as by the unquoted parser.
+        '''
+        cls = type(self)
+        if (not self.numeric_arrays or locating or self.schema is not None
+                or self.user_defined_unquoted or self.use_decimal or self.array_hook is not None
+                or self.unquoted_pattern != UnquotedToken.unquoted_pattern
+                or cls.parse_int is not UnquotedToken.parse_int
+                or cls.parse_float is not UnquotedToken.parse_float):
+            return None
+        make = self.numeric_maker()
+
+        def read_numbers(firsttok, next):
+            read = []
+            append = read.append
+            while 1:
+                token = next()
+                append(token)
+                if token[1] != 'X':
+                    break
+                token = next()
+                append(token)
+                if token[1] != ',':
+                    break
+            if token[1] == ']' and len(read) > 1 and read[-2][1] == 'X':
+                texts = [x[2] for x in read[::2]]
+                joined = ','.join(texts)
+                try:
+                    if not remove_ints('', joined):
+                        return [make('q', map(int, texts))]
+                    if not remove_numbers('', joined):
+                        return [make('d', map(float, texts))]
+                except OverflowError:
+                    pass
+            push = firsttok[-1].push
+            read.reverse()
+            for token in read:
+                push(token)
+            return []
+
+        return read_numbers
+
+    def numeric_factory(self, post_parse, isinstance=isinstance, type=type):
+        ''' Return a post_parse function that calls post_parse and
+            then converts the lists of numbers in the result.  Dicts
+            and lists are changed in place.
+        '''
+        if self.frozen:
+            raise ValueError('numeric_arrays cannot be used with frozen')
+        make = self.numeric_maker()
+        ints = frozenset([int, type(1 << 64)])
+        numbers = ints | frozenset([float])
+        stack = self.numeric_arrays == 'numpy'
+        if stack:
+            import numpy
+            ndarray, combine = numpy.ndarray, numpy.array
+
+        def convert(value):
+            if type(value) is list:
+                if not value:
+                    return value
+                types = set(map(type, value))
+                if types <= numbers:
+                    try:
+                        return make('q' if types <= ints else 'd', value)
+                    except OverflowError:
+                        return value
+                for index, item in enumerate(value):
+                    if isinstance(item, (list, dict)):
+                        value[index] = convert(item)
+                if stack and type(value[0]) is ndarray:
+                    shape = value[0].shape
+                    if all(type(x) is ndarray and x.shape == shape for x in value):
+                        return combine(value)
+            elif isinstance(value, dict):
+                for key, item in dict.items(value):
+                    if isinstance(item, (list, dict)):
+                        value[key] = convert(item)
+            return value
+
+        def numeric_post_parse(tokens, value):
+            return convert(post_parse(tokens, value))
+
+        return numeric_post_parse
@@ -0,0 +1,181 @@
+'''
+Parsing one large document with a pool of worker processes.
+
+Copyright (c) 2010, Patrick Maupin.  All rights reserved.
+
+See http://code.google.com/p/rson/source/browse/trunk/license.txt
+'''
+
+import multiprocessing
+
+from rson.base.tokenizer import RSONDecodeError, normalize
+from rson.base.parser import RsonParser
+from rson.base.dispatcher import _alter_attributes
+from rson.base.bulk import ProcessPoolExecutor
+
+# The parsers each worker process has built, keyed by class and options
+parsers = {}
+
+def parse_part(system, options, text):
+    ''' Read the top-level entries in a part of a document, in a
+        worker process.  Return None if they could not be read.
+    '''
+    key = system, repr(sorted(options.items()))
+    parse = parsers.get(key)
+    if parse is None:
+        parse = parsers[key] = _alter_attributes(system, options)().parser_factory()
+    try:
+        return parse.read_part(text)
+    except RSONDecodeError:
+        return None
+
+def find_splits(source, parts):
+    ''' Return the offsets of up to parts - 1 lines that start at
+        column 0, spread out over the source.  Lines inside triple-
+        quoted strings are skipped, and so are lines that look like
+        they are inside brackets (after a line ending in ",", "[" or
+        "{", or starting with "]" or "}").  This is just a guess;
+        the parts are checked when they are read.
+    '''
+    splits = [0]
+    size = len(source)
+    for i in range(1, parts):
+        pos = max(size * i // parts, splits[-1] + 1)
+        while 1:
+            pos = source.find('\n', pos) + 1
+            if not pos or pos >= size:
+                return splits[1:]
+            if source[pos] in ' \t\v\f\n#]},':
+                continue
+            end = pos - 1
+            while end and source[end - 1] in ' \t\v\f\n':
+                end -= 1
+            if source[end - 1:end] in (',', '[', '{'):
+                continue
+            if source.count('"""', splits[-1], pos) % 2:
+                pos = source.find('"""', pos)
+                if pos < 0:
+                    return splits[1:]
+                continue
+            break
+        splits.append(pos)
+    return splits[1:]
+
+
+class ParallelParser(object):
+    ''' Builds loads_parallel(), which splits a document at lines
+        that start at column 0, reads the top-level entries (or
+        elements) of each part in a worker process, and puts them
+        together the way step_dict() (or step_array())
+        would have, so repeated keys are merged the same way.
+
+        Each part after the first must start at a top-level entry.
+        That is only known for sure once the part before it has
+        been read without an error, so if any part cannot be read
+        (or the parts do not agree on whether the document is a dict
+        or an array), the whole document is parsed again by this
+        process.  This also makes any error message the same as the
+        one loads() would give, with the right line numbers.
+    '''
+
+    def parallel_factory(self, parse_locals):
+        ''' Return the loads_parallel() function for a parser, given
+            the locals of its parser_factory().  Also sets read_part()
+            on the parser, for the workers, and merge_parts() to put
+            their results together.
+        '''
+        env = parse_locals
+        parse = env['parse']
+        tokenizer = env['tokenizer']
+        client_info = env['client_info']
+        rson_value_dispatch = env['rson_value_dispatch']
+        rson_key_dispatch = env['rson_key_dispatch']
+        bad_top_value = env['bad_top_value']
+        bad_unindent = env['bad_unindent']
+        block_is_array = env['block_is_array']
+        block_ended = env['block_ended']
+        read_entry = env['read_entry']
+        parse_steps = env['parse_steps']
+        step_array = env['step_array']
+        new_object, new_array = env['new_object'], env['new_array']
+        disallow_missing_object_keys = env['disallow_missing_object_keys']
+        supported = not (env['with_locations'] or env['select_tokens'] or
+                         env['check_schema'] or env['keep_source'] or
+                         env['post_parse'] is not RsonParser.post_parse)
+        cls = type(self)
+        system = cls.unaltered_class or cls
+        options = cls.altered_attributes
+
+        def read_part(text):
+            ''' Read the top-level values in text, deciding whether
+                it is an array or a dict like step_block() does.
+                Return (is_array, values), where the values are array
+                elements or dict entries.
+            '''
+            tokens = tokenizer(text, None)
+            tokens.stringcache = {}.setdefault
+            tokens.client_info = client_info
+            tokens.json_failed = 0
+            next = tokens.next
+            firsttok = next()
+            if firsttok[4] != '\n':
+                bad_unindent(firsttok, next)
+            value = rson_value_dispatch(firsttok[1], bad_top_value)(firsttok, next)
+            token = next()
+            if block_is_array(firsttok, value, token):
+                values, token = parse_steps(step_array([firsttok], next, token, [value]))
+                return True, values
+            values = []
+            stack = [firsttok]
+            token = read_entry(stack, next, token, [value], values)
+            while not block_ended(token, next, '\n'):
+                key = rson_key_dispatch(token[1], bad_top_value)(token, next)
+                stack[-1] = token
+                token = read_entry(stack, next, next(), [key], values)
+            return False, values
+
+        def loads_parallel(source, workers=None):
+            if workers is None:
+                workers = multiprocessing.cpu_count()
+            if not supported or ProcessPoolExecutor is None or workers < 2:
+                return parse(source)
+            source = normalize(source)
+            splits = [0] + find_splits(source, workers * 4) + [len(source)]
+            if len(splits) < 3:
+                return parse(source)
+            pool = ProcessPoolExecutor(workers)
+            try:
+                parts = list(pool.map(parse_part, [system] * (len(splits) - 1),
+                                      [options] * (len(splits) - 1),
+                                      [source[a:b] for a, b in zip(splits, splits[1:])]))
+            finally:
+                pool.shutdown()
+
+            merged = None not in parts and merge_parts(parts)
+            if not merged:
+                return parse(source)
+            return merged[0]
+
+        def merge_parts(parts):
+            ''' Put the (is_array, values) results of read_part()
+                together.  Returns a list holding the value, or an
+                empty list if the parts do not agree on whether the
+                document is an array.
+            '''
+            if len(set(x[0] for x in parts)) != 1:
+                return []
+            if parts[0][0]:
+                value = new_array([x for part in parts for x in part[1]], None)
+                if (len(value) == 1 and isinstance(value, list)
+                        and disallow_missing_object_keys):
+                    value = value[0]
+                return [value]
+            value = new_object()
+            for part in parts:
+                for entry in part[1]:
+                    value.append(entry)
+            return [value.get_result(None)]
+
+        parse.read_part = read_part
+        parse.merge_parts = merge_parts
+        return loads_parallel
@@ -6,7 +6,29 @@ Copyright (c) 2010, Patrick Maupin.  All rights reserved.
 See http://code.google.com/p/rson/source/browse/trunk/license.txt
 '''
 
+import sys
+import re
+import gc
+import mmap
+import json
 from rson.py23 import basestring
+from rson.base.locations import LocationMap
+from rson.base.unquoted import UnquotedToken
+from rson.base.doublequoted import QuotedToken
+
+def gc_suspended(func, isenabled=gc.isenabled, disable=gc.disable, enable=gc.enable):
+    ''' Return a function that calls func with the cyclic garbage
+        collector turned off, if it was on.
+    '''
+    def suspended(*args):
+        if not isenabled():
+            return func(*args)
+        disable()
+        try:
+            return func(*args)
+        finally:
+            enable()
+    return suspended
 
 class RsonParser(object):
     ''' Parser for RSON
@@ -23,17 +45,136 @@ class RsonParser(object):
     # This can be '"' or None
     rson_quote_delimiter = '"'
 
+    # Number of characters read at a time by load()
+    stream_chunk_size = 65536
+
+    # Set this true to tokenize on demand instead of all at once.
+    # (This is always done when bracketed regions are delegated
+    # to the JSON scanner, so that they are never tokenized.)
+    lazy_tokens = False
+
+    # Set this true to keep the tokens in a compact table of arrays
+    # instead of a list of tuples
+    compact_tokens = False
+
+    # Set this true to return a (result, LocationMap) tuple,
+    # giving the source location of every value in the result.
+    with_locations = False
+
+    # Set this false to always parse bracketed regions token by
+    # token, rather than trying the stdlib JSON scanner on them.
+    delegate_json = True
+
+    # Set this true to keep the values being parsed on an explicit
+    # stack instead of recursing, so that the nesting depth is only
+    # limited by memory.
+    iterative_parser = False
+
+    # Set this true to turn off the cyclic garbage collector while
+    # parsing, so that it does not keep scanning the objects being
+    # built.  (It is turned back on afterwards, even if another
+    # thread turned it off in the meantime.)
+    suspend_gc = False
+
     @staticmethod
     def post_parse(tokens, value):
         return value
 
+    def json_region_factory(self, new_object):
+        ''' Return a function that tries to decode the bracketed region
+            starting at a given token with json.JSONDecoder.raw_decode,
+            and skips the tokens inside it.  The function returns a
+            list holding the value, or an empty list if the region is
+            not strict JSON (so the caller should parse it normally).
+
+            Returns None if this configuration does not decode JSON
+            exactly the same way the stdlib does.
+        '''
+        cls = type(self)
+        special = self.special_strings
+        stock = dict(true=True, false=False, null=None)
+        if (not self.delegate_json or self.with_locations or self.user_defined_unquoted
+                or self.schema_located
+                or self.array_hook is not None or self.create_raw_objects
+                or self.unquoted_pattern != UnquotedToken.unquoted_pattern
+                or sorted(special) != sorted(stock)
+                or [x for x in stock if special[x] is not stock[x]]
+                or [x for x in ('quoted_splitter', 'quoted_mapper', 'parse_quoted_str',
+                                'parse_encoded_chr', 'parse_join_str')
+                        if getattr(cls, x) is not getattr(QuotedToken, x)]):
+            return None
+
+        def pairs_hook(pairs):
+            result = new_object()
+            append = result.append
+            for key, value in pairs:
+                append([key, value])
+            return result.get_result(None)
+
+        def parse_constant(s):
+            raise ValueError(s)
+
+        parse_float = self.parse_float
+        if self.use_decimal:
+            from decimal import Decimal
+            parse_float = Decimal
+
+        raw_decode = json.JSONDecoder(
+            object_pairs_hook=pairs_hook,
+            parse_float=parse_float,
+            parse_int=self.parse_int,
+            parse_constant=parse_constant,
+            strict=True).raw_decode
+
+        # The stdlib keeps unpaired surrogates that the RSON
+        # string parser rejects or combines differently.
+        surrogate = re.compile(r'\\u[dD][89abAB]').search
+
+        def read_json_region(firsttok):
+            tokens = firsttok[-1]
+            start = -firsttok[0]
+            if not tokens.skippable or start < tokens.json_failed:
+                return []
+            source = tokens.source
+
+            # The decoder counts the lines before the place it fails,
+            # so rather than the whole source it is given the text up
+            # to a line end, and then sixteen times as much at a time
+            # if it needs more.  No JSON token can span a line end, so
+            # a failure before the end of the text is a failure for
+            # the whole source too.
+            end = start
+            while 1:
+                end = source.find('\n', end + 15 * (end - start)) + 1 or len(source)
+                text = source[start:end]
+                try:
+                    value, end = raw_decode(text)
+                    break
+                except (ValueError, RuntimeError):
+                    pos = getattr(sys.exc_info()[1], 'pos', 0)
+                    if pos < len(text) or end == len(source):
+                        tokens.json_failed = start + pos
+                        return []
+            end += start
+            if surrogate(source, start, end):
+                return []
+            tokens.skip_to(firsttok, end)
+            return [value]
+
+        return read_json_region
+
     def client_info(self, parse_locals):
         pass
 
     def parser_factory(self, len=len, type=type, isinstance=isinstance, list=list, basestring=basestring):
 
+        # The tokenizers skip over the contents of "=" blocks
         Tokenizer = self.Tokenizer
-        tokenizer = Tokenizer.factory()
+        equals = self.rson_substring_delimiter
+        streamer = Tokenizer.stream_factory(equals)
+        mapper = Tokenizer.mapped_factory(equals)
+        keep_source = self.user_defined_unquoted
+        stream_chunk_size = self.stream_chunk_size
         error = Tokenizer.error
 
         read_unquoted = self.unquoted_parse_factory()
@@ -45,6 +186,10 @@ class RsonParser(object):
         key_handling = [disallow_missing_object_keys, self.disallow_multiple_object_keys]
         disallow_nonstring_keys = self.disallow_nonstring_keys
         post_parse = self.post_parse
+        if self.numeric_arrays:
+            post_parse = self.numeric_factory(post_parse)
+        if self.frozen:
+            post_parse = self.freeze_factory(post_parse)
         rson_quote_delimiter = self.rson_quote_delimiter
         rson_subelement_delimiter = self.rson_subelement_delimiter
         rson_substring_delimiter = self.rson_substring_delimiter
@@ -52,6 +197,36 @@ class RsonParser(object):
         rson_start_list, rson_end_list = (None, None) if self.disallow_rson_sublists else '[]'
         rson_start_dict, rson_end_dict = (None, None) if self.disallow_rson_subdicts else '{}'
         rson_normal_ch = 'X'
+        read_json_region = self.json_region_factory(new_object)
+
+        # The regions the JSON decoder reads are skipped rather than
+        # tokenized, so then the source is tokenized on demand.
+        if self.compact_tokens:
+            tokenizer = Tokenizer.compact_factory(equals)
+        elif self.lazy_tokens or read_json_region is not None:
+            tokenizer = Tokenizer.lazy_factory(equals)
+        else:
+            tokenizer = Tokenizer.factory(equals)
+        with_locations = self.with_locations
+        check_schema, finish_schema = self.schema_factory(error)
+        schema_located = check_schema is not None and self.schema_located
+        check_top = None if schema_located else check_schema
+        locating = with_locations or schema_located
+        read_numbers = self.numbers_factory(locating)
+        iterative_parser = self.iterative_parser
+        generator = type((x for x in ()))
+
+        def locate(container, suffix, token, value):
+            token[-1].located.append((container, suffix, -token[0], value))
+
+        if schema_located:
+            if with_locations:
+                record = locate
+                def locate(container, suffix, token, value):
+                    record(container, suffix, token, value)
+                    check_schema(container, suffix, token, value)
+            else:
+                locate = check_schema
 
         def bad_array_element(token, next):
             error('Expected array element', token)
@@ -71,7 +246,32 @@ class RsonParser(object):
         def bad_indent(token, next):
             error('Unexpected indentation', token)
 
+        def bad_element(token, next):
+            if token[1] in rson_subdelimiter:
+                error('Cannot mix list elements with dict (key/value) elements', token)
+            error('Array elements must either be on separate lines or enclosed in []', token)
+
+        def bad_close(token, firsttok):
+            ''' Report the token after an element of the bracketed
+                value at firsttok, which is not "," or its close.
+            '''
+            if firsttok[1] == '[':
+                if token[1] == '@':
+                    error('Unterminated list (no matching "]")', firsttok)
+                error('Expected "," or "]"', token)
+            if token[1] == '@':
+                error('Unterminated dict (no matching "}")', firsttok)
+            error('Expected "," or "}"', token)
+
         def read_json_array(firsttok, next):
+            if read_json_region is not None:
+                found = read_json_region(firsttok)
+                if found:
+                    return found[0]
+            if read_numbers is not None:
+                found = read_numbers(firsttok, next)
+                if found:
+                    return found[0]
             result = new_array([], firsttok)
             append = result.append
             while 1:
@@ -82,18 +282,33 @@ class RsonParser(object):
                         error('Unexpected trailing comma', token)
                     break
                 append(json_value_dispatch(t0,  bad_array_element)(token, next))
+                if locating:
+                    locate(result, (len(result) - 1,), token, result[-1])
                 delim = next()
                 t0 = delim[1]
                 if t0 == ',':
                     continue
                 if t0 != ']':
-                    if t0 == '@':
-                        error('Unterminated list (no matching "]")', firsttok)
-                    error('Expected "," or "]"', delim)
+                    bad_close(delim, firsttok)
                 break
             return result
 
+        def read_json_key(token, next):
+            ''' Read a key in a bracketed dict, and the ":" after it.
+            '''
+            key = json_value_dispatch(token[1], bad_dict_key)(token, next)
+            if disallow_nonstring_keys and not isinstance(key, basestring):
+                error('Non-string key %s not supported' % repr(key), token)
+            token = next()
+            if token[1] != ':':
+                error('Expected ":" after dict key %s' % repr(key), token)
+            return key
+
         def read_json_dict(firsttok, next):
+            if read_json_region is not None:
+                found = read_json_region(firsttok)
+                if found:
+                    return found[0]
             result = new_object()
             append = result.append
             while 1:
@@ -103,25 +318,20 @@ class RsonParser(object):
                     if result and disallow_trailing_commas:
                         error('Unexpected trailing comma', token)
                     break
-                key = json_value_dispatch(t0, bad_dict_key)(token, next)
-                if disallow_nonstring_keys and not isinstance(key, basestring):
-                    error('Non-string key %s not supported' % repr(key), token)
-                token = next()
-                t0 = token[1]
-                if t0 != ':':
-                    error('Expected ":" after dict key %s' % repr(key), token)
+                key = read_json_key(token, next)
+                keytok = token
                 token = next()
                 t0 = token[1]
                 value = json_value_dispatch(t0, bad_dict_value)(token, next)
                 append([key, value])
+                if locating:
+                    locate(result, (key,), keytok, value)
                 delim = next()
                 t0 = delim[1]
                 if t0 == ',':
                     continue
                 if t0 != '}':
-                    if t0 == '@':
-                        error('Unterminated dict (no matching "}")', firsttok)
-                    error('Expected "," or "}"', delim)
+                    bad_close(delim, firsttok)
                 break
             return result.get_result(firsttok)
 
@@ -144,6 +354,86 @@ class RsonParser(object):
             result[2] = ''.join(s)
             return read_unquoted(result, next)
 
+        def read_json_nested(firsttok, next):
+            ''' Works like read_json_array() and read_json_dict(), but
+                saves the state of the enclosing arrays and dicts on a
+                list of frames, rather than recursing for each nested one.
+                bad is the error for a bad value, which also tells whether
+                a dict is waiting for a key or for a value.
+            '''
+            frames = []
+            result = close = bad = key = elemtok = None
+            token = firsttok
+            while 1:
+                # Start reading a value at token
+                t0 = token[1]
+                if t0 != '[' and t0 != '{':
+                    value = json_value_dispatch(t0, bad)(token, next)
+                else:
+                    found = read_json_region is not None and read_json_region(token)
+                    if not found and read_numbers is not None and t0 == '[':
+                        found = read_numbers(token, next)
+                    if found:
+                        value = found[0]
+                        if result is None:
+                            return value
+                    else:
+                        frames.append((firsttok, result, close, bad, key, elemtok))
+                        firsttok = token
+                        if t0 == '[':
+                            result, close, bad = new_array([], token), ']', bad_array_element
+                        else:
+                            result, close, bad = new_object(), '}', bad_dict_key
+                        token = next()
+                        if token[1] != close:
+                            elemtok = token
+                            continue
+                        value = result if close == ']' else result.get_result(firsttok)
+                        firsttok, result, close, bad, key, elemtok = frames.pop()
+                        if result is None:
+                            return value
+
+                # Add the value to its container, and close containers
+                # until there is another value to start reading
+                while 1:
+                    if bad is bad_dict_key:
+                        key = value
+                        if disallow_nonstring_keys and not isinstance(key, basestring):
+                            error('Non-string key %s not supported' % repr(key), elemtok)
+                        token = next()
+                        if token[1] != ':':
+                            error('Expected ":" after dict key %s' % repr(key), token)
+                        token = next()
+                        bad = bad_dict_value
+                        break
+                    if bad is bad_dict_value:
+                        result.append([key, value])
+                        if locating:
+                            locate(result, (key,), elemtok, value)
+                        bad = bad_dict_key
+                    else:
+                        result.append(value)
+                        if locating:
+                            locate(result, (len(result) - 1,), elemtok, result[-1])
+                    delim = next()
+                    t0 = delim[1]
+                    if t0 == ',':
+                        token = next()
+                        if token[1] != close:
+                            elemtok = token
+                            break
+                        if disallow_trailing_commas:
+                            error('Unexpected trailing comma', token)
+                    elif t0 != close:
+                        bad_close(delim, firsttok)
+                    value = result if close == ']' else result.get_result(firsttok)
+                    firsttok, result, close, bad, key, elemtok = frames.pop()
+                    if result is None:
+                        return value
+
+        if iterative_parser:
+            read_json_array = read_json_dict = read_json_nested
+
         json_value_dispatch = {rson_normal_ch:read_unquoted, '[':read_json_array,
                                '{': read_json_dict, '"':read_quoted}.get
 
@@ -171,46 +461,75 @@ class RsonParser(object):
         empty_array_type = type(empty_array)
         empties = empty_object, empty_array
 
-        def parse_recurse_array(stack, next, token, result):
-            arrayindent, linenum = stack[-1][4:6]
-            linenum -= not result
+        # The indented grammar is written once, as step_*() generators
+        # that yield a generator to read a nested block, and yield
+        # their result when they are done.  run_nested() runs them on
+        # the Python call stack, and run_steps() keeps the suspended
+        # callers on a list, so deep nesting does not recurse.  The
+        # plain functions they share are also used by the iterparse(),
+        # select and other readers, so they all read the same syntax.
+
+        def run_nested(steps):
+            send = steps.send
+            value = send(None)
+            while type(value) is generator:
+                value = send(run_nested(value))
+            return value
+
+        def run_steps(steps):
+            callers = []
+            send = steps.send
+            value = None
             while 1:
-                thisindent, newlinenum = token[4:6]
-                if thisindent != arrayindent:
-                    if thisindent < arrayindent:
-                        return result, token
-                    if result:
-                        stack.append(token)
-                        lastitem = result[-1]
-                        if lastitem == empty_array:
-                            result[-1], token = parse_recurse_array(stack, next, token, lastitem)
-                        elif lastitem == empty_object:
-                            result[-1], token = parse_recurse_dict(stack, next, token, lastitem)
-                        else:
-                            result = None
-                    if result:
-                        stack.pop()
-                        thisindent, newlinenum = token[4:6]
-                        if thisindent <= arrayindent:
-                            continue
-                        bad_unindent(token, next)
-                    bad_indent(token, next)
-                if newlinenum <= linenum:
-                    if token[1] in rson_subdelimiter:
-                        error('Cannot mix list elements with dict (key/value) elements', token)
-                    error('Array elements must either be on separate lines or enclosed in []', token)
-                linenum = newlinenum
-                value = rson_value_dispatch(token[1], bad_top_value)(token, next)
-                result.append(value)
-                token = next()
+                value = send(value)
+                if type(value) is generator:
+                    callers.append(send)
+                    send, value = value.send, None
+                elif callers:
+                    send = callers.pop()
+                else:
+                    return value
+
+        parse_steps = run_steps if iterative_parser else run_nested
 
-        def parse_one_dict_entry(stack, next, token, entry, mydict):
+        def block_is_array(firsttok, value, token):
+            ''' An indented block is an array if the value after its
+                first one is on a new line and either is at the same
+                indentation, or the first value is an empty [] or {}
+                that the line after it fills.
+            '''
+            return (token[5] != firsttok[5] and
+                    (token[4] <= firsttok[4] or value in empties) and
+                    disallow_missing_object_keys)
+
+        def block_ended(token, next, indent):
+            ''' Return true if token is unindented past the end of a
+                dict whose keys are at indent, or false if it starts
+                another key.
+            '''
+            thisindent = token[4]
+            if thisindent != indent:
+                if thisindent < indent:
+                    return True
+                bad_unindent(token, next)
+            return False
+
+        def read_keys(stack, next, token, entry, read=None):
+            ''' Read the keys chained after the key in entry, and the
+                value after the last one (or after "=") on the same
+                line, with read(token, next) if it is given.  Return
+                the token after them, which starts the value's block
+                if it is indented more than the key.
+            '''
             arrayindent, linenum = stack[-1][4:6]
             while token[1] == rson_subelement_delimiter:
                 tok1 = next()
                 thisindent, newlinenum = tok1[4:6]
                 if newlinenum == linenum:
-                    value = rson_value_dispatch(tok1[1], bad_top_value)(tok1, next)
+                    if read is None:
+                        value = rson_value_dispatch(tok1[1], bad_top_value)(tok1, next)
+                    else:
+                        value = read(tok1, next)
                     token = next()
                     entry.append(value)
                     continue
@@ -221,24 +540,32 @@ class RsonParser(object):
             if not entry:
                 error('Expected key', token)
 
-            thisindent, newlinenum = token[4:6]
-            if newlinenum == linenum and token[1] == rson_substring_delimiter:
-                value = rson_value_dispatch(token[1], bad_top_value)(token, next)
+            if token[5] == linenum and token[1] == rson_substring_delimiter:
+                if read is None:
+                    value = rson_value_dispatch(token[1], bad_top_value)(token, next)
+                else:
+                    value = read(token, next)
                 entry.append(value)
                 token = next()
-            elif thisindent > arrayindent:
-                stack.append(token)
-                value, token = parse_recurse(stack, next)
-                if entry[-1] in empties:
-                    if type(entry[-1]) is type(value):
-                        entry[-1] = value
-                    else:
-                        error('Cannot load %s into %s' % (type(value), type(entry[-1])), stack[-1])
-                elif len(value) == 1 and type(value) is empty_array_type:
-                    entry.extend(value)
+            return token
+
+        def add_block(entry, value, blocktok):
+            ''' Add the value of an indented block to a dict entry,
+                filling an empty [] or {} at the end of it, and
+                unwrapping an array of one element.
+            '''
+            last = entry[-1]
+            if last in empties:
+                if type(last) is type(value):
+                    entry[-1] = value
                 else:
-                    entry.append(value)
-                stack.pop()
+                    error('Cannot load %s into %s' % (type(value), type(last)), blocktok)
+            elif len(value) == 1 and type(value) is empty_array_type:
+                entry.extend(value)
+            else:
+                entry.append(value)
+
+        def check_entry(entry, token):
             length = len(entry)
             if length != 2  and key_handling[length > 2]:
                 if length < 2:
@@ -250,66 +577,189 @@ class RsonParser(object):
                 for key in entry[:-1]:
                     if not isinstance(key, basestring):
                         error('Non-string key %s not supported' % repr(key), token)
+
+        def add_entry(stack, token, entry, mydict):
+            if len(entry) != 2 or disallow_nonstring_keys and not isinstance(entry[0], basestring):
+                check_entry(entry, token)
+            if locating and len(entry) > 1:
+                locate(mydict, tuple(entry[:-1]), stack[-1], entry[-1])
+            if check_top is not None and len(stack) == 1:
+                check_top(mydict, tuple(entry[:-1]), stack[-1], entry[-1])
             mydict.append(entry)
+
+        def read_entry(stack, next, token, entry, mydict):
+            ''' Read a whole dict entry, whose key is in entry, and
+                add it to mydict.  Return the token after it.
+            '''
+            token = read_keys(stack, next, token, entry)
+            if token[4] > stack[-1][4]:
+                stack.append(token)
+                value, token = parse_steps(step_block(stack, next))
+                add_block(entry, value, stack.pop())
+            add_entry(stack, token, entry, mydict)
             return token
 
-        def parse_recurse_dict(stack, next, token, result):
-            arrayindent = stack[-1][4]
+        def step_array(stack, next, token, result):
+            arrayindent, linenum = stack[-1][4:6]
+            linenum -= not result
             while 1:
                 thisindent = token[4]
                 if thisindent != arrayindent:
                     if thisindent < arrayindent:
-                        return result.get_result(token), token
-                    bad_unindent(token, next)
-                key = rson_key_dispatch(token[1], bad_top_value)(token, next)
-                stack[-1] = token
-                token = parse_one_dict_entry(stack, next, next(), [key], result)
-
-        def parse_recurse(stack, next, tokens=None):
-            ''' parse_recurse ALWAYS returns a list or a dict.
-                (or the user variants thereof)
-                It is up to the caller to determine that it was an array
-                of length 1 and strip the contents out of the array.
+                        yield result, token
+                    stack.append(token)
+                    result[-1], token = yield step_fill(stack, next, token,
+                                                        result[-1] if result else None)
+                    stack.pop()
+                    if token[4] > arrayindent:
+                        bad_unindent(token, next)
+                    continue
+                newlinenum = token[5]
+                if newlinenum <= linenum:
+                    bad_element(token, next)
+                linenum = newlinenum
+                value = rson_value_dispatch(token[1], bad_top_value)(token, next)
+                result.append(value)
+                if locating:
+                    locate(result, (len(result) - 1,), token, value)
+                token = next()
+
+        def step_dict(stack, next, token, result, entry=None):
+            ''' entry is the first entry, if its key has been read.
+            '''
+            arrayindent = stack[-1][4]
+            while 1:
+                if entry is None:
+                    if token[4] != arrayindent and block_ended(token, next, arrayindent):
+                        yield result.get_result(token), token
+                    entry = [rson_key_dispatch(token[1], bad_top_value)(token, next)]
+                    stack[-1] = token
+                    token = next()
+                token = read_keys(stack, next, token, entry)
+                if token[4] > arrayindent:
+                    stack.append(token)
+                    value, token = yield step_block(stack, next)
+                    add_block(entry, value, stack.pop())
+                add_entry(stack, token, entry, result)
+                entry = None
+
+        def step_fill(stack, next, token, last):
+            ''' Return the steps that read the indented block at token
+                into last, which must be an empty [] or {}.
+            '''
+            if last == empty_array:
+                return step_array(stack, next, token, last)
+            if last == empty_object:
+                return step_dict(stack, next, token, new_object())
+            bad_indent(token, next)
+
+        def step_block(stack, next, tokens=None):
+            ''' Read the first value of the indented block at stack[-1],
+                and return the steps that read the rest of it.  They
+                ALWAYS give a list or a dict (or the user variants
+                thereof); it is up to the caller to determine that it
+                was an array of length 1 and strip the contents out of
+                the array.
             '''
             firsttok = stack[-1]
             value = rson_value_dispatch(firsttok[1], bad_top_value)(firsttok, next)
-
-            # We return an array if the next value is on a new line and either
-            # is at the same indentation, or the current value is an empty list
-
             token = next()
-            if (token[5] != firsttok[5] and
-                    (token[4] <= firsttok[4] or
-                     value in empties) and disallow_missing_object_keys):
+            if block_is_array(firsttok, value, token):
                 result = new_array([value], firsttok)
+                if locating:
+                    locate(result, (0,), firsttok, value)
                 if tokens is not None:
                     tokens.top_object = result
-                return parse_recurse_array(stack, next, token, result)
-
-            # Otherwise, return a dict
+                return step_array(stack, next, token, result)
             result = new_object()
             if tokens is not None:
                 tokens.top_object = result
-            token = parse_one_dict_entry(stack, next, token, [value], result)
-            return parse_recurse_dict(stack, next, token, result)
+            return step_dict(stack, next, token, result, [value])
 
 
-        def parse(source):
-            tokens = tokenizer(source, None)
+        select_tokens = self.select is not None and self.select_factory(locals())
+
+        def parse_tokens(tokens):
             tokens.stringcache = {}.setdefault
             tokens.client_info = client_info
+            tokens.json_failed = 0
             next = tokens.next
-            value, token = parse_recurse([next()], next, tokens)
+            if with_locations:
+                tokens.located = []
+                tokens.track_lines()
+            if schema_located:
+                tokens.schema_records, tokens.top_object = [], None
+            if select_tokens:
+                value, token = select_tokens(next)
+            else:
+                value, token = parse_steps(step_block([next()], next, tokens))
             if token[1] != '@':
                 error('Unexpected additional data', token)
 
             # If it's a single item and we don't have a specialized
-            # object builder, just strip the outer list.
+            # object builder, just strip the outer list.  (The selection
+            # has already done this.)
             if (len(value) == 1 and isinstance(value, list)
-                   and disallow_missing_object_keys):
+                   and disallow_missing_object_keys and not select_tokens):
                 value = value[0]
-            return post_parse(tokens, value)
+            if check_schema is not None:
+                finish_schema(tokens, value)
+            if with_locations:
+                locations = LocationMap(value, tokens.located, tokens.linestarts())
+                tokens.located = None
+                value = post_parse(tokens, value), locations
+            else:
+                value = post_parse(tokens, value)
+
+            # The tokenizer refers to itself, so break the cycles that
+            # would keep it (and the source and result) around until
+            # the cyclic garbage collector runs
+            tokens.next = tokens.push = tokens.top_object = None
+            tokens.fill = tokens.skip_to = tokens.fork = None
+            return value
+
+        def parse(source):
+            return parse_tokens(tokenizer(source, None))
+
+        def load(fp, chunk_size=None):
+            return parse_tokens(streamer(fp, None, chunk_size or stream_chunk_size))
+
+        def load_path(path):
+            f = open(path, 'rb')
+            try:
+                try:
+                    source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except (ValueError, EnvironmentError):
+                    # Empty files (and some special files) can't be mapped
+                    source = f.read()
+            finally:
+                f.close()
+            try:
+                return parse_tokens(mapper(source, None))
+            finally:
+                # User-defined unquoted tokens may refer back to the
+                # source, so leave the mapping to be closed when they
+                # are garbage collected.
+                if not keep_source and not isinstance(source, bytes):
+                    source.close()
+
+        if check_top is not None:
+            parse, load, load_path = self.schema_wrappers(parse, load, load_path, error)
+
+        if self.suspend_gc:
+            parse = gc_suspended(parse)
+            load = gc_suspended(load)
+            load_path = gc_suspended(load_path)
+
+        parse.load = load
+        parse.load_path = load_path
 
         client_info = self.client_info(locals())
+        parse.iterparse = self.iterparse_factory(locals())
+        parse.iter_items = self.items_factory(locals())
+        parse.loads_lazy = self.proxy_factory(locals())
+        parse.parse_document = self.document_factory(locals())
+        parse.loads_parallel = self.parallel_factory(locals())
+        parse.push_parser = self.push_factory(locals())
 
         return parse
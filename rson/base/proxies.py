@@ -0,0 +1,243 @@
+'''
+Lazily parsed documents for RSON.
+
+Copyright (c) 2010, Patrick Maupin.  All rights reserved.
+
+See http://code.google.com/p/rson/source/browse/trunk/license.txt
+'''
+
+try:
+    from collections.abc import Mapping, Sequence
+except ImportError:
+    from collections import Mapping, Sequence
+
+from rson.py23 import basestring
+from rson.base.baseobjects import make_hashable
+
+
+class LazyObject(Mapping):
+    ''' A read-only dict whose values are parsed the first time
+        they are used, and then kept.  Like the default objects,
+        it allows attribute access to its contents.
+    '''
+
+    def __init__(self, entries, load):
+        # entries maps each key to the tokens its entries start at
+        self._entries = entries
+        self._load = load
+        self._cache = {}
+
+    def __getitem__(self, key):
+        cache = self._cache
+        if key in cache:
+            return cache[key]
+        value = cache[key] = self._load(key, self._entries[key])
+        return value
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __repr__(self):
+        return '<%s %s>' % (type(self).__name__, list(self._entries))
+
+
+class LazyArray(Sequence):
+    ''' A read-only list whose elements are parsed the first time
+        they are used, and then kept.
+    '''
+
+    def __init__(self, tokens, load):
+        # tokens holds the token each element starts at
+        self._tokens = tokens
+        self._load = load
+        self._cache = {}
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        tokens = self._tokens
+        token = tokens[index]
+        if index < 0:
+            index += len(tokens)
+        cache = self._cache
+        if index in cache:
+            return cache[index]
+        value = cache[index] = self._load(token)
+        return value
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def __eq__(self, other):
+        return isinstance(other, (list, LazyArray)) and list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '<%s of %d>' % (type(self).__name__, len(self))
+
+
+class ProxyLoader(object):
+    ''' Builds loads_lazy(), which makes one pass over the document
+        to find where each entry of the top-level dict (or element of
+        the top-level array) starts, without building anything.  It
+        returns a LazyObject or LazyArray that parses an entry from
+        there the first time it is used.  A dict (or an array) that
+        is an indented block is itself returned as a proxy, so deep
+        parts of the document are only parsed if they are used.
+
+        Values that are not indented blocks (strings, numbers and
+        bracketed values, chained keys, and blocks that fill an empty
+        [] or {}) are parsed whole when their entry is used.  The
+        first pass only checks the layout of the entries, so some
+        syntax errors are only found when the entry is used.
+    '''
+
+    LazyObject = LazyObject
+    LazyArray = LazyArray
+
+    def proxy_factory(self, parse_locals):
+        ''' Return the loads_lazy() function for a parser, given the
+            locals of its parser_factory().
+        '''
+        env = parse_locals
+        Tokenizer = env['Tokenizer']
+        lazy_tokenizer = Tokenizer.lazy_factory(env['equals'])
+        client_info = env['client_info']
+        error = env['error']
+        rson_value_dispatch = env['rson_value_dispatch']
+        rson_key_dispatch = env['rson_key_dispatch']
+        bad_top_value = env['bad_top_value']
+        bad_unindent = env['bad_unindent']
+        bad_element = env['bad_element']
+        block_is_array = env['block_is_array']
+        block_ended = env['block_ended']
+        read_keys = env['read_keys']
+        read_entry = env['read_entry']
+        parse_steps = env['parse_steps']
+        step_fill = env['step_fill']
+        new_object = env['new_object']
+        disallow_nonstring_keys = env['disallow_nonstring_keys']
+        rson_subelement_delimiter = env['rson_subelement_delimiter']
+        skip_json, skip_value, skip_lines = self.skip_factory(parse_locals)
+        LazyObject, LazyArray = self.LazyObject, self.LazyArray
+
+        def setup(tokens):
+            tokens.stringcache = {}.setdefault
+            tokens.client_info = client_info
+            tokens.json_failed = 0
+            return tokens.next
+
+        def skim(token, next):
+            ''' Skip a value for read_keys(), leaving the token after
+                it to be read next.
+            '''
+            token[-1].push(skip_value(token, next))
+
+        def scan(next, firsttok, unwrap):
+            ''' Find the entries of the indented block at firsttok, and
+                return a proxy for it and the token after it.  If unwrap
+                is true, an array with one element is unwrapped, as
+                read_entry() and parse_tokens() do.
+            '''
+            value = rson_value_dispatch(firsttok[1], bad_top_value)(firsttok, next)
+            token = next()
+            arrayindent, linenum = firsttok[4:6]
+            if block_is_array(firsttok, value, token):
+                elements = [firsttok]
+                while 1:
+                    token = skip_lines(token, next, linenum, arrayindent, True)
+                    if block_ended(token, next, arrayindent):
+                        break
+                    elements.append(token)
+                    linenum = token[5]
+                    token = skip_value(token, next)
+                    if token[5] == linenum and token[1] != '@':
+                        bad_element(token, next)
+                if unwrap and len(elements) == 1:
+                    return load_element(firsttok), token
+                return LazyArray(elements, load_element), token
+
+            entries = {}
+            key, keytok = value, firsttok
+            while 1:
+                if not isinstance(key, basestring):
+                    if disallow_nonstring_keys:
+                        error('Non-string key %s not supported' % repr(key), keytok)
+                    key = make_hashable(key)
+                entries.setdefault(key, []).append(keytok)
+
+                # Skip the entry the way read_entry() reads it
+                token = read_keys([keytok], next, token, [key], skim)
+                if token[4] > arrayindent:
+                    token = skip_lines(token, next, keytok[5], arrayindent, True)
+                if block_ended(token, next, arrayindent):
+                    break
+                keytok = token
+                key = rson_key_dispatch(token[1], bad_top_value)(token, next)
+                token = next()
+            return LazyObject(entries, load_entry), token
+
+        def load_entry(key, keytoks):
+            ''' Parse the entries for a key, and return its value
+            '''
+            if len(keytoks) == 1:
+                # A key followed by an indented block gets a proxy
+                next = setup(keytoks[0][-1].fork(keytoks[0]))
+                firsttok = next()
+                rson_key_dispatch(firsttok[1], bad_top_value)(firsttok, next)
+                token = next()
+                if token[1] == rson_subelement_delimiter:
+                    token = next()
+                    if token[5] != firsttok[5] and token[4] > firsttok[4]:
+                        value, token = scan(next, token, True)
+                        if token[4] > firsttok[4]:
+                            bad_unindent(token, next)
+                        return value
+            result = new_object()
+            for firsttok in keytoks:
+                next = setup(firsttok[-1].fork(firsttok))
+                firsttok = next()
+                key = rson_key_dispatch(firsttok[1], bad_top_value)(firsttok, next)
+                token = read_entry([firsttok], next, next(), [key], result)
+                if token[4] > firsttok[4]:
+                    bad_unindent(token, next)
+            return result.get_result(token)[key]
+
+        def load_element(firsttok):
+            ''' Parse an array element (and any block that fills it)
+            '''
+            next = setup(firsttok[-1].fork(firsttok))
+            firsttok = next()
+            value = rson_value_dispatch(firsttok[1], bad_top_value)(firsttok, next)
+            token = next()
+            if token[5] != firsttok[5] and token[4] > firsttok[4]:
+                value = parse_steps(step_fill([firsttok, token], next, token, value))[0]
+            return value
+
+        def loads_lazy(source):
+            tokens = lazy_tokenizer(source, None)
+            next = setup(tokens)
+            value, token = scan(next, next(), True)
+            if token[1] != '@':
+                error('Unexpected additional data', token)
+            return value
+
+        return loads_lazy
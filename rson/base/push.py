@@ -0,0 +1,162 @@
+'''
+Push-style incremental parsing for RSON.
+
+Copyright (c) 2010, Patrick Maupin.  All rights reserved.
+
+See http://code.google.com/p/rson/source/browse/trunk/license.txt
+'''
+
+import codecs
+
+from rson.py23 import special_unicode, basestring
+from rson.base.tokenizer import RSONDecodeError
+from rson.base.parser import RsonParser
+
+
+def last_split(source, start=0):
+    ''' Return the offset of the last line in source that starts
+        at column 0, after start, and looks like it starts a new
+        top-level entry, or 0 if there is none.  This uses the
+        same guesses as find_splits(); the part before it is
+        checked when it is read.
+    '''
+    end = len(source)
+    while 1:
+        pos = source.rfind('\n', start, end)
+        if pos < 0:
+            return 0
+        end = pos
+        pos += 1
+        if pos >= len(source) or source[pos] in ' \t\v\f\n#]},':
+            continue
+        last = pos - 1
+        while last and source[last - 1] in ' \t\v\f\n':
+            last -= 1
+        if source[last - 1:last] in (',', '[', '{'):
+            continue
+        if source.count('"""', 0, pos) % 2:
+            continue
+        return pos
+
+
+class PushParser(object):
+    ''' An incremental parser that is given the source a piece
+        at a time with feed(), and returns the result from close().
+
+        Whenever the text fed so far holds complete top-level
+        entries (or elements), they are read, so the work is done
+        while the rest of the data is still arriving, and close()
+        only has to read the last entry and put them together.
+        The text is split at lines that start in column 0, like
+        loads_parallel() does.  If a part cannot be read, because
+        the split was only a guess, more text is collected before
+        trying again.  Any errors are reported by close(), which
+        parses the whole source again to report them the same way
+        loads() would, so the source is kept until then.
+    '''
+
+    def __init__(self, read_part, merge_parts, parse, supported):
+        self._read_part = read_part
+        self._merge_parts = merge_parts
+        self._parse = parse
+        self._supported = supported
+        self._decode = None
+        self._held = ''
+        self._chunks = []
+        self._pending = ''
+        self._retry = 0
+        self._parts = []
+        self.closed = False
+
+    def _text(self, data, final=False):
+        ''' Return data as normalized text.  A \\r at the end is held
+            back, in case the next piece starts with \\n.
+        '''
+        if isinstance(data, special_unicode):
+            data = data.encode('utf-8', 'replace')
+        elif not isinstance(data, basestring):
+            if self._decode is None:
+                self._decode = codecs.getincrementaldecoder('utf-8')('replace').decode
+            data = self._decode(data, final)
+        data = self._held + data
+        self._held = ''
+        if data[-1:] == '\r' and not final:
+            data, self._held = data[:-1], '\r'
+        return data.replace('\r\n', '\n').replace('\r', '\n')
+
+    def feed(self, data):
+        ''' Add the next piece of the source, which may be bytes
+            (decoded as UTF-8) or text, and read any complete
+            top-level entries.
+        '''
+        if self.closed:
+            raise ValueError('feed() after close()')
+        text = self._text(data)
+        if not text:
+            return
+        self._chunks.append(text)
+        start = max(len(self._pending) - 1, 0)
+        pending = self._pending = self._pending + text
+        if not self._supported or len(pending) < self._retry:
+            return
+        split = last_split(pending, 0 if self._retry else start)
+        if not split:
+            return
+        try:
+            part = self._read_part(pending[:split])
+        except RSONDecodeError:
+            # Wait until there is twice as much text to try again
+            self._retry = 2 * len(pending)
+            return
+        self._parts.append(part)
+        self._pending = pending[split:]
+        self._retry = 0
+
+    def close(self):
+        ''' Return the parse result, raising RSONDecodeError if the
+            source is not valid.
+        '''
+        if self.closed:
+            raise ValueError('close() called twice')
+        self.closed = True
+        text = self._text(b'' if self._decode is not None else '', True)
+        if text:
+            self._chunks.append(text)
+            self._pending += text
+        parts = self._parts
+        if self._supported and self._pending.strip():
+            try:
+                parts.append(self._read_part(self._pending))
+            except RSONDecodeError:
+                parts = []
+        merged = parts and self._merge_parts(parts)
+        source = ''.join(self._chunks)
+        self._chunks = self._parts = None
+        self._pending = ''
+        if not merged:
+            return self._parse(source)
+        return merged[0]
+
+
+class PushLoader(object):
+    ''' Builds push_parser(), which returns a new PushParser for
+        the parser.
+    '''
+
+    def push_factory(self, parse_locals):
+        ''' Return the push_parser() function for a parser, given
+            the locals of its parser_factory().  This must be called
+            after parallel_factory(), which makes read_part().
+        '''
+        env = parse_locals
+        parse = env['parse']
+        read_part = parse.read_part
+        merge_parts = parse.merge_parts
+        supported = not (env['with_locations'] or env['select_tokens'] or
+                         env['check_schema'] or env['keep_source'] or
+                         env['post_parse'] is not RsonParser.post_parse)
+
+        def push_parser():
+            return PushParser(read_part, merge_parts, parse, supported)
+
+        return push_parser
@@ -0,0 +1,413 @@
+'''
+Schema validation for RSON, done while parsing.
+
+Copyright (c) 2010, Patrick Maupin.  All rights reserved.
+
+See http://code.google.com/p/rson/source/browse/trunk/license.txt
+'''
+
+import operator
+import re
+import sys
+from decimal import Decimal
+
+from rson.py23 import basestring, Mapping
+from rson.base.dispatcher import _alter_attributes
+
+# Keywords that only describe a schema
+annotations = set(['$schema', '$id', 'id', '$comment', 'title', 'description',
+                   'default', 'examples'])
+
+def is_integer(value):
+    return isinstance(value, (int, type(1 << 64))) and not isinstance(value, bool)
+
+def is_number(value):
+    return (isinstance(value, (int, type(1 << 64), float, Decimal))
+            and not isinstance(value, bool))
+
+def is_array(value):
+    return isinstance(value, (list, tuple))
+
+def is_string(value):
+    return isinstance(value, basestring)
+
+# For each type, the exact types that are known to match, and
+# a test for the others
+schema_types = {
+    'object': ((dict,), lambda value: isinstance(value, Mapping)),
+    'array': ((list,), is_array),
+    'string': ((str,), is_string),
+    'integer': ((int,), is_integer),
+    'number': ((int, float), is_number),
+    'boolean': ((bool,), lambda value: value is True or value is False),
+    'null': ((type(None),), lambda value: value is None),
+}
+
+def check_type(expected):
+    names = [expected] if isinstance(expected, basestring) else list(expected)
+    for name in names:
+        if name not in schema_types:
+            raise ValueError('Unsupported schema type %r' % (name,))
+    exact = frozenset(x for name in names for x in schema_types[name][0])
+    tests = [schema_types[x][1] for x in names]
+    message = 'expected %s' % ' or '.join(names)
+    def test(value):
+        if type(value) in exact:
+            return None
+        for ok in tests:
+            if ok(value):
+                return None
+        return message
+    return test
+
+def check_enum(options):
+    options = list(options)
+    message = 'expected one of %s' % ', '.join(repr(x) for x in options)
+    return lambda value: None if value in options else message
+
+def check_const(expected):
+    message = 'expected %r' % (expected,)
+    return lambda value: None if value == expected else message
+
+def check_limit(compare, message, kind, size=None):
+    ''' Return a factory for a test that compares a value of the
+        given type (or its size) with a limit.
+    '''
+    exact, applies = schema_types[kind]
+    exact = frozenset(exact)
+    def factory(limit):
+        text = message % (limit,)
+        if size is None:
+            def test(value):
+                if (type(value) in exact or applies(value)) and compare(value, limit):
+                    return text
+        else:
+            def test(value):
+                if (type(value) in exact or applies(value)) and compare(size(value), limit):
+                    return text
+        return test
+    return factory
+
+def check_pattern(pattern):
+    search = re.compile(pattern).search
+    message = 'expected a string matching %r' % (pattern,)
+    return lambda value: message if is_string(value) and not search(value) else None
+
+# For each keyword, a function that returns the test for it.  A
+# test returns a message if the value fails, and None otherwise.
+schema_checks = {
+    'type': check_type,
+    'enum': check_enum,
+    'const': check_const,
+    'pattern': check_pattern,
+    'minimum': check_limit(operator.lt, 'expected at least %r', 'number'),
+    'maximum': check_limit(operator.gt, 'expected at most %r', 'number'),
+    'exclusiveMinimum': check_limit(operator.le, 'expected more than %r', 'number'),
+    'exclusiveMaximum': check_limit(operator.ge, 'expected less than %r', 'number'),
+    'minLength': check_limit(operator.lt, 'expected at least %r characters', 'string', len),
+    'maxLength': check_limit(operator.gt, 'expected at most %r characters', 'string', len),
+    'minItems': check_limit(operator.lt, 'expected at least %r items', 'array', len),
+    'maxItems': check_limit(operator.gt, 'expected at most %r items', 'array', len),
+}
+
+structure = ('properties', 'additionalProperties', 'items', 'required')
+
+
+class SchemaNode(object):
+    ''' The checks for one schema (or subschema).  check(value)
+        returns a message for the first check the value fails, or
+        None.  needs_walk is true if there are required keys here
+        or below, which are only checked once the parse is done.
+    '''
+    __slots__ = ('path', 'check', 'properties', 'additional', 'items',
+                 'required', 'needs_walk')
+
+
+def compile_schema(schema, path='top'):
+    ''' Return the SchemaNode for a schema, or None if it allows
+        anything.
+    '''
+    if schema is True or schema == {}:
+        return None
+    if not isinstance(schema, dict):
+        raise ValueError('Unsupported schema %r at %s' % (schema, path))
+    for key in schema:
+        if key not in schema_checks and key not in structure and key not in annotations:
+            raise ValueError('Unsupported schema keyword %r at %s' % (key, path))
+
+    # Check the type first, so a bad value gets the simplest message
+    keys = sorted((x for x in schema if x in schema_checks), key=lambda x: x != 'type')
+    tests = [schema_checks[x](schema[x]) for x in keys]
+
+    def check(value):
+        for test in tests:
+            message = test(value)
+            if message:
+                return message
+
+    node = SchemaNode()
+    node.path = path
+    node.check = tests[0] if len(tests) == 1 else check
+    prefix = '' if path == 'top' else path + '.'
+    node.properties = dict((key, compile_schema(value, prefix + key))
+                           for key, value in schema.get('properties', {}).items())
+    additional = schema.get('additionalProperties', True)
+    node.additional = (False if additional is False else
+                       compile_schema(additional, prefix + '*'))
+    node.items = compile_schema(schema.get('items', True), path + '[]')
+    node.required = tuple(schema.get('required', ()))
+    children = list(node.properties.values()) + [node.additional or None, node.items]
+    node.needs_walk = bool(node.required) or any(x.needs_walk for x in children if x)
+    return node
+
+
+class Violation(Exception):
+    ''' Raised by the checks with the node, the message, and where
+        the bad value is.
+    '''
+
+
+class SchemaValidator(object):
+    ''' Builds the checks for the schema option, which is a dict
+        holding a subset of JSON Schema: type, enum, const, minimum,
+        maximum, exclusiveMinimum, exclusiveMaximum, minLength,
+        maxLength, pattern, minItems, maxItems, properties, required,
+        additionalProperties and items.
+
+        Values are built before the dict or array they are in, so
+        the parser checks each entry of a top-level dict (with all
+        of the values in it) when it is added, and stops at the first
+        bad one.  A top-level array is checked at the end, since it
+        is not known until then whether it is an array, and so are
+        required keys, since RSON can add more keys to a dict after
+        it has been read.
+
+        Finding the token for a bad value inside an entry would mean
+        recording every value as it is read, like with_locations does,
+        which costs more than the checks.  So when a document fails,
+        parse() and load_path() read it again with a parser that
+        does that (schema_located), to report the error at the bad
+        value.  load() cannot read the source again, so it reports
+        errors at the key of the top-level entry.
+    '''
+
+    schema = None
+
+    # Set on the parser that reads a document again to find where
+    # a schema violation is
+    schema_located = False
+
+    def schema_factory(self, error, isinstance=isinstance, dict=dict, len=len):
+        ''' Return (check, finish) for the schema, or (None, None) if
+            there is none.  finish() is called with the result.  In
+            the normal parser, check() is called with each entry of a
+            top-level dict.  In the schema_located parser, it is called
+            like locate() for every value.
+        '''
+        root = self.schema is not None and compile_schema(self.schema)
+        if not root:
+            return None, None
+        if self.select is not None:
+            raise ValueError('schema cannot be used with select')
+        # frozen=True builds frozen_objects, which are Mappings
+        # but not dicts
+        containers = dict, list, tuple, self.frozen_object
+
+        def items(value):
+            # The default objects may have an 'items' key, which
+            # their attribute access would find first
+            return dict.items(value) if isinstance(value, dict) else value.items()
+
+        def fail(node, message, stack):
+            raise Violation(node, message, stack)
+
+        def check_tree(node, value, stack):
+            ''' Check a value and everything in it.  stack holds the
+                (container, key) pairs leading to the value.
+            '''
+            message = node.check(value)
+            if message:
+                fail(node, message, stack)
+            if isinstance(value, Mapping):
+                properties, additional = node.properties, node.additional
+                if not properties and additional is None:
+                    return
+                for key, item in items(value):
+                    child = properties.get(key, additional)
+                    if child is None:
+                        continue
+                    if child is False:
+                        fail(node, 'unexpected key %r' % (key,), stack + [(value, key)])
+                    if isinstance(item, containers):
+                        stack.append((value, key))
+                        check_tree(child, item, stack)
+                        stack.pop()
+                    else:
+                        message = child.check(item)
+                        if message:
+                            fail(child, message, stack + [(value, key)])
+            elif isinstance(value, (list, tuple)):
+                child = node.items
+                if child is None:
+                    return
+                check = child.check
+                for index, item in enumerate(value):
+                    if isinstance(item, containers):
+                        stack.append((value, index))
+                        check_tree(child, item, stack)
+                        stack.pop()
+                    else:
+                        message = check(item)
+                        if message:
+                            fail(child, message, stack + [(value, index)])
+
+        def check_required(node, value, stack):
+            if isinstance(value, Mapping):
+                for key in node.required:
+                    if key not in value:
+                        fail(node, 'missing required key %r' % (key,), stack + [(value, None)])
+                properties, additional = node.properties, node.additional
+                for key, item in items(value):
+                    child = properties.get(key, additional)
+                    if child and child.needs_walk:
+                        stack.append((value, key))
+                        check_required(child, item, stack)
+                        stack.pop()
+            elif isinstance(value, (list, tuple)) and node.items and node.items.needs_walk:
+                for index, item in enumerate(value):
+                    stack.append((value, index))
+                    check_required(node.items, item, stack)
+                    stack.pop()
+
+        def check_entry(container, suffix, value):
+            ''' Check an entry of the top-level dict.
+            '''
+            node = root
+            last = len(suffix) - 1
+            for index, key in enumerate(suffix):
+                child = node.properties.get(key, node.additional)
+                if child is False:
+                    fail(node, 'unexpected key %r' % (key,), [(container, key)])
+                if child is None:
+                    return
+                if index < last:
+                    # A chained key (a: b: value) makes a dict
+                    check_tree(child, EMPTY, [(container, key)])
+                node = child
+            check_tree(node, value, [(container, suffix[0])])
+
+        def check_result(tokens, value):
+            top = tokens.top_object
+            if isinstance(top, dict) and isinstance(value, Mapping):
+                # A top-level dict (or the frozen_builder that made it),
+                # whose entries have been checked already
+                message = root.check(value)
+                if message:
+                    fail(root, message, [])
+            else:
+                # A top-level array, or a single value
+                check_tree(root, value, [(top, 0)])
+            if root.needs_walk:
+                check_required(root, value, [])
+
+        if not self.schema_located:
+            def check(container, suffix, token, value):
+                try:
+                    check_entry(container, suffix, value)
+                except Violation:
+                    node, message, stack = sys.exc_info()[1].args
+                    raise Violation(node, message, token)
+
+            def finish(tokens, value):
+                try:
+                    check_result(tokens, value)
+                except Violation:
+                    node, message, stack = sys.exc_info()[1].args
+                    raise Violation(node, message, (0, 'X', '', '', '\n', 1, tokens))
+
+            return check, finish
+
+        def report(violation, records):
+            ''' Report a violation at the token that added the bad
+                value, or the closest container it is in that has one.
+            '''
+            node, message, stack = violation.args
+            token = records[0][2]
+            for container, key in reversed(stack):
+                if key is None:
+                    found = [x for x in records if x[3] is container]
+                else:
+                    found = [x for x in records if x[0] is container and key in x[1]]
+                if found:
+                    token = found[-1][2]
+                    break
+            error('Schema violation at %s: %s' % (node.path, message), token)
+
+        def located_check(container, suffix, token, value):
+            tokens = token[-1]
+            records = tokens.schema_records
+            records.append((container, suffix, token, value))
+            if container is tokens.top_object and isinstance(container, dict):
+                try:
+                    check_entry(container, suffix, value)
+                except Violation:
+                    report(sys.exc_info()[1], records)
+
+        def located_finish(tokens, value):
+            records = tokens.schema_records
+            tokens.schema_records = None
+            try:
+                check_result(tokens, value)
+            except Violation:
+                report(sys.exc_info()[1], records)
+
+        return located_check, located_finish
+
+    def schema_wrappers(self, parse, load, load_path, error):
+        ''' Return parse, load and load_path for the normal parser,
+            changed to report schema violations.
+        '''
+        located = []
+
+        def report(violation):
+            node, message, token = violation.args
+            error('Schema violation at %s: %s' % (node.path, message), token)
+
+        def located_parser():
+            # Built the first time a document fails.  It reads tokens
+            # as it goes, so it stops at the bad entry.  It builds
+            # plain dicts, since the records of where each value was
+            # added refer to the dicts being built, which frozen=True
+            # replaces with frozen_objects.
+            if not located:
+                cls = _alter_attributes(type(self), dict(schema_located=True,
+                                                             lazy_tokens=True, frozen=False))
+                located.append(cls().parser_factory())
+            return located[0]
+
+        def checked_parse(source):
+            try:
+                return parse(source)
+            except Violation:
+                violation = sys.exc_info()[1]
+            located_parser()(source)
+            report(violation)
+
+        def checked_load(fp, chunk_size=None):
+            try:
+                return load(fp, chunk_size)
+            except Violation:
+                report(sys.exc_info()[1])
+
+        def checked_load_path(path):
+            try:
+                return load_path(path)
+            except Violation:
+                violation = sys.exc_info()[1]
+            located_parser().load_path(path)
+            report(violation)
+
+        return checked_parse, checked_load, checked_load_path
+
+
+EMPTY = {}
@@ -0,0 +1,424 @@
+'''
+Path-selective parsing for RSON.
+
+Copyright (c) 2010, Patrick Maupin.  All rights reserved.
+
+See http://code.google.com/p/rson/source/browse/trunk/license.txt
+'''
+
+from rson.py23 import basestring, Mapping
+
+# A value that was not selected, or had nothing selected in it
+MISSING = object()
+NOTHING = object()
+
+
+class Selector(object):
+    ''' Builds a parser that only returns the parts of the document
+        that are selected by a list of dotted paths, such as
+        ['server.port', 'users.*.name'].  A * matches every element
+        of an array, or every key of a dict.
+
+        The result has the same shape as the loads() result, but only
+        holds the selected values, so arrays and dicts that have
+        nothing selected in them are left out.  Unselected values are
+        skipped a token at a time, by their indentation or brackets,
+        without being converted or built, so they are not checked
+        for errors as thoroughly as loads() would check them.
+
+        The first value of an indented block is read whole, since it
+        decides whether the block is an array or a dict, and so are
+        blocks that fill an empty [] or {} in an array.
+    '''
+
+    select = None
+
+    @staticmethod
+    def select_paths(paths):
+        ''' Turn the dotted paths into a tree of dicts, where True
+            means everything below is selected.
+        '''
+        if isinstance(paths, basestring):
+            paths = [paths]
+        tree = {}
+        for path in paths:
+            node = tree
+            path = path.split('.')
+            for key in path[:-1]:
+                node = node.setdefault(key, {})
+                if node is True:
+                    break
+            else:
+                node[path[-1]] = True
+        return tree
+
+    def skip_factory(self, parse_locals):
+        ''' Return functions that skip over values in the token
+            stream without building them, given the locals of
+            parser_factory().
+        '''
+        env = parse_locals
+        read_json_array = env['read_json_array']
+        read_json_dict = env['read_json_dict']
+        read_rson_unquoted = env['read_rson_unquoted']
+        rson_value_dispatch = env['rson_value_dispatch']
+        bad_top_value = env['bad_top_value']
+        bad_close = env['bad_close']
+        rson_subdelimiter = env['rson_subdelimiter']
+
+        def skip_json(firsttok, next):
+            ''' Skip a bracketed value, just matching up the brackets.
+                Return true if it was empty.
+            '''
+            token = firsttok
+            depth = count = 0
+            while 1:
+                t0 = token[1]
+                if t0 == '[' or t0 == '{':
+                    depth += 1
+                elif t0 == ']' or t0 == '}':
+                    depth -= 1
+                    if not depth:
+                        return count == 1
+                elif t0 == '@':
+                    bad_close(token, firsttok)
+                token = next()
+                count += 1
+
+        def skip_value(token, next):
+            ''' Skip an RSON value, and return the token after it.
+            '''
+            reader = rson_value_dispatch(token[1], bad_top_value)
+            if reader is read_json_array or reader is read_json_dict:
+                skip_json(token, next)
+            elif reader is read_rson_unquoted:
+                linenum = token[5]
+                while 1:
+                    token = next()
+                    if token[5] != linenum or token[1] in rson_subdelimiter:
+                        return token
+            return next()
+
+        def skip_lines(token, next, linenum, indent, strict):
+            ''' Skip the rest of the line, and the lines after it that
+                are indented more than indent (or as much, unless strict).
+            '''
+            while 1:
+                if token[5] != linenum:
+                    thisindent = token[4]
+                    if (token[1] == '@' or thisindent < indent or
+                            strict and thisindent == indent):
+                        return token
+                    linenum = token[5]
+                if token[1] in rson_subdelimiter:
+                    token = next()
+                else:
+                    token = skip_value(token, next)
+
+        return skip_json, skip_value, skip_lines
+
+    def select_factory(self, parse_locals, len=len, isinstance=isinstance, basestring=basestring):
+        ''' Return a function that parses the tokens of a document for
+            the selected paths, given the locals of parser_factory().
+        '''
+        env = parse_locals
+        error = env['error']
+        read_json_array = env['read_json_array']
+        read_json_dict = env['read_json_dict']
+        read_json_key = env['read_json_key']
+        json_value_dispatch = env['json_value_dispatch']
+        rson_value_dispatch = env['rson_value_dispatch']
+        rson_key_dispatch = env['rson_key_dispatch']
+        bad_array_element = env['bad_array_element']
+        bad_dict_value = env['bad_dict_value']
+        bad_top_value = env['bad_top_value']
+        bad_unindent = env['bad_unindent']
+        bad_element = env['bad_element']
+        bad_close = env['bad_close']
+        block_is_array = env['block_is_array']
+        block_ended = env['block_ended']
+        read_keys = env['read_keys']
+        add_block = env['add_block']
+        check_entry = env['check_entry']
+        add_entry = env['add_entry']
+        parse_steps = env['parse_steps']
+        step_block = env['step_block']
+        step_fill = env['step_fill']
+        new_array = env['new_array']
+        new_object = env['new_object']
+        empties = env['empties']
+        empty_array_type = env['empty_array_type']
+        disallow_trailing_commas = env['disallow_trailing_commas']
+        selected = self.select_paths(self.select)
+        skip_json, skip_value, skip_lines = self.skip_factory(parse_locals)
+
+        def merge(a, b):
+            if a is True or b is True:
+                return True
+            result = dict(a)
+            for key, value in b.items():
+                result[key] = merge(result[key], value) if key in result else value
+            return result
+
+        def lookup(want, key):
+            ''' Return what is selected under key, which may be None
+                (nothing), True (everything) or another tree.
+            '''
+            if want is None or want is True:
+                return want
+            found = want.get(key) if isinstance(key, basestring) else None
+            star = want.get('*')
+            if found is None:
+                return star
+            if star is None:
+                return found
+            return merge(found, star)
+
+        def prune(value, want):
+            ''' Select from a value that has been read whole.
+            '''
+            if want is True:
+                return value
+            if isinstance(value, (dict, Mapping)):
+                result = new_object()
+                for key, item in value.items():
+                    sub = lookup(want, key)
+                    if sub is not None:
+                        item = prune(item, sub)
+                        if item is not MISSING:
+                            result.append([key, item])
+                if len(result):
+                    return result.get_result(None)
+            elif isinstance(value, (list, tuple)) and '*' in want:
+                sub = want['*']
+                result = [prune(item, sub) for item in value]
+                result = [item for item in result if item is not MISSING]
+                if result:
+                    return new_array(result, None)
+            return MISSING
+
+        def select_json(firsttok, next, want):
+            ''' Read a bracketed value for the selection, like
+                read_json_array() and read_json_dict().  Empty arrays
+                and dicts are returned as they are, since an indented
+                block might fill them.
+            '''
+            count = 0
+            if firsttok[1] == '[':
+                sub = want.get('*')
+                if sub is None:
+                    if skip_json(firsttok, next):
+                        return new_array([], firsttok)
+                    return MISSING
+                result = new_array([], firsttok)
+                append = result.append
+                while 1:
+                    token = next()
+                    t0 = token[1]
+                    if t0 == ']':
+                        if count and disallow_trailing_commas:
+                            error('Unexpected trailing comma', token)
+                        break
+                    count += 1
+                    value = select_json_value(token, next, sub, bad_array_element)
+                    if value is not MISSING:
+                        append(value)
+                    delim = next()
+                    t0 = delim[1]
+                    if t0 == ',':
+                        continue
+                    if t0 != ']':
+                        bad_close(delim, firsttok)
+                    break
+                if count and not result:
+                    return MISSING
+                return result
+
+            result = new_object()
+            append = result.append
+            while 1:
+                token = next()
+                t0 = token[1]
+                if t0  == '}':
+                    if count and disallow_trailing_commas:
+                        error('Unexpected trailing comma', token)
+                    break
+                count += 1
+                key = read_json_key(token, next)
+                value = select_json_value(next(), next, lookup(want, key), bad_dict_value)
+                if value is not MISSING:
+                    append([key, value])
+                delim = next()
+                t0 = delim[1]
+                if t0 == ',':
+                    continue
+                if t0 != '}':
+                    bad_close(delim, firsttok)
+                break
+            if count and not len(result):
+                return MISSING
+            return result.get_result(firsttok)
+
+        def select_json_value(token, next, want, bad):
+            t0 = token[1]
+            reader = json_value_dispatch(t0, bad)
+            if want is True or reader is bad:
+                return reader(token, next)
+            if t0 != '[' and t0 != '{':
+                return MISSING
+            if want is None:
+                skip_json(token, next)
+                return MISSING
+            value = select_json(token, next, want)
+            if value is not MISSING and not len(value):
+                return MISSING
+            return value
+
+        def select_entry(stack, next, token, entry, mydict, want):
+            ''' Read a dict entry for the selection, like read_entry().
+                want is what is selected in mydict, and wants[0] is
+                updated to what is selected under each chained key as
+                the values after them are read.
+            '''
+            wants = [want]
+
+            def read(token, next):
+                want = wants[0] = lookup(wants[0], entry[-1])
+                reader = rson_value_dispatch(token[1], bad_top_value)
+                if want is True or (reader is not read_json_array and
+                                    reader is not read_json_dict):
+                    return reader(token, next)
+                if want is None:
+                    skip_json(token, next)
+                    return MISSING
+                return select_json(token, next, want)
+
+            arrayindent, linenum = stack[-1][4:6]
+            token = read_keys(stack, next, token, entry, read)
+            want = wants[0]
+            last = entry[-1]
+            block = token[4] > arrayindent
+            fill = len(entry) > 1 and last in empties
+            if block and not fill:
+                want = lookup(want, last)
+            if want is None:
+                if block:
+                    token = skip_lines(token, next, linenum, arrayindent, True)
+                return token
+
+            if block:
+                stack.append(token)
+                if want is True:
+                    value, token = parse_steps(step_block(stack, next))
+                    add_block(entry, value, stack[-1])
+                elif fill:
+                    entry[-1], token = select_recurse(stack, next, want, False)
+                else:
+                    value, token = select_recurse(stack, next, want, True)
+                    entry.append(value)
+                stack.pop()
+            if want is True:
+                add_entry(stack, token, entry, mydict)
+                return token
+
+            check_entry(entry, token)
+            value = entry[-1]
+            if (value is not MISSING and isinstance(value, (list, dict, Mapping))
+                    and len(value)):
+                mydict.append(entry)
+            return token
+
+        def select_recurse(stack, next, want, unwrap):
+            ''' Read an indented block for the selection, like
+                step_block().  If unwrap is true, a block with a
+                single element is unwrapped before selecting from it,
+                as read_entry() and parse_tokens() do.
+            '''
+            if want is True:
+                value, token = parse_steps(step_block(stack, next))
+                if unwrap and len(value) == 1 and type(value) is empty_array_type:
+                    value = value[0]
+                return value, token
+
+            firsttok = stack[-1]
+            value = rson_value_dispatch(firsttok[1], bad_top_value)(firsttok, next)
+            token = next()
+            if not block_is_array(firsttok, value, token):
+                result = new_object()
+                token = select_entry(stack, next, token, [value], result, want)
+                arrayindent = firsttok[4]
+                while not block_ended(token, next, arrayindent):
+                    key = rson_key_dispatch(token[1], bad_top_value)(token, next)
+                    stack[-1] = token
+                    token = select_entry(stack, next, next(), [key], result, want)
+                if not len(result):
+                    return MISSING, token
+                return result.get_result(token), token
+
+            # An array, like step_array().  Until there is a second
+            # element, it might be unwrapped.
+            arrayindent, linenum = firsttok[4:6]
+            sub = want.get('*')
+            result = None
+            last = value
+            while 1:
+                thisindent = token[4]
+                if thisindent != arrayindent:
+                    if thisindent < arrayindent:
+                        break
+                    stack.append(token)
+                    last, token = parse_steps(step_fill(stack, next, token, last))
+                    stack.pop()
+                    if result is None:
+                        value = last
+                    elif sub is True:
+                        result[-1] = last
+                    else:
+                        last = prune(last, sub)
+                        if last is not MISSING:
+                            result.append(last)
+                    last = NOTHING
+                    if token[4] > arrayindent:
+                        bad_unindent(token, next)
+                    continue
+                if token[5] <= linenum:
+                    bad_element(token, next)
+                linenum = token[5]
+                if result is None:
+                    # Not unwrapped, so only * can select anything
+                    if sub is None:
+                        return MISSING, skip_lines(token, next, linenum, arrayindent, False)
+                    result = new_array([], firsttok)
+                    value = prune(value, sub)
+                    if value is not MISSING and (sub is True or value not in empties):
+                        result.append(value)
+                reader = rson_value_dispatch(token[1], bad_top_value)
+                if sub is True:
+                    last = reader(token, next)
+                    result.append(last)
+                    token = next()
+                elif reader is read_json_array or reader is read_json_dict:
+                    last = select_json(token, next, sub)
+                    if last is not MISSING and last not in empties:
+                        result.append(last)
+                        last = NOTHING
+                    token = next()
+                else:
+                    last = NOTHING
+                    token = skip_value(token, next)
+
+            if result is None:
+                if not unwrap:
+                    value = new_array([value], firsttok)
+                return prune(value, want), token
+            if not result:
+                return MISSING, token
+            return result, token
+
+        def select_tokens(next):
+            value, token = select_recurse([next()], next, selected, True)
+            if value is MISSING:
+                value = new_object().get_result(token)
+            return value, token
+
+        return select_tokens
@@ -7,11 +7,108 @@ See http://code.google.com/p/rson/source/browse/trunk/license.txt
 '''
 
 import re
+import codecs
+import itertools
+from array import array
+from bisect import bisect
 from rson.py23 import basestring, special_unicode, next
 
 class RSONDecodeError(ValueError):
     pass
 
+def normalize(source, special_unicode=special_unicode,
+                basestring=basestring, isinstance=isinstance):
+    ''' Return the source as a "regular" string, whatever that means
+        for the given Python, with all line endings converted to \\n.
+    '''
+    if isinstance(source, special_unicode):
+        source = source.encode('utf-8', 'replace')
+    elif not isinstance(source, basestring):
+        source = source.decode('utf-8', 'replace')
+    return source.replace('\r\n', '\n').replace('\r', '\n')
+
+def find_triple_end(source, start):
+    ''' Return the offset of the triple quotes that end a triple-quoted
+        string starting before start, or -1 if there are none.  Triple
+        quotes preceded by a backslash do not end the string.
+    '''
+    while 1:
+        end = source.find('"""', start)
+        if end < 0 or source[end-1:end] != '\\':
+            return end
+        start = end + 3
+
+def line_offsets(source, base=0, offsets=None, linebreak='\n'):
+    ''' Return an array of the offsets where each line of source
+        starts, or extend offsets with them if it is given.
+    '''
+    if offsets is None:
+        offsets = array('l', [base])
+    append = offsets.append
+    find = source.find
+    pos = find(linebreak)
+    while pos >= 0:
+        pos += 1
+        append(base + pos)
+        pos = find(linebreak, pos)
+    return offsets
+
+def block_finder(token_line, linebreak='\n', compile=re.compile):
+    ''' Return a function(source, pos, indentation) giving the offset
+        of the line break that ends the free-format block containing
+        pos, or len(source) if it runs to the end.  token_line is the
+        pattern for a line holding a token, with its indentation as
+        group 1, and indentation is that of the line the block starts on.
+
+        Blocks that start on a line indented with spaces only are found
+        with a single search, by a pattern compiled for that indentation
+        that cannot match the more deeply indented lines of the block.
+    '''
+    if isinstance(linebreak, bytes) and bytes is not str:
+        space, prepare = b' ', lambda pattern: compile(pattern.encode('ascii'))
+    else:
+        space, prepare = ' ', compile
+    search = prepare(token_line).search
+    # The extra lookahead goes just before the indentation group
+    split = token_line.index('([')
+    searches = {}
+
+    def find(source, pos, indentation):
+        spaces = indentation[len(linebreak):]
+        outdented = searches.get(spaces)
+        if outdented is None:
+            if spaces == space * len(spaces):
+                outdented = prepare('%s(?![ ]{%d}[ \\t\\v\\f])%s' % (
+                        token_line[:split], len(spaces), token_line[split:])).search
+            else:
+                outdented = False
+            searches[spaces] = outdented
+        if outdented:
+            match = outdented(source, pos)
+            return len(source) if match is None else match.start()
+        while 1:
+            match = search(source, pos)
+            if match is None:
+                return len(source)
+            if linebreak + match.group(1) <= indentation:
+                return match.start()
+            pos = match.end()
+    return find
+
+def skip_pieces(pieces, pos, end):
+    ''' Skip the (token, whitespace) pairs from a split source iterator,
+        starting at pos, until the source is at or after end.
+        Return the position the iterator has reached, which is end
+        unless a token spans it (so the source must be split again
+        from there).
+    '''
+    if pos < end:
+        for token in pieces:
+            pos += len(token) + len(next(pieces))
+            if pos >= end:
+                break
+    return pos
+
 class Tokenizer(list):
     ''' The RSON tokenizer uses re.split() to rip the source string
         apart into smaller strings which may or may not be true standalone
@@ -61,12 +158,12 @@ class Tokenizer(list):
 
     # A triple-quoted string can contain any characters.  The only escape
     # processing that is done on them is to allow a backslash in front of
-    # another set of triple quotes.  We only look for the start of one of
-    # these suckers in the first pass, and then go find the real string
-    # later.  This keeps us from getting our knickers in a twist on
-    # regular strings vs triple-quoted vs comments, etc.
+    # another set of triple quotes.  The whole string is matched as a
+    # single token, so its contents are never split up.  If it is never
+    # terminated, only the opening quotes are matched, and the error is
+    # reported when the parser gets to it.
 
-    triple_quoted_string = '"""'
+    triple_quoted_string = r'"""[^"\\]*(?:(?:\\"""|\\(?!""")|"(?!""))[^"\\]*)*"""|"""'
 
     # Any non-whitespace, non-delimiter, group of characters is in the "other"
     # category.  This group can have embedded whitespace, but ends on a
@@ -84,11 +181,41 @@ class Tokenizer(list):
 
     splitter = re.compile(pattern).split
 
+    # The contents of a free-format ("=") block are not tokenized.  The
+    # block ends at the first following line that has a token on it and
+    # is not indented past the line with the "=".  This matches a line
+    # with a token on it, capturing its indentation.
+    token_line = r'\n([ \t\v\f]*)(?![ \t\v\f#])[^\S\n]*\S'
+
+    # When tokenizing bytes directly (see mapped_factory), the line
+    # endings have not been normalized, so any of \r\n, \r or \n
+    # can end a line.
+    bytes_indentation = r'(?:\r\n?|\n)[ \t\v\f]*(?:#[^\r\n]*)?'
+    bytes_quoted_string = r'"(?:[^"\r\n\\]|\\[^\r\n])*(?:"|(?=[\r\n]))'
+    bytes_other = r'[\S](?:[^%s\r\n]*[^%s\s])*' % (re_delimiterset, re_delimiterset)
+
+    bytes_token_line = r'(?:\r\n?|\n)([ \t\v\f]*)(?![ \t\v\f#])[^\S\r\n]*\S'
+
+    bytes_pattern = '(%s)' % '|'.join([
+      delimiter_pattern,
+      triple_quoted_string,
+      bytes_quoted_string,
+      bytes_other,
+      bytes_indentation,
+    ])
+
     @classmethod
-    def factory(cls, len=len, iter=iter, special_unicode=special_unicode,
+    def factory(cls, equals=None, len=len, iter=iter, special_unicode=special_unicode,
                         basestring=basestring, isinstance=isinstance, next=next):
+        ''' factory returns a function that tokenizes a whole source
+            string up front.  If equals is given, it is the delimiter
+            that starts a free-format block, and the contents of those
+            blocks are skipped over rather than tokenized.
+        '''
         splitter = cls.splitter
         delimiterset = set(cls.delimiterset) | set('"')
+        indentation_match = re.compile(cls.indentation).match
+        find_block_end = block_finder(cls.token_line)
 
         def newstring(source, client):
             self = cls()
@@ -113,63 +240,830 @@ class Tokenizer(list):
             sourceiter = iter(sourcelist)
             offset -= len(next(sourceiter))
 
+            # Preallocate the list
+            self.append(None)
+            self *= len(sourcelist) // 2 + 1
+            index = 0
+
             # Strip comment from first line
             if len(sourcelist) > 1 and sourcelist[1].startswith('#'):
-                i = 1
-                while len(sourcelist) > i and not sourcelist[i].startswith('\n'):
-                    i += 1
+                end = source.find('\n')
+                if end < 0:
+                    end = len(source)
+                if skip_pieces(sourceiter, -offset, end) != end:
+                    sourceiter = None
+                offset = -end
+
+            # Create all the tokens.  The source only needs to be split
+            # again if a free-format block ends inside a token.
+            while 1:
+                if sourceiter is None:
+                    sourcelist = splitter(source[-offset:])
+                    self[index:] = [None] * (len(sourcelist) // 2 + 1)
+                    sourceiter = iter(sourcelist)
                     offset -= len(next(sourceiter))
+                for token in sourceiter:
+                    whitespace = next(sourceiter)
+                    t0 = token[0]
+                    if t0 not in delimiterset:
+                        if t0 == '\n':
+                            linenum += 1
+                            indentation = token
+                            offset -= len(token) + len(whitespace)
+                            continue
+                        else:
+                            t0 = 'X'
+                    self[index] = (offset, t0, token, whitespace, indentation, linenum, self)
+                    index += 1
+                    offset -= len(token) + len(whitespace)
+                    if t0 == '"':
+                        if '\n' in token:
+                            linenum += token.count('\n')
+                            indentation = indentation_match(token, token.rfind('\n')).group()
+                    elif t0 == equals:
+                        end = find_block_end(source, -offset, indentation)
+                        linenum += source.count('\n', -offset, end)
+                        if skip_pieces(sourceiter, -offset, end) != end:
+                            sourceiter = None
+                        offset = -end
+                        if sourceiter is None:
+                            break
+                if sourceiter is not None:
+                    break
 
+            # Add a sentinel
+            self[index] = (offset, '@', '@', '', '', linenum + 1, self)
+            self[index+1:] = []
 
-            # Preallocate the list
-            self.append(None)
-            self *= len(sourcelist) // 2 + 1
-            index = 0
+            # Put everything we need in the actual object instantiation
+            self.reverse()
+            self.source = source
+            self.next = self.pop
+            self.push = self.append
+            self.skippable = True
+            return self
+        return newstring
 
-            # Create all the tokens
-            for token in sourceiter:
-                whitespace = next(sourceiter)
+    @classmethod
+    def token_generator(cls, equals=None, len=len):
+        ''' token_generator returns a generator function that matches
+            tokens one at a time from a (normalized) source string.
+            The tokens are the same as the ones created by factory().
+        '''
+        delimiterset = set(cls.delimiterset) | set('"')
+        token_match = re.compile(cls.pattern + r'([^\S\n]*)').match
+        whitespace_match = re.compile(r'[^\S\n]*').match
+        indentation_match = re.compile(cls.indentation).match
+        find_block_end = block_finder(cls.token_line)
+
+        def generate(self, source, pos=0, linenum=1, indentation=None):
+            pos = whitespace_match(source, pos).end()
+            offset = -pos
+            match = token_match(source, pos)
+
+            if indentation is None:
+                # Get the indentation at the start of the file
+                # and strip comment from first line
+                indentation = '\n' + source[:pos]
+                if match is not None and match.group(1).startswith('#'):
+                    pos = source.find('\n')
+                    if pos < 0:
+                        pos = len(source)
+                    offset = -pos
+                    match = token_match(source, pos)
+
+            while match is not None:
+                token, whitespace = match.group(1, 2)
+                pos = match.end()
                 t0 = token[0]
                 if t0 not in delimiterset:
                     if t0 == '\n':
                         linenum += 1
                         indentation = token
-                        offset -= len(token)
-                        linestart = offset
+                        offset -= len(token) + len(whitespace)
+                        match = token_match(source, pos)
                         continue
                     else:
                         t0 = 'X'
-                self[index] = (offset, t0, token, whitespace, indentation, linenum, self)
-                index += 1
+                yield (offset, t0, token, whitespace, indentation, linenum, self)
                 offset -= len(token) + len(whitespace)
+                if t0 == '"':
+                    if '\n' in token:
+                        linenum += token.count('\n')
+                        indentation = indentation_match(token, token.rfind('\n')).group()
+                elif t0 == equals:
+                    end = find_block_end(source, pos, indentation)
+                    linenum += source.count('\n', pos, end)
+                    pos = end
+                    offset = -end
+                match = token_match(source, pos)
 
             # Add a sentinel
-            self[index] = (offset, '@', '@', '', '', linenum + 1, self)
-            self[index+1:] = []
+            yield (offset, '@', '@', '', '', linenum + 1, self)
 
-            # Put everything we need in the actual object instantiation
-            self.reverse()
+        return generate
+
+    @classmethod
+    def lazy_factory(cls, equals=None):
+        ''' lazy_factory returns a function that works like the one
+            returned by factory(), except that tokens are matched one
+            at a time as the parser asks for them, rather than all at
+            once up front.  The list itself only holds tokens that have
+            been pushed back (or looked ahead at), so parsing can start
+            right away, and an early error doesn't pay for tokenizing
+            the rest of the source.
+
+            fork(token) returns another tokenizer that starts again
+            at one of the tokens, without the cost of normalizing the
+            source again.
+        '''
+        generate = cls.token_generator(equals)
+        indentation_match = re.compile(cls.indentation).match
+
+        def newlazy(source, client, start=None):
+            self = cls()
+            self.client = client
+            if start is None:
+                self.source = source = normalize(source)
+                state = [generate(self, source)]
+            else:
+                # Carry on from a token of another tokenizer
+                # of the same (already normalized) source.
+                self.source = source
+                state = [generate(self, source, -start[0], start[5], start[4])]
+            pop = self.pop
+
+            def generated():
+                for token in state[0]:
+                    return token
+                raise IndexError('pop from empty list')
+
+            def skip_to(token, offset):
+                self[bisect(self, (1 - offset,)):] = []
+                if not self:
+                    # Start matching again at offset
+                    start = -token[0]
+                    linenum = token[5] + source.count('\n', start, offset)
+                    last = source.rfind('\n', start, offset)
+                    indentation = (token[4] if last < 0 else
+                                   indentation_match(source, last).group())
+                    state[0] = generate(self, source, offset, linenum, indentation)
+
+            def nexttoken():
+                if self:
+                    return pop()
+                return generated()
+
+            def fill():
+                self.insert(0, generated())
+
+            self.next = nexttoken
+            self.push = self.append
+            self.fill = fill
+            self.skip_to = skip_to
+            self.skippable = True
+            self.fork = lambda token: newlazy(source, client, token)
+            return self
+        return newlazy
+
+    @classmethod
+    def compact_factory(cls, equals=None, len=len, ord=ord, array=array, next=next):
+        ''' compact_factory returns a function that works like the one
+            returned by factory(), except that the tokens are stored in
+            a table of parallel arrays instead of a list of tuples:
+
+               offsets      negative character offset (token[0])
+               types        ord() of the token type (token[1])
+               lengths      length of the token text (token[2])
+               spaces       length of the whitespace after it (token[3])
+               indents      index into the interned indentation
+                            strings (token[4])
+               lines        line number (token[5])
+
+            The tuples handed to the parser are built one at a time as
+            they are needed, so only the few tokens the parser is
+            holding on to exist as tuples.
+        '''
+        splitter = cls.splitter
+        delimiterset = set(cls.delimiterset) | set('"')
+        indentation_match = re.compile(cls.indentation).match
+        find_block_end = block_finder(cls.token_line)
+        typechars = [chr(x) for x in range(128)]
+
+        def newcompact(source, client):
+            self = cls()
+            self.client = client
+            self.source = source = normalize(source)
+
+            self.offsets = offsets = array('l')
+            self.types = types = array('b')
+            self.lengths = lengths = array('l')
+            self.spaces = spaces = array('l')
+            self.indents = indents = array('l')
+            self.lines = lines = array('l')
+            self.indentations = indentations = []
+            indentation_ids = {}
+            add_offset, add_type, add_length = offsets.append, types.append, lengths.append
+            add_space, add_indent, add_line = spaces.append, indents.append, lines.append
+
+            # Fill the table straight from the split source, the
+            # same way factory() builds its tuples.
+            sourcelist = splitter(source)
+            indentation = '\n' + sourcelist[0]
+            linenum = 1
+            sourceiter = iter(sourcelist)
+            offset = -len(next(sourceiter))
+            lastindent = indentid = None
+
+            # Strip comment from first line
+            if len(sourcelist) > 1 and sourcelist[1].startswith('#'):
+                end = source.find('\n')
+                if end < 0:
+                    end = len(source)
+                if skip_pieces(sourceiter, -offset, end) != end:
+                    sourceiter = None
+                offset = -end
+
+            while 1:
+                if sourceiter is None:
+                    sourceiter = iter(splitter(source[-offset:]))
+                    offset -= len(next(sourceiter))
+                for token in sourceiter:
+                    whitespace = next(sourceiter)
+                    t0 = token[0]
+                    if t0 not in delimiterset:
+                        if t0 == '\n':
+                            linenum += 1
+                            indentation = token
+                            offset -= len(token) + len(whitespace)
+                            continue
+                        t0 = 'X'
+                    if indentation is not lastindent:
+                        lastindent = indentation
+                        indentid = indentation_ids.get(lastindent)
+                        if indentid is None:
+                            indentid = indentation_ids[lastindent] = len(indentations)
+                            indentations.append(lastindent)
+                    add_offset(offset)
+                    add_type(ord(t0))
+                    add_length(len(token))
+                    add_space(len(whitespace))
+                    add_indent(indentid)
+                    add_line(linenum)
+                    offset -= len(token) + len(whitespace)
+                    if t0 == '"':
+                        if '\n' in token:
+                            linenum += token.count('\n')
+                            indentation = indentation_match(token, token.rfind('\n')).group()
+                    elif t0 == equals:
+                        end = find_block_end(source, -offset, indentation)
+                        linenum += source.count('\n', -offset, end)
+                        if skip_pieces(sourceiter, -offset, end) != end:
+                            sourceiter = None
+                        offset = -end
+                        if sourceiter is None:
+                            break
+                if sourceiter is not None:
+                    break
+
+            sentinel = (offset, '@', '@', '', '', linenum + 1, self)
+            count = len(offsets)
+            index = itertools.count()
+            nextindex = getattr(index, 'next', None) or index.__next__
+            pop = self.pop
+
+            def gettoken(i):
+                ''' Build the token tuple for an index into the table
+                '''
+                if i >= count:
+                    if i == count:
+                        return sentinel
+                    raise IndexError('pop from empty list')
+                offset = offsets[i]
+                start = -offset
+                end = start + lengths[i]
+                return (offset, typechars[types[i]], source[start:end],
+                        source[end:end + spaces[i]], indentations[indents[i]],
+                        lines[i], self)
+
+            def nexttoken():
+                if self:
+                    return pop()
+                # gettoken(), inlined for the common case
+                i = nextindex()
+                if i >= count:
+                    return gettoken(i)
+                offset = offsets[i]
+                start = -offset
+                end = start + lengths[i]
+                return (offset, typechars[types[i]], source[start:end],
+                        source[end:end + spaces[i]], indentations[indents[i]],
+                        lines[i], self)
+
+            def fill():
+                self.insert(0, gettoken(nextindex()))
+
+            self.gettoken = gettoken
+            self.next = nexttoken
+            self.push = self.append
+            self.fill = fill
+            return self
+        return newcompact
+
+    @classmethod
+    def stream_factory(cls, equals=None, len=len, iter=iter, special_unicode=special_unicode,
+                        basestring=basestring, isinstance=isinstance, next=next):
+        ''' stream_factory returns a function that works like the one
+            returned by factory(), except that it accepts a file-like
+            object and reads it a chunk at a time.
+
+            Each chunk is cut at a line boundary (just before a linefeed,
+            so the indentation of the next line stays with the next chunk)
+            and tokenized on demand when the previous chunk runs out.
+            The last element of each token is a TokenChunk rather than
+            the tokenizer itself, so the text of a chunk is only kept
+            alive while the parser is holding a token from it.
+
+            Triple-quoted strings and free-format blocks are read whole
+            by the stream, since they can span chunk boundaries.
+        '''
+        splitter = cls.splitter
+        delimiterset = set(cls.delimiterset) | set('"')
+        indentation_match = re.compile(cls.indentation).match
+        find_block_end = block_finder(cls.token_line)
+
+        def readsource(fp, chunk_size, counts):
+            ''' Yield normalized pieces of the source, keeping track of
+                the number of linefeeds and the lengths of the last two
+                lines for error reporting.
+            '''
+            decode = None
+            held = ''
+            while 1:
+                raw = piece = fp.read(chunk_size)
+                if not raw:
+                    piece = held and '\n'
+                    if decode is not None:
+                        piece = held + decode(raw, True)
+                elif isinstance(piece, special_unicode):
+                    piece = piece.encode('utf-8', 'replace')
+                elif not isinstance(piece, basestring):
+                    if decode is None:
+                        decode = codecs.getincrementaldecoder('utf-8')('replace').decode
+                    piece = decode(piece)
+
+                # Convert MS-DOS or Mac line endings, even when a
+                # \r\n pair is split across two reads.
+                if raw:
+                    piece = held + piece
+                    held = ''
+                    if piece[-1:] == '\r':
+                        piece, held = piece[:-1], '\r'
+                piece = piece.replace('\r\n', '\n').replace('\r', '\n')
+
+                linefeeds = piece.count('\n')
+                if linefeeds:
+                    last = piece.rfind('\n')
+                    if linefeeds > 1:
+                        counts[2] = last - piece.rfind('\n', 0, last) - 1
+                    else:
+                        counts[2] = counts[1] + last
+                    counts[1] = len(piece) - last - 1
+                    counts[0] += linefeeds
+                else:
+                    counts[1] += len(piece)
+                if piece:
+                    yield piece
+                if not raw:
+                    return
+
+        def newstream(fp, client, chunk_size):
+            self = cls()
+            self.client = client
+            self.current = None
+            self.retained = None
+            self.lines = None
+            counts = [0, 0, 0]
+            pieces = readsource(fp, chunk_size, counts)
+            state = dict(pending='', base=0, linenum=1, indentation=None, done=False)
+            pop = self.pop
+
+            def more():
+                try:
+                    piece = next(pieces)
+                except StopIteration:
+                    return False
+                state['pending'] += piece
+                return True
+
+            def getchunk():
+                ''' Return the next run of complete lines, or None at EOF
+                '''
+                while 1:
+                    pending = state['pending']
+                    cut = pending.rfind('\n')
+                    if cut > 0:
+                        break
+                    if not more():
+                        if not pending and self.current is not None:
+                            return None
+                        cut = len(pending)
+                        break
+                state['pending'] = pending[cut:]
+                return pending[:cut]
+
+            def split(text):
+                ''' Split text as if the linefeed that follows it were
+                    there, so a string that runs to the end of the last
+                    line is matched the same way factory() matches it.
+                '''
+                if state['pending']:
+                    return splitter(text + '\n')[:-2]
+                return splitter(text)
+
+            def tokenize(text):
+                base = state['base']
+                linenum = state['linenum']
+                indentation = state['indentation']
+                chunk = TokenChunk(self, base)
+                result = []
+                append = result.append
+
+                sourcelist = split(text)
+                sourceiter = iter(sourcelist)
+                offset = -base - len(next(sourceiter))
+
+                if indentation is None:
+                    # Get the indentation at the start of the file
+                    # and strip comment from first line
+                    indentation = '\n' + sourcelist[0]
+                    if len(sourcelist) > 1 and sourcelist[1].startswith('#'):
+                        end = text.find('\n')
+                        if end < 0:
+                            end = len(text)
+                        if skip_pieces(sourceiter, -offset, end) != end:
+                            sourceiter = iter(split(text[end:]))
+                            next(sourceiter)
+                        offset = -end
+
+                while sourceiter is not None:
+                    current, sourceiter = sourceiter, None
+                    for token in current:
+                        whitespace = next(current)
+                        t0 = token[0]
+                        if t0 not in delimiterset:
+                            if t0 == '\n':
+                                linenum += 1
+                                indentation = token
+                                offset -= len(token) + len(whitespace)
+                                continue
+                            else:
+                                t0 = 'X'
+                        elif t0 == '"' and token == '"""':
+                            # Find the end of the string, reading more
+                            # of the source if necessary, and then start
+                            # splitting again after it.
+                            start = -offset - base
+                            end = find_triple_end(text, start + 3)
+                            extended = end < 0
+                            while end < 0:
+                                searched = len(text)
+                                text += state['pending']
+                                state['pending'] = ''
+                                end = find_triple_end(text, max(start + 3, searched - 3))
+                                if end < 0 and not more():
+                                    break
+                            if end < 0:
+                                end = start
+                            end += 3
+                            if extended:
+                                while text.find('\n', end) < 0 and more():
+                                    text += state['pending']
+                                    state['pending'] = ''
+                                cut = text.rfind('\n')
+                                if cut >= end:
+                                    state['pending'] = text[cut:]
+                                    text = text[:cut]
+                            token = text[start:end]
+                            sourceiter = iter(split(text[end:]))
+                            whitespace = next(sourceiter)
+                            append((offset, t0, token, whitespace, indentation, linenum, chunk))
+                            offset -= len(token) + len(whitespace)
+                            linefeeds = token.count('\n')
+                            if linefeeds:
+                                linenum += linefeeds
+                                indentation = indentation_match(token, token.rfind('\n')).group()
+                            break
+                        append((offset, t0, token, whitespace, indentation, linenum, chunk))
+                        offset -= len(token) + len(whitespace)
+                        if t0 == '"':
+                            if '\n' in token:
+                                linenum += token.count('\n')
+                                indentation = indentation_match(token, token.rfind('\n')).group()
+                        elif t0 == equals:
+                            # Skip the contents of a free-format block,
+                            # reading more of the source if it goes past
+                            # the end of this chunk.
+                            start = -offset - base
+                            end = find_block_end(text, start, indentation)
+                            extended = False
+                            while end == len(text) and (state['pending'] or more()):
+                                searched = max(start, text.rfind('\n'))
+                                text += state['pending']
+                                state['pending'] = ''
+                                extended = True
+                                end = find_block_end(text, searched, indentation)
+                            if extended:
+                                cut = text.rfind('\n')
+                                if cut >= end:
+                                    state['pending'] = text[cut:]
+                                    text = text[:cut]
+                            linenum += text.count('\n', start, end)
+                            offset = -base - end
+                            if extended or skip_pieces(current, start, end) != end:
+                                sourceiter = iter(split(text[end:]))
+                                next(sourceiter)
+                                break
+
+                chunk.source = text
+                if self.lines is not None:
+                    line_offsets(text, base, self.lines)
+                state['base'] = base + len(text)
+                state['linenum'] = linenum
+                state['indentation'] = indentation
+                self.current = chunk
+                if self.retained is not None:
+                    self.retained.append(chunk)
+                return result
+
+            def fill():
+                ''' Add the tokens from the next non-empty chunk (or
+                    the sentinel) underneath any tokens already present.
+                '''
+                while 1:
+                    text = getchunk()
+                    if text is None:
+                        if state['done']:
+                            raise IndexError('pop from empty list')
+                        state['done'] = True
+                        result = [(-state['base'], '@', '@', '', '',
+                                        state['linenum'] + 1, self.current)]
+                        break
+                    result = tokenize(text)
+                    if result:
+                        break
+                result.reverse()
+                self[:0] = result
+
+            def nexttoken():
+                try:
+                    return pop()
+                except IndexError:
+                    fill()
+                    return pop()
+
+            def track_lines():
+                self.lines = array('l', [0])
+
+            def linestarts():
+                return self.lines
+
+            def endloc():
+                for piece in pieces:
+                    pass
+                linefeeds, lastlen, prevlen = counts
+                if linefeeds and not lastlen:
+                    return linefeeds, prevlen + 1
+                return linefeeds + 1, lastlen + 1
+
+            self.fill = fill
+            self.next = nexttoken
+            self.push = self.append
+            self.endloc = endloc
+            self.track_lines = track_lines
+            self.linestarts = linestarts
+            return self
+        return newstream
+
+    @classmethod
+    def mapped_factory(cls, equals=None, len=len):
+        ''' mapped_factory returns a function that works like the one
+            returned by lazy_factory(), except that it tokenizes a
+            UTF-8 bytes-like object (such as an mmap) directly, without
+            decoding it or normalizing its line endings first.  Only
+            the text of string and scalar tokens is decoded, as each
+            token is needed.
+
+            Token offsets are byte offsets into the source.  Non-ASCII
+            whitespace is treated as part of the surrounding text.
+        '''
+        token_match = re.compile((cls.bytes_pattern + r'([^\S\r\n]*)').encode('ascii')).match
+        whitespace_match = re.compile(br'[^\S\r\n]*').match
+        linebreak_finditer = re.compile(br'\r\n?|\n').finditer
+        indentation_match = re.compile(cls.indentation).match
+        find_block_end = block_finder(cls.bytes_token_line, b'\n')
+
+        if bytes is str:
+            # Python 2 keeps everything as bytes
+            decode = encode = lambda s: s
+        else:
+            decode = lambda s: s.decode('utf-8', 'replace')
+            encode = lambda s: s.encode('utf-8')
+
+        kinds = dict((x.encode('ascii'), x) for x in cls.delimiterset)
+        kinds[b'"'] = '"'
+        kinds[b'\n'] = kinds[b'\r'] = '\n'
+        kinds = kinds.get
+
+        def generate(self, source):
+            strings = {}
+            pos = whitespace_match(source).end()
+            indentation = '\n' + decode(source[:pos])
+            linenum = 1
+            offset = -pos
+
+            # Strip comment from first line
+            match = token_match(source, pos)
+            if match is not None and match.group(1)[:1] == b'#':
+                pos = len(source)
+                for linebreak in linebreak_finditer(source):
+                    pos = linebreak.start()
+                    break
+                offset = -pos
+                match = token_match(source, pos)
+
+            while match is not None:
+                token, whitespace = match.group(1, 2)
+                pos = match.end()
+                t0 = kinds(token[:1])
+                if t0 is None:
+                    t0 = 'X'
+                    text = decode(token)
+                elif t0 == '\n':
+                    linenum += 1
+                    indentation = strings.get(token)
+                    if indentation is None:
+                        indentation = strings[token] = normalize(decode(token))
+                    offset -= len(token) + len(whitespace)
+                    match = token_match(source, pos)
+                    continue
+                elif t0 == '"':
+                    if token[:3] == b'"""':
+                        text = normalize(decode(token))
+                    else:
+                        text = decode(token)
+                else:
+                    text = t0
+                spaces = strings.get(whitespace)
+                if spaces is None:
+                    spaces = strings[whitespace] = decode(whitespace)
+                yield (offset, t0, text, spaces, indentation, linenum, self)
+                offset -= len(token) + len(whitespace)
+                if t0 == '"':
+                    linefeeds = text.count('\n')
+                    if linefeeds:
+                        linenum += linefeeds
+                        indentation = indentation_match(text, text.rfind('\n')).group()
+                elif t0 == equals:
+                    end = find_block_end(source, pos, encode(indentation))
+                    block = source[pos:end]
+                    linenum += block.count(b'\n') + block.count(b'\r') - block.count(b'\r\n')
+                    pos = end
+                    offset = -end
+                match = token_match(source, pos)
+
+            # Add a sentinel
+            yield (offset, '@', '@', '', '', linenum + 1, self)
+
+        def newmapped(source, client):
+            self = cls()
+            self.client = client
             self.source = source
-            self.next = self.pop
+
+            tokens = generate(self, source)
+            pop = self.pop
+
+            def generated():
+                for token in tokens:
+                    return token
+                raise IndexError('pop from empty list')
+
+            def nexttoken():
+                if self:
+                    return pop()
+                return generated()
+
+            def fill():
+                self.insert(0, generated())
+
+            def column(offset):
+                start = max(source.rfind(b'\n', 0, offset), source.rfind(b'\r', 0, offset)) + 1
+                return len(decode(source[start:offset - 1])) + 1
+
+            def getsource(start, end):
+                return normalize(decode(source[start:end]))
+
+            def endloc():
+                end = len(source)
+                lineno = 1
+                linestart = 0
+                for match in linebreak_finditer(source):
+                    if match.end() < end:
+                        lineno += 1
+                        linestart = match.end()
+                    else:
+                        end = match.start()
+                return lineno, len(decode(source[linestart:end])) + 1
+
+            def linestarts():
+                return array('l', [0] + [match.end() for match in linebreak_finditer(source)])
+
+            self.next = nexttoken
             self.push = self.append
+            self.fill = fill
+            self.column = column
+            self.getsource = getsource
+            self.sourceblock = lambda start, end: (getsource(start, end), 0, None)
+            self.endloc = endloc
+            self.linestarts = linestarts
             return self
-        return newstring
+        return newmapped
+
+    # The tokenizers built by factory() and lazy_factory() can skip
+    # over a region of the source that has been parsed by other
+    # means.  (lazy_factory() never tokenizes the region at all.)
+
+    skippable = False
+
+    def skip_to(self, token, offset):
+        ''' Discard the tokens from token up to offset
+        '''
+        self[bisect(self, (1 - offset,)):] = []
 
     def peek(self):
-        return self[-1]
+        return self.lookahead()
 
     def lookahead(self, index=0):
+        while len(self) <= index and hasattr(self, 'fill'):
+            self.fill()
         return self[-1 - index]
 
+    # Some operations (such as the processing of "=" blocks) need
+    # to look at the original source text between two tokens.
+    # retain() is called with the first token before the operation
+    # starts, so that a stream can keep the text around until
+    # release() is called.
+
+    def retain(self, token):
+        pass
+
+    def release(self):
+        pass
+
+    def getsource(self, start, end):
+        return self.source[start:end]
+
+    # sourceblock() returns a string holding the text between two
+    # offsets, and where the text is in it, so that the text can
+    # be kept for later without copying it out of the source.
+
+    def sourceblock(self, start, end):
+        return self.source, start, end
+
+    # linestarts() returns the offset of the start of every line,
+    # for building location maps.  A stream discards its source
+    # as it goes, so track_lines() must be called before the
+    # first token is read if linestarts() will be needed.
+
+    def track_lines(self):
+        pass
+
+    def linestarts(self):
+        return line_offsets(self.source)
+
+    def endloc(self):
+        ''' Return the line and column of the end of the source
+        '''
+        source = self.source
+        sourcelen = source and (len(source) - (source[-1] == '\n')) or 0
+        return (source.count('\n', 0, sourcelen) + 1,
+                sourcelen - source.rfind('\n', 0, sourcelen))
+
+    # Tokens from a plain tokenizer are all relative to the start
+    # of the source.
+    base = 0
+
+    def column(self, offset):
+        ''' Return the column for a (one-based) offset into the source
+        '''
+        return offset - self.source.rfind('\n', 0, offset) - 1
+
     @staticmethod
     def sourceloc(token):
         ''' Return the source location for a given token
         '''
-        lineno = token[5]
-        colno = offset = -token[0] + 1
-        if lineno != 1:
-            colno -= token[-1].source.rfind('\n', 0, offset) + 1
-        return offset, lineno, colno
+        offset = -token[0] + 1
+        return offset, token[5], token[-1].column(offset)
 
     @classmethod
     def error(cls, s, token):
@@ -183,13 +1077,44 @@ class Tokenizer(list):
             text = token[2]
             loc = 'line %s, column %s, text %s' % (lineno, colno, repr(text[:20]))
 
-        source = token[-1].source
-        sourcelen = source and (len(source) - (source[-1] == '\n')) or 0
-
         err = RSONDecodeError('%s: %s' % (s, loc))
         err.pos = offset
         err.lineno = lineno
         err.colno = colno
-        err.endlineno = source.count('\n', 0, sourcelen) + 1
-        err.endcolno = sourcelen - source.rfind('\n', 0, sourcelen)
+        err.endlineno, err.endcolno = token[-1].endloc()
         raise err
+
+
+class TokenChunk(object):
+    ''' A TokenChunk takes the place of the tokenizer in tokens
+        created by a stream.  It holds the source text for a run
+        of lines, and defers everything else to the stream.
+    '''
+    def __init__(self, stream, base):
+        self.stream = stream
+        self.base = base
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    def retain(self, token):
+        stream = self.stream
+        stream.retained = retained = [self]
+        if stream.current is not self:
+            retained.append(stream.current)
+
+    def release(self):
+        self.stream.retained = None
+
+    def column(self, offset):
+        offset -= self.base
+        return offset - self.source.rfind('\n', 0, offset) - 1
+
+    def getsource(self, start, end):
+        retained = self.stream.retained
+        base = retained[0].base
+        source = ''.join(x.source for x in retained)
+        return source[start - base:end - base]
+
+    def sourceblock(self, start, end):
+        return self.getsource(start, end), 0, None
@@ -118,4 +118,43 @@ class UnquotedToken(object):
                 return parse_int(s.replace('_', ''))
             return parse_float(s)
 
-        return parse
+        if self.unquoted_pattern != UnquotedToken.unquoted_pattern:
+            return parse
+
+        # With the stock pattern, the special names and the plain
+        # decimal integers and floats (which is most of them) are
+        # picked out with string methods, and only the other tokens
+        # that could be numbers are matched against it.
+        parse_plain_int = parse_int
+        if type(self).parse_int is UnquotedToken.parse_int:
+            parse_plain_int = int
+        plain_float = parse_float is float
+        specials = dict((x, special[x]) for x in ('true', 'false', 'null') if x in special)
+        not_special = object()
+        digits = '0123456789'
+        not_number = frozenset(chr(x) for x in range(128)) - frozenset('+-.' + digits)
+        float_chars = frozenset('+-.eE' + digits)
+
+        def parse_scalar(token, next):
+            s = token[2]
+            value = specials.get(s, not_special)
+            if value is not not_special:
+                return value
+            first = s[:1]
+            if first in not_number:
+                return parse_unquoted_str(token)
+            body = s[1:] if first in '+-' else s
+            rest = body.strip(digits)
+            if not rest:
+                if body and (body[0] != '0' or body == '0'):
+                    return parse_plain_int(s)
+            elif plain_float and float_chars.issuperset(rest):
+                # float() reads the same strings as the pattern does,
+                # when they are made of these characters.
+                try:
+                    return float(s)
+                except ValueError:
+                    pass
+            return parse(token, next)
+
+        return parse_scalar
@@ -27,3 +27,8 @@ try:
     next = next
 except:
     next = lambda x: x.next()
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
@@ -1,9 +1,18 @@
 from unittest import TestCase
 import os
+import random
+import sys
+import tempfile
+from io import BytesIO
 from json import loads as sysloads
-from rson import loads as newloads
+try:
+    from collections.abc import Sequence
+except ImportError:
+    from collections import Sequence
+from rson import loads as newloads, load, load_path, iterparse, iter_items, loads_lazy, parse_document
+from rson import loads_many, load_files, loads_parallel, push_parser, aload, RSONDecodeError
 
-from rson.py23 import basestring
+from rson.py23 import basestring, Mapping
 
 rootdir = os.path.dirname(__file__)
 
@@ -120,8 +129,875 @@ num7 = .2
             s, r = eval(line)
             ae(l(s), r)
 
+    def test_scalars(self):
+        # The stock pattern's shortcuts must read scalars the same
+        # way as matching every one against the pattern does.
+        from rson.base import UnquotedToken
+        regex = newloads.customize(delegate_json=False,
+                                   unquoted_pattern=UnquotedToken.unquoted_pattern + '\n')
+        plain = newloads.customize(delegate_json=False)
+        texts = ['0', '-0', '+7', '12', '-2.5', '+3e4', '1.', '.5', '-.5e-3', '1.e5', '1e',
+                 '1_0.5', '1_000', '0x10', '0b11', '0o7', '+', '-', '.', '1.2.3', '--1', '+-1',
+                 'e5', '.e5', 'inf', 'nan', 'true', 'false', 'null', 'True', 'x1', '1 2',
+                 '1.5x', u'١٢', '2e+', '1e+5']
+        for text in texts:
+            source = 'a: %s\n' % text
+            self.assertEqual(repr(plain(source)), repr(regex(source)), text)
+        for text in ['007', '00.5e']:
+            source = 'a: %s\n' % text
+            try:
+                expected = repr(regex(source))
+            except ValueError:
+                self.assertRaises(ValueError, plain, source)
+            else:
+                self.assertEqual(repr(plain(source)), expected)
+
 '''
 Failures -- add tests
         '[]\n a\n  b'
 
 '''
+
+class TestLoad(TestCase):
+    ''' load() reads from a file in chunks, and should give exactly
+        the same results (and errors) as loads() on the whole file.
+    '''
+
+    def check(self, text, chunk_sizes=(1, 2, 3, 7, 64, 4096)):
+        def result(func, *args, **kw):
+            try:
+                return func(*args, **kw)
+            except RSONDecodeError:
+                e = sys.exc_info()[1]
+                return str(e), e.pos, e.lineno, e.colno, e.endlineno, e.endcolno
+
+        expected = result(newloads, text)
+        for chunk_size in chunk_sizes:
+            self.assertEqual(result(load, BytesIO(text), chunk_size), expected)
+
+    def test_styles(self):
+        sourcedir = os.path.join(rootdir, 'styles')
+        for fname in os.listdir(sourcedir)[:10] + [os.path.join('..', 'styles.rson')]:
+            self.check(open(os.path.join(sourcedir, fname), 'rb').read(), (5, 64, 4096))
+
+    def test_chunk_boundaries(self):
+        text = b'''# comment
+a: 1
+b =
+    # not a comment
+    x
+
+    y
+c: """
+Now is the time \\""" for all
+""", d
+e: [1, 2,
+    3]
+'''
+        self.check(text)
+        self.check(text.replace(b'\n', b'\r\n'))
+
+    def test_errors(self):
+        for text in (b'a: [1, 2\n\n\n', b'a:\n  b: 1\n c: 2\n',
+                     b'x: """abc\n\ndef', b'{"a" 1}', b'a\n\n  b\nc: d\r\n'):
+            self.check(text)
+
+    def test_line_end_strings(self):
+        # A string that is not closed before the end of its line
+        # must be seen that way even when a chunk ends there.
+        for text in (b'{"a": "x\\" }\n', b'a: "x\\"\nb: 1\n', b'a: "abc\nb: 1\n',
+                     b'a: ["x\\\\", "y\\" ]\r\nb: 2\n', b'a:\n    "x \\" y\n    c\n',
+                     b'a = 1\nb: "x\\"', b'a: "\\\n'):
+            self.check(text, (1, 2, 3, 5, 7, 11, 64))
+
+
+class TestLazy(TestCase):
+    ''' Tokenizing on demand should not change any results.
+    '''
+    options = dict(lazy_tokens=True)
+
+    def test_lazy(self):
+        lazyloads = newloads.customize(**self.options)
+        sourcedir = os.path.join(rootdir, 'styles')
+        for fname in os.listdir(sourcedir) + [os.path.join('..', 'styles.rson')]:
+            text = open(os.path.join(sourcedir, fname), 'rb').read()
+            self.assertEqual(lazyloads(text), newloads(text))
+        text = 'a: """one\n  two \\""" three""", b\nc:\n  d =\n    e\n  f: 1\n'
+        self.assertEqual(lazyloads(text), newloads(text))
+
+    def test_early_error(self):
+        lazyloads = newloads.customize(**self.options)
+        text = 'a: [1, 2}\n' + 'b: c\n' * 1000
+        self.assertRaises(RSONDecodeError, lazyloads, text)
+        try:
+            lazyloads(text)
+        except RSONDecodeError:
+            e = sys.exc_info()[1]
+            self.assertEqual((e.lineno, e.colno, e.endlineno), (1, 9, 1001))
+
+
+class TestCompact(TestLazy):
+    ''' Neither should storing the tokens in a table of arrays.
+    '''
+    options = dict(compact_tokens=True)
+
+
+class TestLoadPath(TestCase):
+    ''' load_path() tokenizes the bytes of a memory-mapped file.
+    '''
+
+    def load_text(self, text):
+        fd, path = tempfile.mkstemp()
+        try:
+            os.write(fd, text)
+            os.close(fd)
+            return load_path(path)
+        finally:
+            os.remove(path)
+
+    def test_styles(self):
+        sourcedir = os.path.join(rootdir, 'styles')
+        for fname in os.listdir(sourcedir) + [os.path.join('..', 'styles.rson')]:
+            fname = os.path.join(sourcedir, fname)
+            self.assertEqual(load_path(fname), newloads(open(fname, 'rb').read()))
+
+    def test_line_endings(self):
+        text = b'a: """one\n  \\"""two"""\nb =\n    c\n\n    d\ne: [1, \xc3\xa9]\n'
+        expected = newloads(text)
+        for newline in (b'\n', b'\r\n', b'\r'):
+            self.assertEqual(self.load_text(text.replace(b'\n', newline)), expected)
+        self.assertRaises(RSONDecodeError, self.load_text, b'')
+
+    def test_errors(self):
+        try:
+            self.load_text(b'x:\r\n  \xc3\xa9 \xc3\xa9: [1, 2}\r\n\r\n')
+        except RSONDecodeError:
+            e = sys.exc_info()[1]
+            self.assertEqual((e.lineno, e.colno, e.endlineno, e.endcolno), (2, 13, 3, 1))
+        else:
+            self.fail('Expected RSONDecodeError')
+
+
+class TestLocations(TestCase):
+    ''' with_locations=True returns a LocationMap along with the result.
+    '''
+
+    text = ('top:\n'
+            '    name = thing\n'
+            '    values: [1, 2, {"x": 3}]\n'
+            '    a: b: c\n'
+            'list:\n'
+            '    one\n'
+            '    [two, three]\n')
+
+    expected = {
+        ('top',): (1, 1),
+        ('top', 'name'): (2, 5),
+        ('top', 'values'): (3, 5),
+        ('top', 'values', 2): (3, 20),
+        ('top', 'values', 2, 'x'): (3, 21),
+        ('top', 'a'): (4, 5),
+        ('top', 'a', 'b'): (4, 5),
+        ('list', 0): (6, 5),
+        ('list', 1, 1): (7, 11),
+    }
+
+    def check(self, result):
+        value, locations = result
+        self.assertEqual(value, newloads(self.text))
+        for path, (line, col) in self.expected.items():
+            self.assertEqual((locations.line(path), locations.col(path)), (line, col))
+        self.assertEqual(len(locations), 14)
+        return locations
+
+    def test_locations(self):
+        text = self.text
+        locations = self.check(newloads(text, with_locations=True))
+        self.assertEqual(locations[('top', 'name')], text.index('name'))
+        self.assertEqual(locations.position(('list', 0)), (text.index('one'), 6, 5))
+        self.check(newloads(text, with_locations=True, lazy_tokens=True))
+        self.check(newloads(text, with_locations=True, compact_tokens=True))
+        for chunk_size in (1, 5, 64):
+            self.check(load(BytesIO(text.encode('utf-8')), chunk_size, with_locations=True))
+
+    def test_top_array(self):
+        value, locations = newloads('[1,\n 2]', with_locations=True)
+        self.assertEqual(value, [1, 2])
+        self.assertEqual(dict((x, locations.position(x)) for x in locations),
+                         {(0,): (1, 1, 2), (1,): (5, 2, 2)})
+
+
+class TestJsonRegions(TestCase):
+    ''' Strict JSON regions are decoded by the stdlib scanner, and
+        must give the same results (and errors) as parsing them
+        token by token.
+    '''
+
+    sources = [
+        'a: [1, 2, {"x": [3, 4.5e3, -0, true, null]}]\nb: {"k": 1, "k": {"z": 1}, "k": {"y": 2}}',
+        'a: [1,\n  2,\n    {"x": 3}]\nb:\n   c: [1, 2]\n   d: 3\n',
+        'a: [1,\n  2,\n    {"x": 3}]\n  b: 2\nc: [1, 2]\n    d: }\n',
+        '[1, 2,]', '[1, NaN]', '[1, 0x10, +1, 1.]', '[[1,2],[3,x],[4,5]]', '[1, 2',
+        '{"a" 1}', '["a", "b\\x"]', 'x: [1, "a\\ud800", 2]', 'x: ["a\\ud800\\udc00"]',
+        '[1,\n 2, "\t"]', '[1, 2]\n[3, 4]', 'a: {}\nb: []', '[1, 2] junk',
+        'tags: [\n    a, b\n]\n', 'a: {"x":\n   [1,\n    2]}\n', '[1,\n 2\n', '["a\n b"]',
+        'a: [%s]\nb: [%s,\n x]\n' % (',\n'.join(map(str, range(100))), ',\n'.join(map(str, range(100)))),
+    ]
+
+    def check(self, options):
+        def result(func, s):
+            try:
+                return func(s)
+            except RSONDecodeError:
+                e = sys.exc_info()[1]
+                return str(e)
+        delegated = newloads.customize(**options)
+        tokenized = newloads.customize(delegate_json=False, **options)
+        for s in self.sources:
+            self.assertEqual(result(delegated, s), result(tokenized, s))
+
+    def test_regions(self):
+        self.check({})
+        self.check(dict(lazy_tokens=True))
+        self.check(dict(use_decimal=True, object_hook=dict))
+
+
+class TestEquals(TestCase):
+    ''' Free-format = blocks, with the dedenting done up front or
+        left to the first use of the string.
+    '''
+
+    source = '\n'.join([
+        'a = 5.0',
+        'b =',
+        '   one',
+        '     two  ',
+        '# comment',
+        '',
+        '   three',
+        '    ',
+        'c =   x',
+        '     y',
+        'd = """ not a string',
+        '  [1, 2]',
+        'e: 1',
+    ])
+
+    result = {'a': 5.0, 'b': ' one\n   two\n\n three\n', 'c': '  x\n   y\n',
+              'd': '""" not a string\n[1, 2]\n', 'e': 1}
+
+    def test_equals(self):
+        self.assertEqual(newloads(self.source), self.result)
+
+    def test_lazy(self):
+        result = newloads(self.source, lazy_equals=10)
+        self.assertEqual(result['a'], 5.0)
+        views = [x for x in result if type(result[x]).__name__ == 'EqualsView']
+        self.assertEqual(sorted(views), ['b', 'c', 'd'])
+        # Only the source is kept, not the tokens
+        self.assertEqual(sorted(vars(result['c'])), ['block', 'finish', 'source'])
+        self.assertEqual(result['c'].source, self.source)
+        self.assertEqual(result['b'].splitlines()[1], '   two')
+        for x in views:
+            result[x] = str(result[x])
+        self.assertEqual(result, self.result)
+
+    def test_override(self):
+        # A replacement parse_equals() gets the lines of the block
+        from rson.base import RsonSystem
+        class Upper(RsonSystem):
+            @staticmethod
+            def parse_equals(stringlist, indent, token):
+                return RsonSystem.parse_equals([x.upper() for x in stringlist], indent, token)
+        expected = dict((key, value.upper() if isinstance(value, basestring) else value)
+                        for key, value in self.result.items())
+        loads = Upper.dispatcher_factory()
+        self.assertEqual(loads(self.source), expected)
+        result = loads(self.source, lazy_equals=10)
+        self.assertEqual(dict((key, result[key] if key in 'ae' else str(result[key]))
+                              for key in result), expected)
+
+    def test_lite(self):
+        # rson.lite's raw_object wraps = strings in a list
+        from rson.lite import loads
+        self.assertEqual(loads('a = b\nc\n  d = e\n'), [('a', ['b']), ('c', [('d', ['e'])])])
+
+
+class TestIterative(TestCase):
+    ''' The explicit-stack parser should give the same results and
+        errors as the recursive one, at any nesting depth.
+    '''
+
+    sources = TestJsonRegions.sources + [
+        'a:\n  b:\n    c: 1\n    d: [2, {"e": 3}]\n  f =\n    g\nh: 4\n',
+        '[]\n  1\n  {}\n    a: 2\n  [3]\n', 'a: b: c: 1\n', 'a:\n  b: 1\n c: 2\n',
+        '{"a": 1, "a": [2]}', '1\n2\n  3\n', 'a: []\n  1\n  2\n', '{1: 2}',
+    ]
+
+    def test_iterative(self):
+        def result(func, s):
+            try:
+                return func(s)
+            except RSONDecodeError:
+                e = sys.exc_info()[1]
+                return str(e)
+        for options in ({}, dict(delegate_json=False)):
+            recursive = newloads.customize(**options)
+            iterative = newloads.customize(iterative_parser=True, **options)
+            for s in self.sources:
+                self.assertEqual(result(iterative, s), result(recursive, s))
+            sourcedir = os.path.join(rootdir, 'styles')
+            for fname in os.listdir(sourcedir) + [os.path.join('..', 'styles.rson')]:
+                text = open(os.path.join(sourcedir, fname), 'rb').read()
+                self.assertEqual(iterative(text), recursive(text))
+
+    def test_deep(self):
+        depth = sys.getrecursionlimit() * 2
+        iterative = newloads.customize(iterative_parser=True, delegate_json=False)
+        value = iterative('x: ' + '[' * depth + ']' * depth)['x']
+        for i in range(depth - 1):
+            value, = value
+        self.assertEqual(value, [])
+        text = ''.join(' ' * i + 'k:\n' for i in range(depth)) + ' ' * depth + 'v'
+        value = iterative(text)
+        for i in range(depth):
+            value = value['k']
+        self.assertEqual(value, 'v')
+
+
+class TestIterparse(TestCase):
+    ''' The events from iterparse() should build the same values as
+        loads(), for indented RSON and bracketed JSON.
+    '''
+
+    sources = TestIterative.sources + [
+        'a: 1\nb:\n  [1, {"c": 2}]\n  x\n', '{}\n  a: 1\n', 'x: [{"a": []}, {}]\n',
+        '{"a": 1}\n{"b": [2]}\n', 'a: {}\n  b = text\nc: [[], [[]]]\n',
+    ]
+
+    @staticmethod
+    def build(events):
+        stack = [([], None)]
+        for event, value in events:
+            if event in ('start_map', 'start_array'):
+                stack.append(({} if event == 'start_map' else [], None))
+                continue
+            if event == 'map_key':
+                stack[-1] = stack[-1][0], value
+                continue
+            if event in ('end_map', 'end_array'):
+                value = stack.pop()[0]
+            container, key = stack[-1]
+            if key is None:
+                container.append(value)
+            elif isinstance(value, dict) and isinstance(container.get(key), dict):
+                container[key].update(value)
+            else:
+                container[key] = value
+        value, = stack
+        value = value[0]
+        return value[0] if len(value) == 1 else value
+
+    def test_iterparse(self):
+        def result(func, s):
+            try:
+                return func(s)
+            except RSONDecodeError:
+                e = sys.exc_info()[1]
+                return e.lineno, e.colno
+        build = self.build
+        for s in self.sources:
+            if s == '{"a": 1}\n{"b": [2]}\n':
+                expected = [{'a': 1}, {'b': [2]}]
+            else:
+                expected = result(newloads, s)
+            self.assertEqual(result(lambda s: build(iterparse(s)), s), expected)
+            self.assertEqual(result(lambda s: build(iterparse(BytesIO(s.encode('utf-8')), chunk_size=3)), s), expected)
+        sourcedir = os.path.join(rootdir, 'styles')
+        for fname in os.listdir(sourcedir) + [os.path.join('..', 'styles.rson')]:
+            text = open(os.path.join(sourcedir, fname), 'rb').read()
+            self.assertEqual(build(iterparse(text)), newloads(text))
+
+    def test_events(self):
+        self.assertEqual(list(iterparse('a: 1\nb:\n  [1, {"c": 2}]\n  x\n', offsets=True)), [
+            ('start_map', None, 0), ('map_key', 'a', 0), ('scalar', 1, 3),
+            ('map_key', 'b', 5), ('start_array', None, 10),
+            ('start_array', None, 10), ('scalar', 1, 10), ('start_map', None, 10),
+            ('map_key', 'c', 10), ('scalar', 2, 10), ('end_map', None, 10), ('end_array', None, 10),
+            ('scalar', 'x', 26), ('end_array', None, 10), ('end_map', None, 0)])
+        self.assertEqual(list(iterparse('[1, {"c": [2]}]', offsets=True)), [
+            ('start_array', None, 0), ('scalar', 1, 1), ('start_map', None, 4),
+            ('map_key', 'c', 5), ('start_array', None, 10), ('scalar', 2, 11),
+            ('end_array', None, 10), ('end_map', None, 4), ('end_array', None, 0)])
+
+    def test_lazy(self):
+        events = iterparse('- 1\n- 2\n[\n')
+        self.assertEqual([next(events) for i in range(3)],
+                         [('start_array', None), ('scalar', '- 1'), ('scalar', '- 2')])
+        self.assertRaises(RSONDecodeError, list, events)
+
+
+class TestIterItems(TestCase):
+    ''' iter_items() should yield the elements or pairs of the
+        top-level value that loads() returns, one at a time.
+    '''
+
+    sources = TestIterparse.sources + [
+        '{"a": 1}\n{"b": [2]}\n', '-\n  a: 1\n+\n  b: 2\n', '[]\n  1\n  {}\n', 'x\n', '[1, 2]\n', '{"a": 1, "b": 2}',
+    ]
+
+    def test_iter_items(self):
+        def result(func, s):
+            try:
+                return func(s)
+            except RSONDecodeError:
+                e = sys.exc_info()[1]
+                return e.lineno, e.colno
+        def expected(s):
+            value = newloads(s)
+            if isinstance(value, dict):
+                return dict(value)
+            return list(value) if isinstance(value, list) else [value]
+        def items(s, stream=False):
+            value = list(iter_items(BytesIO(s.encode('utf-8')) if stream else s))
+            return dict(value) if isinstance(newloads(s), dict) else value
+        for s in self.sources:
+            if s == '{"a": 1, "a": [2]}':
+                continue
+            self.assertEqual(result(items, s), result(expected, s))
+            self.assertEqual(result(lambda s: items(s, True), s), result(expected, s))
+
+    def test_early_exit(self):
+        items = iter_items('- 1\n- 2\n[\n')
+        self.assertEqual([next(items) for i in range(2)], ['- 1', '- 2'])
+        self.assertRaises(RSONDecodeError, list, items)
+        self.assertEqual(list(iter_items('a: 1\na: 2\n')), [('a', 1), ('a', 2)])
+        self.assertEqual(list(iter_items('a: b: 1\n')), [('a', {'b': 1})])
+        self.assertEqual(list(iter_items('a: b: 1\na: c: 2\n')), [('a', {'b': 1}), ('a', {'c': 2})])
+
+
+class TestSelect(TestCase):
+    ''' select= should give the selected parts of the loads() result.
+    '''
+
+    source = '''
+server:
+    host = example.com
+    port: 80
+    tls: {"cert": "a.pem", "key": "a.key"}
+users:
+    {}
+        name: ann
+        groups: [admin, dev]
+    {}
+        name: bob
+data: [1, {"x": 2, "y": [3]}, {"x": 4}]
+one:
+    [{"x": 5}]
+'''
+
+    def test_select(self):
+        def select(*paths):
+            return newloads(self.source, select=list(paths))
+        self.assertEqual(select('server.port'), {'server': {'port': 80}})
+        self.assertEqual(select('server.tls.cert', 'data.*.x'),
+                         {'server': {'tls': {'cert': 'a.pem'}}, 'data': [{'x': 2}, {'x': 4}]})
+        self.assertEqual(select('*.host'), {'server': {'host': 'example.com'}})
+        self.assertEqual(select('users.*.groups'), {'users': [{'groups': ['admin', 'dev']}]})
+        self.assertEqual(select('one.*.x'), {'one': [{'x': 5}]})
+        self.assertEqual(select('server'), {'server': newloads(self.source)['server']})
+        self.assertEqual(select('missing', 'server.port.x'), {})
+        self.assertEqual(newloads('{}\n  a: 1\n  b: 2\n{}\n  a: 3\nx\n', select='*.a'), [{'a': 1}, {'a': 3}])
+
+    def test_skipped(self):
+        # Unselected values are not converted
+        source = 'a: 1\nb: [1, {"c": [2, 3]}, ]\nc:\n    d = %s\n    e: "\\x"\n' % ('x' * 100)
+        self.assertEqual(newloads(source, select=['a']), {'a': 1})
+        self.assertRaises(RSONDecodeError, newloads, source)
+
+    def test_chained(self):
+        source = 'k1: sub: x: 3\nk2: sub:\n    k0: 1\n    k1: [2]\n'
+        for path in ('k1.sub.x', 'k2.sub.k0', 'k2.sub.k1', 'k2.sub', 'k2.*.k1'):
+            self.assertEqual(newloads(source, select=[path]),
+                             self.select_from(newloads(source), path.split('.')), path)
+
+    @classmethod
+    def select_from(cls, value, path):
+        if not path:
+            return value
+        key, path = path[0], path[1:]
+        keys = list(value) if key == '*' else [key] if key in value else []
+        result = {}
+        for key in keys:
+            if not path:
+                result[key] = value[key]
+            elif isinstance(value[key], dict):
+                selected = cls.select_from(value[key], path)
+                if selected:
+                    result[key] = selected
+        return result
+
+class TestLoadsLazy(TestCase):
+
+    source = TestSelect.source + 'broken: [1, 2}\n'
+
+    @classmethod
+    def plain(cls, value):
+        if isinstance(value, Mapping):
+            return dict((key, cls.plain(value[key])) for key in value)
+        if isinstance(value, (list, Sequence)) and not isinstance(value, basestring):
+            return [cls.plain(x) for x in value]
+        return value
+
+    def test_loads_lazy(self):
+        good = self.source.split('broken')[0]
+        for source in (good, '1\n2\n[3]\n', '[1, 2]', 'x: 1\ny:\n  z: 2\nx: 3\n', 'a:\n  b'):
+            self.assertEqual(self.plain(loads_lazy(source)), newloads(source))
+
+    def test_on_demand(self):
+        result = loads_lazy(self.source)
+        self.assertEqual(sorted(result), ['broken', 'data', 'one', 'server', 'users'])
+        self.assertEqual(result.server.tls['cert'], 'a.pem')
+        self.assertEqual(result['users'][1], {'name': 'bob'})
+        self.assertTrue(result['server'] is result['server'])
+        self.assertRaises(RSONDecodeError, result.get, 'broken')
+        self.assertRaises(RSONDecodeError, newloads, self.source)
+        self.assertRaises(RSONDecodeError, loads_lazy, 'a: 1\nb: [2, 3\n')
+
+    def test_same_line_errors(self):
+        # Anything after an array element on its line is reported
+        # the way loads() reports it.
+        for source in ('1\n2 : 3\n', '[1]\n[2] x\n', '1\n[2], 3\n', 'a:\n  1\n  2 = x\n'):
+            errors = []
+            for loads in (newloads, loads_lazy):
+                try:
+                    self.plain(loads(source))
+                except RSONDecodeError as err:
+                    errors.append((str(err), err.pos))
+            self.assertEqual(len(errors), 2, source)
+            self.assertEqual(errors[1], errors[0])
+
+class TestParseCache(TestCase):
+
+    def test_cache(self):
+        cache = newloads.cache(maxsize=2)
+        first = cache('a: 1\nb: [1, 2]\n')
+        first.b.append(3)
+        self.assertEqual(cache('a: 1\nb: [1, 2]\n'), {'a': 1, 'b': [1, 2]})
+        self.assertEqual(cache(b'a: 1\nb: [1, 2]\n', select=['a']), {'a': 1})
+        cache('c: 3')
+        errors = []
+        for i in range(2):
+            try:
+                cache('a: [1, 2}')
+            except RSONDecodeError as err:
+                errors.append(err)
+        self.assertEqual([str(x) for x in errors], [str(errors[0])] * 2)
+        self.assertFalse(errors[0] is errors[1])
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions'], stats['entries']),
+                         (2, 4, 2, 2))
+        shared = newloads.cache(copy=False)
+        self.assertTrue(shared('a: [1]') is shared('a: [1]'))
+        shared.enabled = False
+        self.assertFalse(shared('a: [1]') is shared('a: [1]'))
+
+class TestParseDocument(TestCase):
+
+    source = 'a:\n    b: 1\n    c:\n        d: [1, 2]\n    e = text\nf: 2\ng:\n    h: 3\n'
+
+    def test_reparse(self):
+        document = parse_document(self.source)
+        self.assertEqual(document.value, newloads(self.source))
+        for old, new in (('[1, 2]', '[1, 3]'), ('f: 2', 'f: 2\nx: 4'), ('h: 3', 'h: 3 i: 4'),
+                         ('g:', '#\ng:'), ('text', '"""\n'), ('f: 2', '  f: 2'),
+                         ('b: 1', 'b: 1\n    b: 2'), ('e = text', 'e = text\n      more')):
+            source = self.source.replace(old, new)
+            try:
+                expected = newloads(source)
+            except RSONDecodeError:
+                self.assertRaises(RSONDecodeError, document.reparse, source)
+            else:
+                self.assertEqual(document.reparse(source).value, expected)
+
+    def test_random_edits(self):
+        # Random sequences of line and character edits
+        lines = ['k: 1\n', 'j:\n', '    a: 2\n', '    b:\n', '        c: 3\n', '    line 0\n',
+                 '    # c\n', 'k =x\n', '\n', '    x: [1,\n', '    2]\n', 'z: sub:\n', '  y: 1\n']
+        pieces = ['k', 'x', ':', ': ', ' ', '    ', '\n', '\n    ', '1', '[1, 2]', '{"a": 1}',
+                  '# c', '= text', '"s"', 'sub:', ',', '[]']
+        rnd = random.Random(42)
+        for i in range(50):
+            source = self.source
+            document = parse_document(source)
+            for j in range(30):
+                if rnd.random() < 0.5:
+                    pos = rnd.choice([0] + [k + 1 for k, c in enumerate(source) if c == '\n'])
+                    text = rnd.choice(lines)
+                else:
+                    pos = rnd.randrange(len(source) + 1)
+                    text = rnd.choice(pieces)
+                new = source[:pos] + text + source[pos + rnd.choice([0, 0, 1, 3, len(text)]):]
+                try:
+                    expected = newloads(new)
+                except (RSONDecodeError, ValueError):
+                    self.assertRaises((RSONDecodeError, ValueError), document.reparse, new)
+                    continue
+                document = document.reparse(new)
+                self.assertEqual(document.value, expected, (source, new))
+                source = new
+
+    def test_reuse(self):
+        document = parse_document(self.source)
+        value = document.value
+        edited = document.reparse(self.source.replace('[1, 2]', '[1, 3]'))
+        self.assertEqual(edited.value.a.c.d, [1, 3])
+        self.assertTrue(edited.value.g is value.g)
+        self.assertTrue(edited.value.a.e is value.a.e)
+        self.assertFalse(edited.value.a is value.a)
+        self.assertTrue(edited.reparse(edited.source) is edited)
+
+class TestBulk(TestCase):
+
+    def test_loads_many(self):
+        sources = ['a: 1', '[1, 2', '{"a": [1,],}', 'x']
+        custom = newloads.customize(disallow_trailing_commas=False)
+        for loads in newloads, custom:
+            for workers in 1, 2:
+                results = list(loads.loads_many(sources, workers=workers, chunksize=1))
+                self.assertEqual([x[0] for x in results], [0, 1, 2, 3])
+                self.assertEqual(results[0][1:], ({'a': 1}, None))
+                self.assertTrue(isinstance(results[1][2], RSONDecodeError))
+                self.assertEqual(results[2][1] is None, loads is newloads)
+        results = loads_many(sources, ordered=False, workers=2, chunksize=1)
+        self.assertEqual(sorted(x[0] for x in results), [0, 1, 2, 3])
+
+    def test_unpicklable(self):
+        # rson.lite returns its unquoted strings as UserHandledToken
+        from rson.lite import loads
+        results = list(loads.loads_many(['a: 1', 'b'], workers=2, chunksize=1))
+        self.assertEqual([x[0] for x in results], [0, 1])
+        for index, value, err in results:
+            self.assertTrue(value is None and isinstance(err, Exception))
+
+    def test_load_files(self):
+        handle, path = tempfile.mkstemp()
+        try:
+            os.write(handle, b'a: [1, 2]\n')
+            os.close(handle)
+            results = list(load_files([path, path + '.missing'], workers=2, chunksize=1))
+        finally:
+            os.remove(path)
+        self.assertEqual(results[0], (path, {'a': [1, 2]}, None))
+        self.assertTrue(isinstance(results[1][2], EnvironmentError))
+
+class TestLoadsParallel(TestCase):
+
+    def test_loads_parallel(self):
+        entries = ['k%d:\n    a: %d\n    b: """\ntext\n"""\n' % (i % 7, i) for i in range(40)]
+        elements = ['{}\n    x: [%d,\n2]\n' % i for i in range(40)]
+        for source in ''.join(entries), ''.join(elements), 'a: 1\n', '[1, 2]\n3\n':
+            self.assertEqual(loads_parallel(source, workers=2), newloads(source))
+
+    def test_errors(self):
+        source = ''.join('k%d: %d\n' % (i, i) for i in range(40)) + 'x: [1,\n2}\n'
+        errors = []
+        for loads in newloads, loads_parallel:
+            try:
+                loads(source)
+            except RSONDecodeError as err:
+                errors.append((str(err), err.lineno))
+        self.assertEqual(errors, [('Expected "," or "]": line 42, column 2, text \'}\'', 42)] * 2)
+
+class TestPushParser(TestCase):
+
+    def test_feed(self):
+        entries = ''.join('k%d:\n    a: [%d,\n2]\n    b = """\ntext\n"""\r\n' % (i % 7, i)
+                          for i in range(40))
+        for source in entries, entries + 'x: [1,\n2}\n', '1\n2\n', 'a: "\xe9"\n':
+            data = source.encode('utf-8')
+            results = []
+            for size in 1, 7, 100, len(data):
+                parser = push_parser()
+                for i in range(0, len(data), size):
+                    parser.feed(data[i:i + size])
+                try:
+                    results.append(parser.close())
+                except RSONDecodeError as err:
+                    results.append((str(err), err.lineno))
+            try:
+                expected = newloads(source)
+            except RSONDecodeError as err:
+                expected = str(err), err.lineno
+            self.assertEqual(results, [expected] * 4)
+
+    def test_aload(self):
+        if aload is None:
+            return
+        import asyncio
+        source = b'a: 1\nb:\n    c: [1, 2]\n'
+        async def run():
+            reader = asyncio.StreamReader()
+            reader.feed_data(source)
+            reader.feed_eof()
+            return await aload(reader, chunk_size=3)
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertEqual(loop.run_until_complete(run()), newloads(source))
+        finally:
+            loop.close()
+
+class TestAcyclicObjects(TestCase):
+
+    def test_acyclic(self):
+        import gc
+        source = 'a:\n    b: 1\n    items: [x]\nc:d: 2\na:\n    e: {"f": 3}\n'
+        loads = newloads.customize(acyclic_objects=True, suspend_gc=True)
+        value = loads(source)
+        self.assertEqual(value, newloads(source))
+        self.assertEqual((value.a.b, value.a.e.f, value.c.d), (1, 3, 2))
+        self.assertEqual(list(value.a.items()), [('b', 1), ('items', ['x']), ('e', {'f': 3})])
+        self.assertRaises(AttributeError, getattr, value, 'x')
+        self.assertTrue(gc.isenabled())
+        gc.collect()
+        gc.disable()
+        try:
+            del value
+            loads(source)
+            self.assertEqual(gc.collect(), 0)
+        finally:
+            gc.enable()
+
+class TestFrozen(TestCase):
+
+    def test_frozen(self):
+        import copy
+        import operator
+        import pickle
+        source = 'a:\n    b: 1\n    items: [x, {y: [2]}]\nc:d: 2\na:\n    e: {"f": 3}\n'
+        value = newloads(source, frozen=True)
+        def thaw(value):
+            if isinstance(value, tuple):
+                return [thaw(x) for x in value]
+            if isinstance(value, Mapping):
+                return dict((key, thaw(x)) for key, x in value.items())
+            return value
+        self.assertEqual(thaw(value), newloads(source))
+        self.assertEqual((value.a.b, value.a.e.f, value.c.d), (1, 3, 2))
+        self.assertEqual(value.a['items'], ('x', {'y': (2,)}))
+        self.assertRaises(AttributeError, setattr, value, 'a', 1)
+        self.assertRaises(TypeError, operator.setitem, value, 'a', 1)
+        other = newloads(source, frozen=True)
+        self.assertEqual({value: 1}[other], 1)
+        self.assertEqual(hash(value), hash(other))
+        self.assertNotEqual(value, newloads(source + 'g: 4\n', frozen=True))
+        self.assertTrue(copy.deepcopy(value) is value)
+        self.assertEqual(pickle.loads(pickle.dumps(value)), value)
+        self.assertEqual(newloads(source, frozen=True, with_locations=True)[0], value)
+
+    def test_merged(self):
+        def thaw(value):
+            if isinstance(value, tuple):
+                return [thaw(x) for x in value]
+            if isinstance(value, Mapping):
+                return dict((key, thaw(x)) for key, x in value.items())
+            self.assertFalse(isinstance(value, (list, dict)))
+            return value
+        sources = ['a: b: 1\na: c: 2\n', 'a:\n  b: 1\na: c: 2\n', 'a: b: c: 1\na: b: d: 2\na: e: 3\n',
+                   '[]\n  1\n  {}\n    a: 2\n  [3]\n', 'x: {}\n  a: [1, [2]]\n', '[[1], [2, [3]]]',
+                   'a: [1, {"b": [2]}]\na: {"c": 1}\n', '[1, 2]: x\n']
+        for loads in newloads, newloads.customize(iterative_parser=True, disallow_nonstring_keys=False):
+            for source in sources[:-1] + sources[-1:] * (loads is not newloads):
+                self.assertEqual(thaw(loads(source, frozen=True)), loads(source))
+        self.assertRaises(ValueError, newloads, 'a: 1', frozen=True, object_hook=dict)
+
+    def test_iter_items(self):
+        sources = ['[1, [2]]\n{"a": [3]}\n', '[[1], {"a": [2]}]', '{"a": [1]}',
+                   'a: [1, [2]]\nb: c: [3]\n', '[]\n  [1]\n  {}\n    a: [2]\n']
+        for source in sources:
+            value = newloads(source, frozen=True)
+            expected = list(value.items()) if isinstance(value, Mapping) else list(value)
+            self.assertEqual(list(iter_items(source, frozen=True)), expected)
+
+class TestSchema(TestCase):
+
+    schema = {'type': 'object', 'required': ['server'], 'additionalProperties': False,
+              'properties': {
+                  'server': {'type': 'object', 'required': ['host'], 'properties': {
+                      'host': {'type': 'string'},
+                      'port': {'type': 'integer', 'minimum': 1, 'maximum': 65535}}},
+                  'users': {'type': 'array', 'items': {'required': ['name']}}}}
+
+    def test_valid(self):
+        source = 'server:\n    host = example.com\n    port: 80\nusers: [{"name": "x"}]\n'
+        self.assertEqual(newloads(source, schema=self.schema),
+                         {'server': {'host': 'example.com', 'port': 80},
+                          'users': [{'name': 'x'}]})
+        self.assertEqual(newloads('[1, 2]', schema={'items': {'type': 'integer'}}), [1, 2])
+
+    def test_frozen(self):
+        # frozen=True builds frozen_objects, which are Mappings but not dicts
+        source = 'server:\n    host = example.com\nusers: [{"name": "x"}]\n'
+        value = newloads(source, schema=self.schema, frozen=True)
+        self.assertEqual(value, newloads(source, frozen=True))
+        schema = {'type': 'object', 'properties': {'a': {'type': 'object'}}}
+        self.assertEqual(newloads('a:\n  b: 1\nc: [1, 2]\n', schema=schema, frozen=True),
+                         newloads('a:\n  b: 1\nc: [1, 2]\n', frozen=True))
+        self.assertRaises(RSONDecodeError, newloads, 'server:\n    port: 80\n',
+                          schema=self.schema, frozen=True)
+
+    def test_violations(self):
+        for source, message, lineno, colno in (
+                ('server:\n    host = x\n    port: 0\n', 'server.port: expected at least 1', 3, 5),
+                ('server:\n    host = x\n    port: [80]\n', 'server.port: expected integer', 3, 5),
+                ('server:\n    host = x\nextra: 1\n', "top: unexpected key 'extra'", 3, 1),
+                ('users: [{"name": "x"}]\nserver:\n    port: 80\n',
+                 "server: missing required key 'host'", 2, 1),
+                ('users:\n    [{"name": "x"},\n     {}]\nserver: {host: x}\n',
+                 "users[]: missing required key 'name'", 3, 6)):
+            for loads in (newloads, newloads.customize(iterative_parser=True),
+                          newloads.customize(frozen=True)):
+                try:
+                    loads(source, schema=self.schema)
+                except RSONDecodeError as err:
+                    self.assertTrue(str(err).startswith('Schema violation at ' + message), err)
+                    self.assertEqual((err.lineno, err.colno), (lineno, colno), err)
+                else:
+                    self.fail(source)
+
+class TestNumericArrays(TestCase):
+
+    def test_arrays(self):
+        from array import array
+        def plain(value):
+            if isinstance(value, (list, array)):
+                return [plain(x) for x in value]
+            return value
+        source = ('a: [1, -2, 3]\nb: [1, 2.5, 1e3]\nc: [[1, 2], [3.5, 4]]\n'
+                  'd:\n    1\n    2\ne: [1, x]\nf: [true, 1]\ng: []\nh: [0x10, 1_000]\n'
+                  'i: [123456789012345678901234567890]\n')
+        for loads in (newloads, newloads.customize(delegate_json=False),
+                      newloads.customize(delegate_json=False, iterative_parser=True)):
+            value = loads(source, numeric_arrays='array')
+            self.assertEqual(value.a, array('q', [1, -2, 3]))
+            self.assertEqual(value.b, array('d', [1, 2.5, 1000]))
+            self.assertEqual(value.c, [array('q', [1, 2]), array('d', [3.5, 4])])
+            self.assertEqual(value.d, array('q', [1, 2]))
+            self.assertEqual(value.h, array('q', [16, 1000]))
+            for key in 'efgi':
+                self.assertEqual(type(value[key]), list)
+            self.assertEqual(dict((key, plain(x)) for key, x in value.items()), loads(source))
+        self.assertRaises(RSONDecodeError, newloads, '[1, 2', numeric_arrays='array',
+                          delegate_json=False)
+        self.assertEqual(newloads('[1, 2]', numeric_arrays=True), array('q', [1, 2]))
+        self.assertRaises(ValueError, newloads, '[1, 2]', numeric_arrays='list')
+
+    def test_numpy(self):
+        try:
+            import numpy
+        except ImportError:
+            return
+        value = newloads('a: [[1, 2], [3.5, 4]]\nb: [1, 2]\n', numeric_arrays='numpy')
+        self.assertEqual((value.a.shape, value.a.dtype), ((2, 2), numpy.float64))
+        self.assertEqual(value.b.dtype, numpy.int64)
+        self.assertEqual(value.a.tolist(), [[1, 2], [3.5, 4]])
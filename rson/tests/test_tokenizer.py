@@ -94,3 +94,53 @@ class TestTokenizer(TestCase):
     def test_simple(self):
         self.basic_check('x==y\nz:37')
         map(self.basic_check, samples)
+
+    def test_lazy(self):
+        from rson.base import Tokenizer
+        self.check_factory(Tokenizer.lazy_factory())
+
+    def test_compact(self):
+        from rson.base import Tokenizer
+        self.check_factory(Tokenizer.compact_factory())
+
+    def check_factory(self, lazy):
+        for s in ['x==y\nz:37', '# comment\n a: [1, 2]\n\n   b = c'] + samples:
+            expected = [x[:-1] for x in reversed(self.t(s, self))]
+            tokens = lazy(s, self)
+            self.assertEqual(tokens.peek()[:-1], expected[0])
+            self.assertEqual(tokens.lookahead(1)[:-1], expected[1])
+            result = []
+            while 1:
+                try:
+                    token = tokens.next()
+                except IndexError:
+                    break
+                self.assertTrue(token[-1] is tokens)
+                result.append(token[:-1])
+            self.assertEqual(result, expected)
+
+    def test_triple_quoted(self):
+        # The whole string is one token, however many lines it has.
+        s = 'a: """one\n  \\"""two"""  \nb: [1]'
+        tokens = [x[1:6] for x in reversed(self.t(s, self))]
+        self.assertEqual(tokens[2], ('"', '"""one\n  \\"""two"""', '  ', '\n', 1))
+        self.assertEqual(tokens[3], ('X', 'b', '', '\n', 3))
+
+    def test_equals_block(self):
+        # With equals given, the contents of free-format blocks are
+        # skipped over, even if they look like the start of a string.
+        from rson.base import Tokenizer
+        s = 'x:\n  a = b\n    """ c\n\n  # d\n      e: """\n  f: 1\n'
+        expected = [('X', 'x', 1), (':', ':', 1), ('X', 'a', 2), ('=', '=', 2),
+                    ('X', 'f', 7), (':', ':', 7), ('X', '1', 7), ('@', '@', 9)]
+        for factory in (Tokenizer.factory, Tokenizer.lazy_factory, Tokenizer.compact_factory):
+            tokens = factory('=')(s, self)
+            result = []
+            while 1:
+                try:
+                    token = tokens.next()
+                except IndexError:
+                    break
+                result.append((token[1], token[2], token[5]))
+            self.assertEqual(result, expected)
+
@@ -0,0 +1,540 @@
+#!/usr/bin/env python
+'''
+Benchmarks for rson.
+
+Usage:  bench.py [name ...]
+
+With no names, all the benchmarks are run.  Each benchmark
+prints a line per variant with the elapsed time and (where
+tracemalloc is available) the peak memory allocated while
+running it.
+'''
+
+import sys
+import os
+import time
+import io
+import itertools
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import rson
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+benchmarks = []
+
+def benchmark(func):
+    benchmarks.append(func)
+    return func
+
+def measure(name, func, repeat=3, trace=True):
+    ''' Run func repeat times, and report the best time and
+        (if trace is true) the peak memory of a final traced run.
+    '''
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    peak = ''
+    if tracemalloc is not None and trace:
+        tracemalloc.start()
+        func()
+        peak = ' %8.1f MB peak' % (tracemalloc.get_traced_memory()[1] / 1e6)
+        tracemalloc.stop()
+    print('    %-36s %8.3f s%s' % (name, best, peak))
+    return best
+
+def make_config(count):
+    ''' A generated indented RSON document with count entries
+    '''
+    result = []
+    for i in range(count):
+        result.append('item%d:\n    name = thing %d\n    values: [%d, %d, 3]\n'
+                      '    flag: true\n' % (i, i, i, i))
+    return ''.join(result).encode('utf-8')
+
+@benchmark
+def load():
+    ''' load() from a file object vs loads() of the whole file
+    '''
+    source = make_config(20000)
+    measure('loads', lambda: rson.loads(source))
+    measure('load', lambda: rson.load(io.BytesIO(source)))
+
+@benchmark
+def lazy():
+    ''' Tokenizing on demand vs tokenizing everything up front
+    '''
+    from rson.base import Tokenizer
+    source = make_config(20000)
+    lazyloads = rson.loads.customize(lazy_tokens=True)
+    measure('loads', lambda: rson.loads(source))
+    measure('loads (lazy)', lambda: lazyloads(source))
+
+    eager, ondemand = Tokenizer.factory(), Tokenizer.lazy_factory()
+    measure('first token', lambda: eager(source, None).next())
+    measure('first token (lazy)', lambda: ondemand(source, None).next())
+
+    bad = b'broken: [1, 2}\n' + source
+    def error(func):
+        try:
+            func(bad)
+        except rson.RSONDecodeError:
+            pass
+    measure('early error', lambda: error(rson.loads))
+    measure('early error (lazy)', lambda: error(lazyloads))
+
+@benchmark
+def compact():
+    ''' Token table of arrays vs list of token tuples
+    '''
+    from rson.base import Tokenizer
+    source = ('data: [%s]\n' % ', '.join(str(x) for x in range(200000))).encode('utf-8')
+    compactloads = rson.loads.customize(compact_tokens=True)
+    eager, table = Tokenizer.factory(), Tokenizer.compact_factory()
+    measure('tokenize', lambda: eager(source, None), 1)
+    measure('tokenize (compact)', lambda: table(source, None), 1)
+    measure('loads', lambda: rson.loads(source), 1)
+    measure('loads (compact)', lambda: compactloads(source), 1)
+
+@benchmark
+def load_path():
+    ''' load_path() of a memory-mapped file vs loads() of its contents
+    '''
+    import tempfile
+    source = make_config(20000)
+    fd, path = tempfile.mkstemp()
+    try:
+        os.write(fd, source)
+        os.close(fd)
+        def readloads():
+            f = open(path, 'rb')
+            try:
+                return rson.loads(f.read())
+            finally:
+                f.close()
+        size = len(source) / 1e6
+        best = measure('loads(read())', readloads)
+        print('        %.1f MB/s' % (size / best))
+        best = measure('load_path', lambda: rson.load_path(path))
+        print('        %.1f MB/s' % (size / best))
+    finally:
+        os.remove(path)
+
+@benchmark
+def locations():
+    ''' with_locations=True vs wrapping every scalar to get its location
+    '''
+    source = make_config(20000)
+    measure('loads', lambda: rson.loads(source))
+    measure('loads (user_defined_unquoted)',
+            lambda: rson.loads(source, user_defined_unquoted=True))
+    measure('loads (with_locations)', lambda: rson.loads(source, with_locations=True))
+
+@benchmark
+def json_regions():
+    ''' Bracketed JSON decoded by the stdlib scanner vs token by token
+    '''
+    parts = []
+    for i in range(20):
+        parts.append('section%d:\n    name = part %d\n    data: [%s]\n    index: {%s}\n' % (
+            i, i, ', '.join(str(x * 1.5) for x in range(5000)),
+            ', '.join('"k%d": [%d, true, null]' % (x, x) for x in range(1000))))
+    source = ''.join(parts).encode('utf-8')
+    tokenized = rson.loads.customize(delegate_json=False)
+    measure('loads', lambda: rson.loads(source))
+    measure('loads (delegate_json=False)', lambda: tokenized(source))
+    measure('loads (lazy)', lambda: rson.loads(source, lazy_tokens=True))
+    measure('loads (lazy, delegate_json=False)', lambda: tokenized(source, lazy_tokens=True))
+
+def make_blocks(count, lines, template):
+    ''' A generated document with count large multi-line strings
+    '''
+    body = '\n'.join('        MIIBIjANBgkqhkiG9w0BAQEFAAOCAQ8AMIIBCgKCAQEAu1SU1L%04d' % i
+                     for i in range(lines))
+    return ''.join(template % (i, body) for i in range(count)).encode('utf-8')
+
+@benchmark
+def triple_quoted():
+    ''' Documents with many large triple-quoted strings and "=" blocks
+    '''
+    from rson.base import Tokenizer
+    tokenize = Tokenizer.factory('=')
+    for name, template in (('"""', 'cert%d:\n    pem: """\n%s\n    """\n'),
+                           ('=', 'cert%d:\n    pem =\n%s\n')):
+        source = make_blocks(200, 500, template)
+        measure('tokenize (%s)' % name, lambda: tokenize(source, None))
+        measure('loads (%s)' % name, lambda: rson.loads(source))
+
+@benchmark
+def equals():
+    ''' Large = blocks dedented up front vs on first use
+    '''
+    source = make_blocks(200, 500, 'cert%d:\n    pem =\n%s\n')
+    measure('loads', lambda: rson.loads(source))
+    measure('loads (lazy_equals)', lambda: rson.loads(source, lazy_equals=4096))
+    measure('loads (lazy)', lambda: rson.loads(source, lazy_tokens=True))
+    measure('loads (lazy, lazy_equals)',
+            lambda: rson.loads(source, lazy_tokens=True, lazy_equals=4096))
+    result = rson.loads(source, lazy_equals=4096)
+    measure('first use (lazy_equals)', lambda: [str(x['pem']) for x in result.values()], 1)
+
+@benchmark
+def iterative():
+    ''' Explicit-stack parser vs recursive closures on deep and wide documents
+    '''
+    recursive = rson.loads.customize(delegate_json=False)
+    iterative = rson.loads.customize(delegate_json=False, iterative_parser=True)
+    depth = 150
+    deep = ''.join('k%d: %s1%s\n' % (i, '[' * depth, ']' * depth) for i in range(200))
+    deep += ''.join(' ' * i + 'k:\n' for i in range(depth)) + ' ' * depth + 'v\n'
+    wide = make_config(20000)
+    for name, source in (('deep', deep), ('wide', wide)):
+        measure('loads (%s)' % name, lambda: recursive(source))
+        measure('loads (%s, iterative_parser)' % name, lambda: iterative(source))
+    deeper = '[' * 100000 + ']' * 100000
+    measure('loads (100000 deep, iterative_parser)', lambda: iterative(deeper), 1)
+
+@benchmark
+def select():
+    ''' select= of a few paths vs a full parse followed by a lookup
+    '''
+    source = make_config(20000)
+    paths = ['item10.name', 'item5000.values', 'item19999.flag']
+    def lookup():
+        result = rson.loads(source)
+        return result['item10']['name'], result['item5000']['values'], result['item19999']['flag']
+    measure('loads + lookup', lookup, 1)
+    measure('loads (select)', lambda: rson.loads(source, select=paths), 1)
+    measure('loads (lazy, select)', lambda: rson.loads(source, select=paths, lazy_tokens=True), 1)
+
+@benchmark
+def iterparse():
+    ''' Streaming events or records vs building the result for a file of records
+    '''
+    source = ''.join('{"id": %d, "name": "item %d", "tags": [1, 2, 3]}\n' % (i, i)
+                     for i in range(100000)).encode('utf-8')
+    measure('load', lambda: rson.load(io.BytesIO(source)), 1)
+    measure('iterparse', lambda: sum(1 for x in rson.iterparse(io.BytesIO(source))), 1)
+    measure('iter_items', lambda: sum(1 for x in rson.iter_items(io.BytesIO(source))), 1)
+    measure('iter_items (first 10)',
+            lambda: list(itertools.islice(rson.iter_items(io.BytesIO(source)), 10)))
+
+@benchmark
+def loads_lazy():
+    ''' loads_lazy() and a few lookups vs loads() of the whole document
+    '''
+    source = make_config(20000)
+    def lookup(result):
+        return result['item10']['name'], result['item5000']['values'], result['item19999']['flag']
+    measure('loads + lookup', lambda: lookup(rson.loads(source)), 1)
+    measure('loads_lazy', lambda: rson.loads_lazy(source), 1)
+    measure('loads_lazy + lookup', lambda: lookup(rson.loads_lazy(source)), 1)
+    result = rson.loads_lazy(source)
+    measure('first use of every entry', lambda: [dict(x) for x in result.values()], 1)
+
+@benchmark
+def cache():
+    ''' loads() vs a ParseCache for a few config strings parsed over and over
+    '''
+    sources = [make_config(20 + i) for i in range(10)]
+    def run(func):
+        for i in range(200):
+            for source in sources:
+                func(source)
+    measure('loads', lambda: run(rson.loads), 1)
+    for copy in (True, False):
+        cached = rson.loads.cache(copy=copy)
+        measure('cache (copy=%s)' % copy, lambda: run(cached), 1)
+        stats = cached.stats()
+        print('        %d hits (%.1f us each), %d misses (%.1f us each)' % (
+              stats['hits'], stats['hit_time'] * 1e6 / stats['hits'],
+              stats['misses'], stats['miss_time'] * 1e6 / stats['misses']))
+
+@benchmark
+def reparse():
+    ''' Document.reparse() of a one-line edit vs loads() of the edited document
+    '''
+    source = make_config(12500).decode('utf-8')
+    edited = source.replace('name = thing 6000\n', 'name = thing six thousand\n')
+    document = rson.parse_document(source)
+    measure('loads', lambda: rson.loads(edited), 1)
+    measure('parse_document', lambda: rson.parse_document(edited), 1)
+    measure('reparse', lambda: document.reparse(edited), 1)
+    result = document.reparse(edited).value
+    print('        %d of %d entries reused' % (
+          sum(result[key] is document.value[key] for key in result), len(result)))
+
+@benchmark
+def load_files():
+    ''' load_files() with 1, 2, 4 ... worker processes vs loads() of each file
+    '''
+    import tempfile
+    import shutil
+    import multiprocessing
+    directory = tempfile.mkdtemp()
+    try:
+        paths = []
+        for i in range(1000):
+            paths.append(os.path.join(directory, 'config%d.rson' % i))
+            f = open(paths[-1], 'wb')
+            f.write(make_config(10 + i % 20))
+            f.close()
+        def serial():
+            for path in paths:
+                f = open(path, 'rb')
+                try:
+                    rson.loads(f.read())
+                finally:
+                    f.close()
+        measure('loads', serial, 1)
+        workers = 1
+        while 1:
+            measure('load_files (%d workers)' % workers,
+                    lambda: sum(1 for x in rson.load_files(paths, workers=workers)), 1)
+            if workers >= multiprocessing.cpu_count():
+                break
+            workers = min(workers * 2, multiprocessing.cpu_count())
+    finally:
+        shutil.rmtree(directory)
+
+@benchmark
+def loads_parallel():
+    ''' loads_parallel() with 2, 4 ... worker processes vs loads() of a large document
+    '''
+    import multiprocessing
+    megabytes = float(os.environ.get('RSON_BENCH_MB', 100))
+    source = make_config(int(megabytes * 1e6 / 75))
+    print('        %.1f MB source (set RSON_BENCH_MB to change)' % (len(source) / 1e6))
+    measure('loads', lambda: rson.loads(source), 1, False)
+    workers = 2
+    while 1:
+        measure('loads_parallel (%d workers)' % workers,
+                lambda: rson.loads_parallel(source, workers=workers), 1, False)
+        if workers >= multiprocessing.cpu_count():
+            break
+        workers = min(workers * 2, multiprocessing.cpu_count())
+
+@benchmark
+def aload():
+    ''' aload() while the data arrives vs buffering it all and calling loads()
+    '''
+    import asyncio
+    source = make_config(20000)
+    chunk = 65536
+
+    async def produce(reader, done):
+        # About 64 KB per millisecond
+        for i in range(0, len(source), chunk):
+            reader.feed_data(source[i:i + chunk])
+            await asyncio.sleep(0.001)
+        done.append(time.time())
+        reader.feed_eof()
+
+    async def buffered(reader):
+        return rson.loads(await reader.read())
+
+    def run(consume):
+        async def main():
+            reader = asyncio.StreamReader()
+            done = []
+            task = asyncio.ensure_future(produce(reader, done))
+            result = await consume(reader)
+            await task
+            return time.time() - done[0]
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(main())
+        finally:
+            loop.close()
+
+    for name, consume in (('buffer + loads', buffered),
+                          ('aload', lambda reader: rson.aload(reader, chunk))):
+        latency = []
+        measure(name, lambda: latency.append(run(consume)), 3, False)
+        print('    %-36s %8.3f s' % ('  after the last byte', min(latency)))
+
+@benchmark
+def gc_pauses():
+    ''' Cyclic GC pause time with acyclic_objects and suspend_gc
+    '''
+    import gc
+    source = make_config(20000)
+    pauses = []
+    def callback(phase, info):
+        if phase == 'start':
+            pauses.append(-time.time())
+        else:
+            pauses[-1] += time.time()
+    gc.callbacks.append(callback)
+    try:
+        for name, kw in (('loads', {}),
+                         ('loads (acyclic_objects)', dict(acyclic_objects=True)),
+                         ('loads (suspend_gc)', dict(suspend_gc=True)),
+                         ('loads (both)', dict(acyclic_objects=True, suspend_gc=True))):
+            def run():
+                # Parse twice, keeping one result alive while the
+                # second is parsed, then drop them both
+                first = rson.loads(source, **kw)
+                second = rson.loads(source, **kw)
+                del first, second
+            gc.collect()
+            del pauses[:]
+            measure(name, run, 1)
+            del pauses[:]
+            run()
+            garbage = gc.collect()
+            print('    %-36s %8.3f s in %d pauses, %d left for gc' %
+                  ('  gc', sum(pauses[:-1]), len(pauses) - 1, garbage))
+    finally:
+        gc.callbacks.remove(callback)
+
+@benchmark
+def frozen():
+    ''' A frozen result shared by threads and used as a dict key vs deepcopy and make_hashable
+    '''
+    from copy import deepcopy
+    from rson.base.baseobjects import make_hashable
+    source = make_config(2000)
+    value = rson.loads(source)
+    measure('loads', lambda: rson.loads(source), 1)
+    def copies():
+        value = rson.loads(source)
+        return [deepcopy(value) for i in range(32)]
+    measure('loads + deepcopy for 32 threads', copies, 1)
+    measure('loads (frozen=True), shared', lambda: rson.loads(source, frozen=True), 1)
+    frozen = rson.loads(source, frozen=True)
+    other = rson.loads(source, frozen=True)
+    measure('make_hashable key, 100 lookups',
+            lambda: [{make_hashable(value): 1}.get(make_hashable(value)) for i in range(100)], 1)
+    measure('frozen key, 100 lookups',
+            lambda: [{frozen: 1}.get(other) for i in range(100)], 1)
+
+@benchmark
+def schema():
+    ''' Validating with schema= while parsing vs loads() and then validating
+    '''
+    from rson.base.schema import compile_schema
+    schema = {'type': 'object', 'additionalProperties': {
+        'type': 'object', 'required': ['name', 'values'], 'additionalProperties': False,
+        'properties': {'name': {'type': 'string', 'minLength': 1},
+                       'values': {'type': 'array', 'maxItems': 10,
+                                  'items': {'type': 'integer', 'minimum': 0}},
+                       'flag': {'type': 'boolean'}}}}
+    root = compile_schema(schema)
+
+    def validate(node, value):
+        # A separate pass over the result, with the same checks
+        if node is None:
+            return
+        message = node.check(value)
+        if message:
+            raise ValueError(message)
+        if isinstance(value, dict):
+            for key in node.required:
+                if key not in value:
+                    raise ValueError(key)
+            for key, item in dict.items(value):
+                child = node.properties.get(key, node.additional)
+                if child is False:
+                    raise ValueError(key)
+                validate(child, item)
+        elif isinstance(value, list):
+            for item in value:
+                validate(node.items, item)
+
+    def check_first(func):
+        try:
+            func()
+        except ValueError:
+            pass
+
+    source = make_config(20000)
+    bad = source.replace(b'values: [0, 0, 3]', b'values: [0, -1, 3]', 1)
+    measure('loads', lambda: rson.loads(source))
+    measure('loads + validate', lambda: validate(root, rson.loads(source)))
+    measure('loads (schema=...)', lambda: rson.loads(source, schema=schema))
+    measure('bad first entry: loads + validate',
+            lambda: check_first(lambda: validate(root, rson.loads(bad))))
+    measure('bad first entry: loads (schema=...)',
+            lambda: check_first(lambda: rson.loads(bad, schema=schema)))
+    measure('bad first entry: loads (schema=..., lazy_tokens=True)',
+            lambda: check_first(lambda: rson.loads(bad, schema=schema, lazy_tokens=True)))
+
+@benchmark
+def numeric():
+    ''' Numeric arrays as lists vs numeric_arrays='array', on a
+        million numbers
+    '''
+    import random
+    rows = [[random.random() for i in range(1000)] for j in range(1000)]
+    floats = ('[%s]' % ', '.join(repr(x) for row in rows for x in row)).encode('utf-8')
+    ints = ('[%s]' % ', '.join(str(int(x * 1e6)) for row in rows for x in row)).encode('utf-8')
+    table = ('table: [\n%s\n]\n' % ',\n'.join('    [%s]' % ', '.join(repr(x) for x in row)
+                                                for row in rows)).encode('utf-8')
+    column = ('column:\n%s\n' % '\n'.join('    %d' % (x * 1e6) for x in rows[0] * 100)
+              ).encode('utf-8')
+    arrays = rson.loads.customize(numeric_arrays='array')
+    lazy = rson.loads.customize(lazy_tokens=True)
+    lazy_arrays = rson.loads.customize(numeric_arrays='array', lazy_tokens=True)
+    tokens = rson.loads.customize(delegate_json=False)
+    token_arrays = rson.loads.customize(numeric_arrays='array', delegate_json=False)
+
+    def retained(name, func):
+        # The memory held by the result
+        if tracemalloc is not None:
+            tracemalloc.start()
+            value = func()
+            print('    %-36s %8.1f MB kept' % (name, tracemalloc.get_traced_memory()[0] / 1e6))
+            tracemalloc.stop()
+
+    for name, source in (('floats', floats), ('ints', ints), ('1000x1000 table', table)):
+        measure('%s: loads' % name, lambda: rson.loads(source), 1)
+        measure('%s: loads (numeric_arrays)' % name, lambda: arrays(source), 1)
+        measure('%s: lazy' % name, lambda: lazy(source), 1)
+        measure('%s: lazy (numeric_arrays)' % name, lambda: lazy_arrays(source), 1)
+        measure('%s: no JSON decoder' % name, lambda: tokens(source), 1)
+        measure('%s: no JSON decoder (numeric_arrays)' % name, lambda: token_arrays(source), 1)
+        retained('%s: loads' % name, lambda: rson.loads(source))
+        retained('%s: loads (numeric_arrays)' % name, lambda: arrays(source))
+    measure('100000 indented: loads', lambda: rson.loads(column), 1)
+    measure('100000 indented: loads (numeric_arrays)', lambda: arrays(column), 1)
+
+@benchmark
+def scalars():
+    ''' Scalars read by the stock unquoted parser's shortcuts vs
+        matched against the unquoted pattern
+    '''
+    import random
+    from rson.base import UnquotedToken
+    rows = [[random.random() if i % 2 else random.randint(0, 10 ** 6) for i in range(20)]
+            for j in range(5000)]
+    table = 'table: [\n%s\n]\n' % ',\n'.join('    [%s]' % ', '.join(repr(x) for x in row)
+                                               for row in rows)
+    mixed = '\n'.join('row%d:\n    count: %d\n    ratio: %r\n    name: item %d\n    ok: true'
+                      % (i, i * 7, random.random(), i) for i in range(20000))
+    plain = rson.loads.customize(delegate_json=False)
+    # The same pattern, but not the stock one, so every scalar is
+    # matched by it
+    regex = rson.loads.customize(delegate_json=False,
+                                 unquoted_pattern=UnquotedToken.unquoted_pattern + '\n')
+    for name, source in (('5000x20 table', table), ('20000 dicts', mixed)):
+        measure('%s: shortcuts' % name, lambda: plain(source))
+        measure('%s: unquoted pattern' % name, lambda: regex(source))
+
+def main(names):
+    for func in benchmarks:
+        if names and func.__name__ not in names:
+            continue
+        print('%s: %s' % (func.__name__, func.__doc__.strip()))
+        func()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])